@@ -0,0 +1,200 @@
+# backfill.py
+# Reprocesses the bulletins of a date range, eg. after a parser fix or to load history into a new container.
+# Rows the row hash index already has are skipped; --rewrite-cosmos writes every row of the range to Cosmos DB again (the
+# new container is the one in container_name_cosmos), while the csv still only gets new or changed rows. To copy the
+# documents of an existing container instead of reprocessing the bulletins use migrate_cosmos.py.
+# Progress is checkpointed to a local file as the bulletins are written, so an interrupted backfill resumes where it
+# stopped. The sinks write the rows of many bulletins at a time (--flush-rows), which bounds the memory of long ranges.
+#
+#   python backfill.py 2024-07-01 2024-08-31                          # bulletins on the Harti listing page
+#   python backfill.py 2024-07-01 2024-08-31 --source tracker         # bulletins in the processed pdf tracker
+#   python backfill.py 2022-01-01 2024-12-31 --source data --offline  # local PDFs, local blob store and Cosmos file
+#   python backfill.py 2022-01-01 2024-12-31 --source tracker --rewrite-cosmos  # history into a new container
+import os
+import time
+import asyncio
+import logging
+import argparse
+from datetime import date
+from src.utils.link_utils import get_bulletin_date
+from src.configuration.configuration import (WEB_SOURCE, DOWNLOAD_CONCURRENCY, COSMOS_WRITE_CONCURRENCY,
+                                             PIPELINE_QUEUE_SIZE, SINK_FLUSH_ROWS, BACKFILL_CHECKPOINT_DIR, PAGE_TEXT_ARTIFACTS)
+
+PROGRESS_LOG_INTERVAL = 25 # log throughput every this many bulletins
+
+class BackfillCheckpoint:
+    """Completed bulletin links of a backfill, one per line in a local file that is appended to as bulletins complete"""
+
+    def __init__(self, path):
+        self.path = path
+        self._completed = set()
+        if os.path.exists(path):
+            with open(path, encoding='utf-8') as f:
+                self._completed = {line.strip() for line in f if line.strip()}
+        else:
+            os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+
+    def __contains__(self, pdf_link):
+        return pdf_link in self._completed
+
+    def __len__(self):
+        return len(self._completed)
+
+    def mark_completed(self, pdf_link):
+        with open(self.path, 'a', encoding='utf-8') as f:
+            f.write(pdf_link + '\n')
+        self._completed.add(pdf_link)
+
+def get_checkpoint_path(start_date, end_date):
+    return os.path.join(BACKFILL_CHECKPOINT_DIR, f'backfill_{start_date}_{end_date}.txt')
+
+def in_date_range(pdf_link, start_date, end_date):
+    bulletin_date = get_bulletin_date(pdf_link)
+    return bulletin_date is not None and start_date <= bulletin_date <= end_date
+
+def oldest_first(pdf_links):
+    return sorted(dict.fromkeys(pdf_links), key=get_bulletin_date)
+
+def get_listing_targets(listing_url, start_date, end_date):
+    """Bulletin links on the listing page (scanned in full) with a bulletin date in the range"""
+    from src.pipeline1.text_extractor_all import fetch_pdf_listing
+    pdf_links, _ = fetch_pdf_listing(listing_url, {})
+    return oldest_first(pdf_link for pdf_link in pdf_links if in_date_range(pdf_link, start_date, end_date))
+
+def get_directory_targets(directory, start_date, end_date):
+    """Bulletin PDF files in a local directory with a bulletin date in the range"""
+    pdf_paths = (os.path.abspath(os.path.join(directory, name)) for name in os.listdir(directory) if name.lower().endswith('.pdf'))
+    return oldest_first(pdf_path for pdf_path in pdf_paths if in_date_range(pdf_path, start_date, end_date))
+
+async def run_backfill(start_date, end_date, source='listing', listing_url=WEB_SOURCE, download_workers=DOWNLOAD_CONCURRENCY,
+                       extract_workers=None, write_concurrency=COSMOS_WRITE_CONCURRENCY, queue_size=PIPELINE_QUEUE_SIZE,
+                       flush_rows=SINK_FLUSH_ROWS, checkpoint_path=None, offline=False, rewrite_cosmos=False,
+                       reuse_page_texts=True):
+    """Streams the bulletins of [start_date, end_date] not yet in the checkpoint through the stage pipeline.
+    Returns (completed, failed) bulletin counts of this invocation.
+    """
+    if source not in ('listing', 'tracker') and not offline:
+        # the tracker, csv and Cosmos DB rows of local files must not end up in the production stores
+        raise ValueError(f"A directory source ({source}) is only backfilled offline")
+    import pdfminer.pdfparser
+    from src.connector.blob_store import get_blob_store
+    from src.connector.cosmos_db import CosmosWriter, LocalCosmosContainer
+    from src.connector.pdf_tracker import ProcessedPdfTracker
+    from src.pipeline1.change_detection import RowHashIndex
+    from src.pipeline1.extraction_executor import ExtractionExecutor
+    from src.pipeline1.stages import PdfPipeline, read_pdf_file, get_pdf_file_version
+    from src.pipeline1.text_extractor_all import open_pdf, get_pdf_version
+    from src.utils.heartbeat import HeartbeatEmitter
+
+    blob_store = get_blob_store('local') if offline else get_blob_store()
+    processed_pdfs = ProcessedPdfTracker(blob_store)
+    processed_pdfs.load()
+
+    if source == 'listing':
+        targets = get_listing_targets(listing_url, start_date, end_date)
+    elif source == 'tracker':
+        targets = processed_pdfs.links_between(start_date, end_date)
+    else:
+        targets = get_directory_targets(source, start_date, end_date)
+
+    checkpoint = BackfillCheckpoint(checkpoint_path or get_checkpoint_path(start_date, end_date))
+    remaining = [pdf_link for pdf_link in targets if pdf_link not in checkpoint]
+    logging.info(f"Backfill {start_date} to {end_date}: {len(targets)} bulletins, {len(targets) - len(remaining)} already "
+                 f"completed (checkpoint {checkpoint.path}), {len(remaining)} to process")
+
+    if source in ('listing', 'tracker'):
+        fetch_pdf, fetch_pdf_version = open_pdf, get_pdf_version
+    else:
+        fetch_pdf, fetch_pdf_version = read_pdf_file, get_pdf_file_version
+    row_index = RowHashIndex(blob_store, rewrite_cosmos=rewrite_cosmos)
+    counts = {'completed': 0, 'failed': 0}
+    start = time.perf_counter()
+
+    def log_progress():
+        done = counts['completed'] + counts['failed']
+        if done % PROGRESS_LOG_INTERVAL == 0:
+            elapsed_minutes = (time.perf_counter() - start) / 60
+            logging.info(f"Backfill progress: {done}/{len(remaining)} bulletins ({counts['failed']} failed), "
+                         f"{counts['completed'] / elapsed_minutes:.1f} bulletins/min")
+
+    # Called from the pipeline's blob thread, one bulletin at a time (the tracker is committed once per sink flush)
+    def on_completed(pdf_link):
+        checkpoint.mark_completed(pdf_link)
+        processed_pdfs.add(pdf_link)
+        counts['completed'] += 1
+        log_progress()
+
+    def on_failed(pdf_link, error, stage_name):
+        if isinstance(error, pdfminer.pdfparser.PDFSyntaxError):
+            logging.error(f"PDF Syntax Error{pdf_link}") # broken PDF, retrying won't help
+            on_completed(pdf_link)
+            return
+        counts['failed'] += 1
+        log_progress()
+
+    cosmos_container = LocalCosmosContainer() if offline else None
+    with ExtractionExecutor(workers=extract_workers) as extraction_executor:
+        async with CosmosWriter(container=cosmos_container, max_concurrency=write_concurrency) as cosmos_writer, \
+                HeartbeatEmitter() as heartbeat:
+            pipeline = PdfPipeline(extraction_executor, cosmos_writer, blob_store, row_index, on_completed, on_failed,
+                                   heartbeat=heartbeat, fetch_pdf=fetch_pdf, fetch_pdf_version=fetch_pdf_version,
+                                   download_workers=download_workers, queue_size=queue_size, flush_rows=flush_rows,
+                                   on_flushed=processed_pdfs.commit, page_text_artifacts=PAGE_TEXT_ARTIFACTS,
+                                   reuse_page_texts=reuse_page_texts)
+            try:
+                await pipeline.run(remaining)
+            finally:
+                processed_pdfs.commit()
+            pipeline.log_summary()
+            cosmos_writer.log_summary()
+        extraction_executor.log_probe_summary()
+    row_index.log_summary()
+
+    completed, failed = counts['completed'], counts['failed']
+    elapsed_minutes = (time.perf_counter() - start) / 60
+    throughput = completed / elapsed_minutes if elapsed_minutes else 0.0
+    logging.info(f"Backfill finished: {completed} bulletins completed, {failed} failed (retried by the next invocation) "
+                 f"in {elapsed_minutes * 60:.1f}s, {throughput:.1f} bulletins/min")
+    return completed, failed
+
+def parse_args(args=None):
+    parser = argparse.ArgumentParser(description='Reprocess the Harti bulletins of a date range')
+    parser.add_argument('start_date', type=date.fromisoformat, help='first bulletin date, YYYY-MM-DD')
+    parser.add_argument('end_date', type=date.fromisoformat, help='last bulletin date, YYYY-MM-DD')
+    parser.add_argument('--source', default='listing',
+                        help="'listing' (the Harti listing page), 'tracker' (processed pdf tracker) or a directory of PDFs")
+    parser.add_argument('--listing-url', default=WEB_SOURCE)
+    parser.add_argument('--download-workers', type=int, default=DOWNLOAD_CONCURRENCY)
+    parser.add_argument('--extract-workers', type=int, default=None, help='extraction processes, 0 for serial (default: per CPU)')
+    parser.add_argument('--write-concurrency', type=int, default=COSMOS_WRITE_CONCURRENCY, help='Cosmos DB requests in flight')
+    parser.add_argument('--queue-size', type=int, default=PIPELINE_QUEUE_SIZE, help='bulletins queued between two stages')
+    parser.add_argument('--flush-rows', type=int, default=SINK_FLUSH_ROWS, help='rows buffered by a sink before it writes them')
+    parser.add_argument('--checkpoint', default=None, help='checkpoint file (default: one per date range)')
+    parser.add_argument('--restart', action='store_true', help='ignore the checkpoint and start over')
+    parser.add_argument('--rewrite-cosmos', action='store_true',
+                        help='write all rows to Cosmos DB, also the unchanged ones (eg: to load a new container)')
+    parser.add_argument('--refresh-page-text', action='store_true',
+                        help='extract every bulletin from its PDF again instead of reading its page text artifact')
+    parser.add_argument('--offline', action='store_true',
+                        help='local blob store, local Cosmos DB documents file and no heartbeat; required with a directory source')
+    parsed = parser.parse_args(args)
+    if parsed.source not in ('listing', 'tracker') and not parsed.offline:
+        parser.error(f"--source {parsed.source}: a directory of PDFs is only backfilled with --offline")
+    return parsed
+
+if __name__ == "__main__":
+    args = parse_args()
+    from src import logHandling # logging to stdout
+    if args.offline:
+        from src.utils.log_utils import disable_heartbeat
+        disable_heartbeat()
+
+    checkpoint_path = args.checkpoint or get_checkpoint_path(args.start_date, args.end_date)
+    if args.restart and os.path.exists(checkpoint_path):
+        os.remove(checkpoint_path)
+
+    asyncio.run(run_backfill(args.start_date, args.end_date, source=args.source, listing_url=args.listing_url,
+                             download_workers=args.download_workers, extract_workers=args.extract_workers,
+                             write_concurrency=args.write_concurrency, queue_size=args.queue_size, flush_rows=args.flush_rows,
+                             checkpoint_path=checkpoint_path, offline=args.offline, rewrite_cosmos=args.rewrite_cosmos,
+                             reuse_page_texts=not args.refresh_page_text))
@@ -1,170 +1,173 @@
 # main.py
+# Only light modules are imported here, function_app imports this module when the Functions host starts. The pipeline
+# (pandas, the PDF libraries, the Cosmos DB SDK) is imported once a run has new bulletins to process, so runs that
+# find nothing new never load it (see tests/startup_benchmark.py).
 import asyncio
+import itertools
 import platform
-import os
-import pdfminer
-import pdfminer.pdfparser
 import logging # for use in Azure functions environment (replace all calls to logger object with python logging class)
 from src import logHandling
-from src.logHandling import log_messages
-from src.utils.log_utils import send_log
-from src.connector.blob import upload_to_blob, upload_processed_pdfs, download_processed_pdfs, update_logs
-from src.connector.cosmos_db import write_harti_data_to_cosmosdb
-from src.configuration.configuration import metadata_line1
-from src.pipeline1.lists_to_dataframe import create_dataframe
-from src.pipeline1.data_transformer import transform_dataframe
-from src.pipeline1.text_to_lists import parse_text, get_patterns
-from src.pipeline1.metadata_reader import find_line_with_metadata
-from src.pipeline1.data_format_converter import dataframe_to_csv_string, convert_dataframe_to_cosmos_format
-from src.pipeline1.text_extractor_all import download_pdf_as_bytes, extract_text_from_first_page, get_all_pdf_links
-# from azure.storage.blob import BlobServiceClient
-from dotenv import load_dotenv, find_dotenv
-load_dotenv(find_dotenv()) # read local .env file
-from src.configuration.configuration import WEB_SOURCE
-
-container_name = os.getenv('container_name_blob')
-az_blob_conn_str = os.getenv('connect_str')
-
-def load_processed_pdfs(status_file_string: str):
-    """Expects a string consisting of pdf_link lines, returns it as a set
-    """
-    mySet = set()
-    status_file_lines = status_file_string.rsplit('\n')
-    for line in status_file_lines:
-        line = line.strip()
-        mySet.add(line)
-    return mySet
-
-async def process_pdf(pdf_link):
-    try:
-        logging.info(f"Processing PDF link: {pdf_link}")
-        pdf_bytes = download_pdf_as_bytes(pdf_link)
-        extracted_text = extract_text_from_first_page(pdf_bytes)
-
-        # Extracted text is split into lines
-        extracted_lines = extracted_text.split('\n')
-
-        # Check if metadata line exists
-        if find_line_with_metadata(extracted_lines, metadata_line1):
-            
-            logging.info(">>>> Metadata line found. Proceeding with data processing... <<<<")
-            
-            # Get patterns
-            possible_category_patterns, item_pattern = get_patterns()
-
-            # Parse text to lists
-            dates, categories, items, pettah_price_ranges, pettah_averages = parse_text(extracted_lines, possible_category_patterns, item_pattern)
-
-            # Convert lists to DataFrame
-            list_to_dataframe = create_dataframe(dates, categories, items, pettah_price_ranges, pettah_averages)
-
-            # Transform DataFrame
-            transformed_dataframe = transform_dataframe(list_to_dataframe)
-
-            logging.info(">>>> Data transformation completed <<<<")
-
-            # Convert DataFrame to CSV string
-            csv_data, actual_date_str = dataframe_to_csv_string(transformed_dataframe)
-
-            # Upload CSV data to blob
-            upload_to_blob(csv_data, actual_date_str)
-            logging.info(">>>> CSV data uploaded to blob storage <<<<")
-
-            # Convert DataFrame to Cosmos DB format
-            cosmos_db_data = convert_dataframe_to_cosmos_format(transformed_dataframe)
-
-            # Write Cosmos DB data
-            await write_harti_data_to_cosmosdb(cosmos_db_data)
-            logging.info(">>>> Completion of data ingestion to CosmosDB <<<<")
-
-            # Send success log
-            send_log(
-                service_type="Azure Functions",
-                application_name="Harti Food Price Collector Page 1",
-                project_name="Harti Food Price Prediction",
-                project_sub_name="Food Price History",
-                azure_hosting_name="AI Services",
-                developmental_language="Python",
-                description="Sri Lanka Food Prices - Azure Functions",
-                created_by="BrownsAIsevice",
-                log_print="Successfully completed data ingestion to Cosmos DB.",
-                running_within_minutes=1440,
-                error_id=0
-                )
-            logging.info("Sent success log to function monitoring service.")
-
-
-        else:
-            logging.warning("Metadata line not found. Skipping this PDF.")
-
-    except Exception as e:
-        logging.error(f"Error processing PDF {pdf_link}: {e}")
-
-        # Send error log
-        send_log(
-            service_type="Azure Functions",
-            application_name="Harti Food Price Collector Page 1",
-            project_name="Harti Food Price Prediction",
-            project_sub_name="Food Price History",
-            azure_hosting_name="AI Services",
-            developmental_language="Python",
-            description="Sri Lanka Food Prices - Azure Functions",
-            created_by="BrownsAIsevice",
-            log_print="An error occurred: " + str(e),
-            running_within_minutes=1440,
-            error_id=1,
-            )
-        logging.error("Sent error log to function monitoring service.")
-        raise
+from src.logHandling import log_shipper
+from src.configuration.configuration import WEB_SOURCE, LOG_FILE_EXTENSION
+from src.utils.instrumentation import run_metrics
 
 async def main():
+    """Returns False when the run found no new work (nothing was written, so there is nothing worth logging to blob)"""
     try:
         logging.info(">>>> Starting the data extraction process <<<<")
 
-        # Get list of all available pdf links from Harti website
-        pdf_links = get_all_pdf_links(WEB_SOURCE) 
-
-        if not pdf_links:
+        # Conditionally fetch the listing page of the Harti website. An unchanged page (304) means there is nothing to do.
+        from src.connector.blob_store import get_blob_store
+        from src.connector.blob import download_listing_state, upload_listing_state
+        from src.pipeline1.text_extractor_all import fetch_pdf_listing, take_new_pdf_links
+        blob_store = get_blob_store()
+        with run_metrics.span('listing fetch'):
+            listing_state = download_listing_state(blob_store)
+            listing = fetch_pdf_listing(WEB_SOURCE, listing_state)
+        if listing is None:
+            logging.info("Listing page not modified since the last run. Nothing to do.")
+            return False
+        pdf_links, new_listing_state = listing
+
+        # For servers without validators: the listing is newest first, so an unchanged newest link means nothing new
+        newest_pdf_link = next(pdf_links, None)
+        if newest_pdf_link is None:
             logging.warning("No PDF links found.")
-            return
-        
-        # Load already processed PDFs
-        status_file_string = download_processed_pdfs()
-        processed_pdfs = load_processed_pdfs(status_file_string)
-
-        # Loop through each PDF link and process it. After processing, add the link to the set of processed pdf links.
-        for pdf_link in pdf_links:
-            if pdf_link not in processed_pdfs:
-                logging.info(f"New PDF link: {pdf_link}")
-                try:
-                    await process_pdf(pdf_link)   
-                except pdfminer.pdfparser.PDFSyntaxError:
-                    logging.error(f"PDF Syntax Error{pdf_link}")
-                processed_pdfs.add(pdf_link)             
+            return True
+        new_listing_state['newest_pdf_link'] = newest_pdf_link
+        if newest_pdf_link == listing_state.get('newest_pdf_link'):
+            logging.info("Newest PDF link unchanged since the last run. Nothing to do.")
+            upload_listing_state(blob_store, new_listing_state)
+            return False
+
+        # Already processed PDFs are looked up in the tracker shards of their months, loaded on first use.
+        # Scanning the listing stops once it is well into already processed links.
+        with run_metrics.span('listing scan'):
+            from src.connector.pdf_tracker import ProcessedPdfTracker
+            from src.connector.failure_registry import FailureRegistry, is_permanent_error
+            processed_pdfs = ProcessedPdfTracker(blob_store)
+            processed_pdfs.load()
+            new_pdf_links = take_new_pdf_links(itertools.chain([newest_pdf_link], pdf_links), processed_pdfs)
+
+            # Links that failed before wait for their retry time (exponential backoff); permanently broken ones are skipped.
+            # A failed link is retried from the registry, whether or not the scan still reaches it on the listing.
+            failures = FailureRegistry(blob_store).load()
+            retry_links = [pdf_link for pdf_link in failures.pending_retries()
+                           if pdf_link not in new_pdf_links and pdf_link not in processed_pdfs]
+            candidate_links = new_pdf_links + retry_links
+            pdf_links_to_process = [pdf_link for pdf_link in candidate_links if not failures.should_skip(pdf_link)]
+        run_metrics.count('pdf_links_new', len(new_pdf_links))
+        run_metrics.count('pdf_links_to_process', len(pdf_links_to_process))
+        if len(pdf_links_to_process) < len(candidate_links):
+            logging.info(f"Skipping {len(candidate_links) - len(pdf_links_to_process)} failed PDF links until their retry is due")
+
+        def is_listing_done():
+            # The listing page is only remembered once every new link made it into the tracker (or was given up on) and
+            # no failed link waits for a retry. Otherwise the next run has to get past an unchanged listing to retry them.
+            return (all(pdf_link in processed_pdfs or failures.is_permanent(pdf_link) for pdf_link in new_pdf_links)
+                    and not failures.pending_retries())
+
+        if not pdf_links_to_process:
+            logging.info("No new PDF links to process. Nothing to do.")
+            if is_listing_done():
+                upload_listing_state(blob_store, new_listing_state)
+            return False
+
+        # There is work to do: from here on the log of the run is shipped to its log blob while the run goes on
+        start_log_shipping(blob_store)
+        with run_metrics.span('pipeline imports'):
+            import pdfminer.pdfparser
+            from src.connector.cosmos_db import CosmosWriter
+            from src.pipeline1.change_detection import RowHashIndex
+            from src.pipeline1.extraction_executor import ExtractionExecutor
+            from src.pipeline1.stages import PdfPipeline
+            from src.utils.heartbeat import HeartbeatEmitter
+
+        def on_completed(pdf_link):
+            processed_pdfs.add(pdf_link)
+            failures.record_success(pdf_link)
+
+        def on_failed(pdf_link, error, stage_name):
+            if isinstance(error, pdfminer.pdfparser.PDFSyntaxError):
+                logging.error(f"PDF Syntax Error{pdf_link}")
+                on_completed(pdf_link) # broken PDF, retrying won't help
             else:
-                logging.info(f"Skipping already processed PDF link: {pdf_link}")
-        
+                failures.record_failure(pdf_link, error, permanent=stage_name == 'download' and is_permanent_error(error))
+
+        # The new PDFs stream through the stage pipeline (download -> extract -> transform -> csv sink -> Cosmos DB sink),
+        # see src/pipeline1/stages.py. Text extraction runs in the extraction executor's process pool.
+        # The sinks write the rows of many PDFs at a time (per month / partition key), and the PDFs of each such flush are
+        # committed to the tracker together right after it; failed downloads and failed PDFs go to the failure registry
+        # and are retried by a later run.
+        # The Cosmos DB container and the blob store are created once and shared by all PDFs of the run.
+        # The row hash index skips the rows of a bulletin that were already written with the same prices.
+        row_index = RowHashIndex(blob_store)
+        try:
+            with ExtractionExecutor() as extraction_executor:
+                async with CosmosWriter() as cosmos_writer, HeartbeatEmitter() as heartbeat:
+                    pipeline = PdfPipeline(extraction_executor, cosmos_writer, blob_store, row_index, on_completed, on_failed,
+                                           heartbeat=heartbeat, on_flushed=processed_pdfs.commit)
+                    with run_metrics.span('pipeline'):
+                        await pipeline.run(pdf_links_to_process)
+                    pipeline.log_summary()
+                    cosmos_writer.log_summary()
+                    run_metrics.add_section('pipeline', pipeline.get_summary())
+                    run_metrics.add_section('cosmos', cosmos_writer.get_summary())
+                run_metrics.add_section('heartbeat', heartbeat.get_summary())
+                extraction_executor.log_probe_summary()
+                run_metrics.add_section('extraction', extraction_executor.get_summary())
+            row_index.log_summary()
+            run_metrics.add_section('change_detection', row_index.get_summary())
+        finally:
+            with run_metrics.span('state commit'):
+                processed_pdfs.commit()
+                failures.save()
+
         logging.info(">>>> Data extraction process completed <<<<")
+        logging.info(f">>>> {len(failures.pending_retries())} failed PDF links waiting for a retry <<<<")
+        run_metrics.count('pdf_links_pending_retry', len(failures.pending_retries()))
 
-        # update processed pdf tracker file in blob
-        processed_pdfs_string = ''
-        for link in processed_pdfs:
-            processed_pdfs_string += link
-            processed_pdfs_string += '\n'
-        upload_processed_pdfs(processed_pdfs_string)
-        logging.info(">>>> Processed PDF Tracker uploaded to blob <<<<")
+        if is_listing_done():
+            upload_listing_state(blob_store, new_listing_state)
+        logging.info(f"Blob store: {blob_store.bytes_uploaded} bytes uploaded, {blob_store.bytes_downloaded} bytes downloaded")
+        run_metrics.add_section('blob_store', {'bytes_uploaded': blob_store.bytes_uploaded,
+                                               'bytes_downloaded': blob_store.bytes_downloaded})
 
     except Exception as e:
         logging.error(f"Error in main execution: {e}")
- 
+        run_metrics.count('run_errors')
+    finally:
+        # async blob clients belong to this event loop, they are closed before it ends (the sync ones in run_main)
+        from src.connector.blob_connector import get_blob_connector
+        await get_blob_connector().aclose()
+    return True
+
+def start_log_shipping(blob_store):
+    from src.connector.blob import get_log_file_base_name
+    if log_shipper.blob_store is None:
+        log_shipper.start(blob_store, get_log_file_base_name() + '.' + LOG_FILE_EXTENSION)
+
 def run_main():
+    log_shipper.reset() # drop what a previous invocation of a warm host left behind
+    run_metrics.reset()
     logging.info('started run_main()')
     if platform.system() == "Windows":
         asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())
-    asyncio.run(main())
+    try:
+        new_work = asyncio.run(main())
+        if not new_work:
+            log_shipper.reset() # no-op run, skip the log upload
+            return
 
-    try: update_logs(log_messages)
-    except Exception as e: logging.ERROR(f'Exception when updating logs: {e}')
+        try:
+            from src.connector.blob_store import get_blob_store
+            from src.connector.blob import update_logs
+            start_log_shipping(get_blob_store()) # when the run ended before it had work to log
+            update_logs(log_shipper, run_metrics.to_json())
+        except Exception as e: logging.error(f'Exception when updating logs: {e}')
+    finally:
+        from src.connector.blob_connector import close_blob_connector
+        close_blob_connector() # the blob connections of the run (shared by all blob requests) are closed with it
 
 
 # run_main() # only for local testing
\ No newline at end of file
@@ -0,0 +1,167 @@
+# migrate_cosmos.py
+# Copies the documents of a Cosmos DB container into a new container partitioned on /pk (created with the indexing
+# policy of src/connector/cosmos_db.py), adding the "pk" field of the partition scheme. Documents get the deterministic
+# id the pipeline gives their row (the earlier code used random ids), so later re-runs upsert them instead of adding
+# a second document per row; of several source documents of the same row only the newest is kept.
+# Reads page by page while the previous page is written with up to --concurrency requests in flight (transactional
+# batches per partition key).
+# The continuation token of the last written page is checkpointed to a local file, so an interrupted migration resumes,
+# along with the ids written so far and the _ts of their source documents, so a resumed migration still keeps the newest
+# document of each row.
+#
+#   python migrate_cosmos.py harti-prices harti-prices-by-item --scheme item
+#   python migrate_cosmos.py data/cosmos/documents.jsonl data/cosmos/by_item.jsonl --offline  # local documents files
+import os
+import json
+import time
+import asyncio
+import logging
+import argparse
+from src.configuration.configuration import (COSMOS_PARTITION_SCHEME, COSMOS_PARTITION_SCHEMES, COSMOS_PARTITION_KEY_PATH,
+                                             COSMOS_WRITE_CONCURRENCY)
+
+MIGRATION_PAGE_SIZE = 1000 # documents read per request from the source container
+SYSTEM_PROPERTIES = ('_rid', '_self', '_etag', '_attachments', '_ts')
+
+def migrate_document(document, partition_scheme):
+    """The document without the system properties of the source container, with the id the pipeline gives its row
+    (get_document_id) and the pk field of partition_scheme
+    """
+    from src.pipeline1.data_format_converter import get_document_id, get_partition_key_value
+    migrated = {key: value for key, value in document.items() if key not in SYSTEM_PROPERTIES}
+    migrated['id'] = get_document_id(document['date'], document.get('category'), document['item'], document['page'])
+    migrated['pk'] = get_partition_key_value(document['date'], document.get('category'), document['item'], partition_scheme)
+    return migrated
+
+def migrate_page(documents, partition_scheme, migrated_ids):
+    """The migrated documents of a page, one per id. Of the source documents of the same row (same migrated id) the
+    newest (by _ts, the first one without) read so far is written, the others are dropped. migrated_ids maps the ids
+    written so far to the _ts of their source document and is updated.
+    """
+    page = {}
+    for document in documents:
+        migrated = migrate_document(document, partition_scheme)
+        timestamp = document.get('_ts', 0)
+        newest = page[migrated['id']][0] if migrated['id'] in page else migrated_ids.get(migrated['id'])
+        if newest is None or timestamp > newest:
+            page[migrated['id']] = (timestamp, migrated)
+    migrated_ids.update((document_id, timestamp) for document_id, (timestamp, _) in page.items())
+    return [migrated for _, migrated in page.values()]
+
+class MigrationCheckpoint:
+    """Continuation token of the source read after the last page written, the documents read up to it and the ids
+    written with the _ts of their source document ({id: _ts}, see migrate_page)
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.continuation_token = None
+        self.documents = 0
+        self.migrated_ids = {}
+        if path and os.path.exists(path):
+            with open(path, encoding='utf-8') as f:
+                state = json.load(f)
+            self.continuation_token, self.documents = state['continuation_token'], state['documents']
+            self.migrated_ids = state.get('migrated_ids', {})
+
+    def save(self, continuation_token, documents, migrated_ids):
+        """Records a written page: the continuation token after it, its number of documents and its {id: _ts}"""
+        self.continuation_token, self.documents = continuation_token, self.documents + documents
+        self.migrated_ids.update(migrated_ids)
+        if self.path:
+            with open(self.path, 'w', encoding='utf-8') as f:
+                json.dump({'continuation_token': continuation_token, 'documents': self.documents,
+                           'migrated_ids': self.migrated_ids}, f)
+
+async def iter_container_pages(container, page_size=MIGRATION_PAGE_SIZE, continuation_token=None):
+    """Yields (documents, continuation token after them) for all documents of a Cosmos DB container"""
+    pages = container.read_all_items(max_item_count=page_size).by_page(continuation_token)
+    async for page in pages:
+        yield [document async for document in page], pages.continuation_token
+
+async def iter_local_pages(cosmos_container, page_size=MIGRATION_PAGE_SIZE, continuation_token=None):
+    """iter_container_pages for a LocalCosmosContainer; the continuation token is the number of documents read"""
+    documents = list(cosmos_container.read_documents().values())
+    start = int(continuation_token or 0)
+    for i in range(start, len(documents), page_size):
+        yield documents[i:i + page_size], str(min(i + page_size, len(documents)))
+
+async def migrate(pages, cosmos_writer, partition_scheme=COSMOS_PARTITION_SCHEME, checkpoint=None):
+    """Writes the documents of pages (see iter_container_pages) with cosmos_writer. The next page is read while the
+    previous one is written. Returns the number of documents written (see migrate_page for the duplicates of a row).
+    """
+    checkpoint = checkpoint or MigrationCheckpoint(None)
+    # ids of the pages read, ahead of the checkpoint by the page being written: a resumed migration starts from the ids
+    # of the pages written
+    migrated_ids = dict(checkpoint.migrated_ids)
+    written = 0
+    pending_write = None
+
+    async def write_page(migrated_documents, page_ids, continuation_token, read):
+        await cosmos_writer.write(migrated_documents)
+        checkpoint.save(continuation_token, read, page_ids)
+        logging.info(f"Migrated {checkpoint.documents} documents")
+
+    try:
+        async for documents, continuation_token in pages:
+            migrated_documents = migrate_page(documents, partition_scheme, migrated_ids)
+            page_ids = {document['id']: migrated_ids[document['id']] for document in migrated_documents}
+            if pending_write is not None:
+                await pending_write
+            pending_write = asyncio.ensure_future(write_page(migrated_documents, page_ids, continuation_token,
+                                                             len(documents)))
+            written += len(migrated_documents)
+        if pending_write is not None:
+            await pending_write
+    except BaseException:
+        if pending_write is not None:
+            pending_write.cancel()
+        raise
+    if len(checkpoint.migrated_ids) < checkpoint.documents:
+        logging.info(f"{checkpoint.documents - len(checkpoint.migrated_ids)} of {checkpoint.documents} documents were "
+                     f"duplicates of a document of the same row, the newest of each row was kept")
+    return written
+
+async def run_migration(source, target, partition_scheme=COSMOS_PARTITION_SCHEME, concurrency=COSMOS_WRITE_CONCURRENCY,
+                        page_size=MIGRATION_PAGE_SIZE, checkpoint_path=None, offline=False):
+    from src.connector.cosmos_db import CosmosWriter, LocalCosmosContainer
+    checkpoint = MigrationCheckpoint(checkpoint_path)
+    start = time.perf_counter()
+    if offline:
+        pages = iter_local_pages(LocalCosmosContainer(source), page_size, checkpoint.continuation_token)
+        async with CosmosWriter(container=LocalCosmosContainer(target), max_concurrency=concurrency) as cosmos_writer:
+            written = await migrate(pages, cosmos_writer, partition_scheme, checkpoint)
+    else:
+        from azure.cosmos.aio import CosmosClient
+        from src.connector.cosmos_db import endpoint, key, database_name, get_or_create_database, get_or_create_container
+        async with CosmosClient(endpoint, credential=key) as client:
+            database = await get_or_create_database(client, database_name)
+            target_container, partition_key_path = await get_or_create_container(database, target)
+            if partition_key_path != COSMOS_PARTITION_KEY_PATH:
+                raise ValueError(f"Target container '{target}' is partitioned on {partition_key_path}, "
+                                 f"expected {COSMOS_PARTITION_KEY_PATH}")
+            pages = iter_container_pages(database.get_container_client(source), page_size, checkpoint.continuation_token)
+            async with CosmosWriter(container=target_container, max_concurrency=concurrency) as cosmos_writer:
+                written = await migrate(pages, cosmos_writer, partition_scheme, checkpoint)
+    cosmos_writer.log_summary()
+    logging.info(f"Migration finished: {written} documents copied from {source} to {target} "
+                 f"({partition_scheme} partitions) in {time.perf_counter() - start:.1f}s")
+    return written
+
+def parse_args(args=None):
+    parser = argparse.ArgumentParser(description='Copy the Cosmos DB documents into a container partitioned on /pk')
+    parser.add_argument('source', help='source container (a documents file with --offline)')
+    parser.add_argument('target', help='target container, created if missing (a documents file with --offline)')
+    parser.add_argument('--scheme', default=COSMOS_PARTITION_SCHEME, choices=[scheme for scheme in COSMOS_PARTITION_SCHEMES
+                                                                              if scheme != 'none'])
+    parser.add_argument('--concurrency', type=int, default=COSMOS_WRITE_CONCURRENCY, help='Cosmos DB requests in flight')
+    parser.add_argument('--page-size', type=int, default=MIGRATION_PAGE_SIZE, help='documents read per request')
+    parser.add_argument('--checkpoint', default=None, help='checkpoint file (default: none, start over)')
+    parser.add_argument('--offline', action='store_true', help='source and target are local documents files')
+    return parser.parse_args(args)
+
+if __name__ == "__main__":
+    args = parse_args()
+    from src import logHandling # logging to stdout
+    asyncio.run(run_migration(args.source, args.target, partition_scheme=args.scheme, concurrency=args.concurrency,
+                              page_size=args.page_size, checkpoint_path=args.checkpoint, offline=args.offline))
@@ -0,0 +1,121 @@
+# profile_bulletin.py
+# Runs the stages of the pipeline for a single bulletin inline in this process, against a throwaway local blob store
+# and Cosmos DB documents file, and prints the timed spans of the run. Nothing is written to Azure.
+#
+#   python profile_bulletin.py data/daily_21-08-2024.pdf                # spans only
+#   python profile_bulletin.py <pdf url> --cprofile bulletin.prof       # + cProfile, top functions by cumulative time
+#   python profile_bulletin.py data/daily_21-08-2024.pdf --tracemalloc  # + peak traced memory of each stage
+import os
+import asyncio
+import tempfile
+import argparse
+import contextlib
+from src.utils.instrumentation import run_metrics
+
+def fetch_bulletin(pdf_source):
+    from src.pipeline1.stages import read_pdf_file
+    from src.pipeline1.text_extractor_all import download_pdf_as_bytes
+    return read_pdf_file(pdf_source) if os.path.exists(pdf_source) else download_pdf_as_bytes(pdf_source)
+
+def process_bulletin(pdf_source, work_dir, stage):
+    """The work of PdfPipeline for one bulletin, stage by stage in the calling thread so profilers see all of it.
+    stage(name) is a context manager wrapped around each stage.
+    """
+    from src.configuration.configuration import metadata_line1
+    from src.connector.blob import upload_to_blob
+    from src.connector.blob_store import LocalBlobStore
+    from src.connector.cosmos_db import CosmosWriter, LocalCosmosContainer
+    from src.pipeline1.change_detection import RowHashIndex
+    from src.pipeline1.price_batch import parse_price_batch
+    from src.pipeline1.extraction_executor import probe_and_extract_first_page_text
+    from src.pipeline1.data_format_converter import dataframe_to_csv_string, iter_cosmos_documents
+
+    blob_store = LocalBlobStore(os.path.join(work_dir, 'blob'))
+    row_index = RowHashIndex(blob_store)
+
+    with stage('download'):
+        pdf_bytes = fetch_bulletin(pdf_source)
+    run_metrics.count('bytes_downloaded', pdf_bytes.getbuffer().nbytes)
+
+    with stage('extract'):
+        first_page_text, _, _, _ = probe_and_extract_first_page_text(pdf_bytes.getvalue(), metadata_line1)
+    if first_page_text is None:
+        print(f"{pdf_source} is not a price bulletin (metadata line not found)")
+        return
+
+    with stage('transform'):
+        price_batch = parse_price_batch(first_page_text.split('\n'))
+        transformed_dataframe = price_batch.to_dataframe()
+        actual_date_str = price_batch.date.strftime('%y-%m-%d')
+    run_metrics.count('rows_parsed', len(transformed_dataframe))
+
+    with stage('csv sink'):
+        csv_dataframe, cosmos_dataframe, claim = row_index.select_changed_rows(transformed_dataframe, actual_date_str)
+        csv_data, _ = dataframe_to_csv_string(csv_dataframe)
+        run_metrics.count('csv_bytes_appended', upload_to_blob(csv_data, actual_date_str, blob_store))
+        row_index.record_csv(claim)
+
+    async def write_documents():
+        async with CosmosWriter(container=LocalCosmosContainer(os.path.join(work_dir, 'cosmos.jsonl'))) as cosmos_writer:
+            await cosmos_writer.write(iter_cosmos_documents(cosmos_dataframe))
+        return cosmos_writer.get_summary()
+
+    with stage('cosmos sink'):
+        run_metrics.add_section('cosmos', asyncio.run(write_documents()))
+        row_index.record(claim)
+    run_metrics.count('cosmos_documents_written', len(cosmos_dataframe))
+
+def profile_bulletin(pdf_source, cprofile_path=None, trace_memory=False, top=25):
+    """Processes pdf_source once and prints its run summary, plus the cProfile statistics and/or memory peaks"""
+    import cProfile
+    import pstats
+    import tracemalloc
+
+    run_metrics.reset()
+    memory_peaks = {}
+
+    @contextlib.contextmanager
+    def stage(name):
+        if trace_memory:
+            tracemalloc.reset_peak()
+            memory_before = tracemalloc.get_traced_memory()[0]
+        with run_metrics.span(f'stage {name}'):
+            yield
+        if trace_memory:
+            memory_peaks[name] = tracemalloc.get_traced_memory()[1] - memory_before
+
+    profiler = cProfile.Profile() if cprofile_path else None
+    if trace_memory:
+        tracemalloc.start()
+    with tempfile.TemporaryDirectory() as work_dir:
+        if profiler is not None:
+            profiler.enable()
+        try:
+            process_bulletin(pdf_source, work_dir, stage)
+        finally:
+            if profiler is not None:
+                profiler.disable()
+            if trace_memory:
+                tracemalloc.stop()
+
+    print(run_metrics.to_json())
+    if memory_peaks:
+        print("Peak traced memory per stage (above the memory in use when it started):")
+        for name, peak in memory_peaks.items():
+            print(f"  {name:<12} {peak / 1024:10.1f} KiB")
+    if profiler is not None:
+        profiler.dump_stats(cprofile_path)
+        print(f"cProfile statistics written to {cprofile_path}")
+        pstats.Stats(profiler).sort_stats('cumulative').print_stats(top)
+
+def parse_args(args=None):
+    parser = argparse.ArgumentParser(description='Profile the processing of a single Harti bulletin')
+    parser.add_argument('pdf_source', help='path or url of the bulletin PDF')
+    parser.add_argument('--cprofile', metavar='PATH', default=None, help='profile with cProfile, statistics written to PATH')
+    parser.add_argument('--tracemalloc', action='store_true', help='trace memory allocations, report the peak per stage')
+    parser.add_argument('--top', type=int, default=25, help='number of functions in the cProfile report')
+    return parser.parse_args(args)
+
+if __name__ == "__main__":
+    args = parse_args()
+    profile_bulletin(args.pdf_source, cprofile_path=args.cprofile, trace_memory=args.tracemalloc, top=args.top)
@@ -1,17 +1,41 @@
 # src/configuration/configuration.py
 
 import os
+import tempfile
+from dotenv import load_dotenv, find_dotenv
+
+# Settings are read from the environment once, when this module is first imported. A local .env file is loaded first
+# (variables already set in the environment, eg: the Azure Functions app settings, take precedence over it).
+load_dotenv(find_dotenv()) # read local .env file (searched for from this directory up)
+
+# Connections, from the app settings (or .env)
+connect_str = os.getenv('connect_str') # Azure Blob storage connection string
+container_name_blob = os.getenv('container_name_blob')
+endpoint = os.getenv('endpoint') # Cosmos DB account
+key = os.getenv('key')
+database_name = os.getenv('database_name')
+container_name_cosmos = os.getenv('container_name_cosmos')
+WEBSITE_SKU = os.getenv('WEBSITE_SKU') # set by Azure Functions, 'Dynamic' on the consumption plan
 
 # PDF data saving path
 pdf_output_directory = os.path.join('data', 'pdf')
 
 # CSV data saving path
 CSV_DIR = os.path.join('data', 'csv')
-STATUS_FILE = 'processed_pdfs.txt'
+STATUS_FILE = 'processed_pdfs.txt' # legacy single file tracker, migrated into TRACKER_PREFIX shards on first run
+TRACKER_PREFIX = 'processed_pdfs/' # processed pdf links are stored per bulletin month, eg: processed_pdfs/2024-08.txt
 WEB_SOURCE = 'https://www.harti.gov.lk/index.php/en/market-information/data-food-commodities-bulletin'
+LISTING_STATE_FILE = 'listing_state.json' # ETag/Last-Modified and newest pdf link of WEB_SOURCE as of the last completed run
+LISTING_STOP_AFTER_KNOWN = 20 # the listing is newest first, stop scanning after this many already processed links in a row
 
 LOG_FILE_NAME = 'log'
 LOG_FILE_EXTENSION = 'txt'
+RUN_SUMMARY_EXTENSION = 'json' # run instrumentation summary uploaded next to each log file, eg: log2024821103015.json
+# The log of a run is shipped to its log blob (an append blob) in chunks while the run goes on, see src/logHandling.py
+LOG_BUFFER_MAX_RECORDS = int(os.getenv('LOG_BUFFER_MAX_RECORDS', 10000)) # records waiting for upload, the oldest are dropped beyond this
+LOG_FLUSH_INTERVAL_SECONDS = float(os.getenv('LOG_FLUSH_INTERVAL_SECONDS', 30)) # ship the buffered records at least this often
+LOG_FLUSH_BYTES = 256 * 1024 # ship right away once this much is buffered
+LOG_UPLOAD_CHUNK_BYTES = 1024 * 1024 # largest single append to the log blob (Azure accepts up to 4 MiB per append)
 NUMBER_OF_LOG_FILES_TO_KEEP = 10
 
 # Proxy server 
@@ -36,3 +60,98 @@ date_col = 'Date'
 metadata_line1 = '(Wholesale Prices of Rice & Subsidiary Food Crops)'
 
 
+# PDF download stage
+DOWNLOAD_CONCURRENCY = int(os.getenv('DOWNLOAD_CONCURRENCY', 8)) # max number of PDFs downloaded at the same time
+DOWNLOAD_TIMEOUT = float(os.getenv('DOWNLOAD_TIMEOUT', 30)) # seconds, applied per request (connect and read)
+# Read PDFs through HTTP Range requests (src/connector/range_reader.py) instead of downloading them whole: only the
+# blocks the first page extraction reads are transferred. PDFs read this way are not stored in the PDF cache.
+PDF_RANGE_READS = os.getenv('PDF_RANGE_READS', '0') == '1'
+RANGE_READ_BLOCK_SIZE = int(os.getenv('RANGE_READ_BLOCK_SIZE', 64 * 1024)) # bytes fetched (and cached) per block
+
+# Local PDF cache. Published bulletins never change, so cached PDFs are served without contacting the server
+# unless PDF_CACHE_REVALIDATE is set, in which case a conditional request (ETag/Last-Modified) is made.
+# Off by default on the Azure Functions consumption plan (WEBSITE_SKU=Dynamic): its temp storage is about the size of the
+# cache and a timer run downloads each new bulletin once, so the cache would hardly ever be hit there.
+PDF_CACHE_DIR = os.getenv('PDF_CACHE_DIR', '' if WEBSITE_SKU == 'Dynamic' else
+                          os.path.join(tempfile.gettempdir(), 'harti_pdf_cache')) # empty disables the cache
+PDF_CACHE_MAX_BYTES = int(os.getenv('PDF_CACHE_MAX_MB', 500)) * 1024 * 1024 # least recently used PDFs are evicted above this
+PDF_CACHE_REVALIDATE = os.getenv('PDF_CACHE_REVALIDATE', '').lower() in ('1', 'true', 'yes')
+
+# PDF text extraction stage
+# Number of worker processes used for pdfplumber extraction. Unset uses one per CPU core; 0 runs extraction serially in the
+# calling process, which is the default on the Azure Functions consumption plan (WEBSITE_SKU=Dynamic).
+EXTRACTION_WORKERS = os.getenv('EXTRACTION_WORKERS')
+# First page text extraction engine: pdfplumber, pdfminer, pypdfium2 or pypdf2 (see src/pipeline1/extraction_engines.py).
+# Only switch to an engine that tests/engine_benchmark.py reports as giving identical rows.
+EXTRACTION_ENGINE = os.getenv('EXTRACTION_ENGINE', 'pdfplumber')
+# Before full extraction only the top of the first page is read (with PDFium) to check for the metadata line. A PDF
+# the probe rejects has only its first page extracted, and is skipped if the metadata line isn't in that text either.
+HEADER_PROBE_ENABLED = os.getenv('HEADER_PROBE_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+HEADER_PROBE_FRACTION = 0.25 # top share of the page height holding the bulletin title
+# Pages extracted from each bulletin (comma separated, 1 based, page 1 is always extracted). A bulletin is opened once for
+# all of them. A backfill keeps the text of every page in a page text artifact (PAGE_TEXT_PREFIX<path of the bulletin
+# url>.json in blob storage) and reads it instead of downloading and parsing the PDF again when it reprocesses the
+# bulletin, as long as the PDF (its ETag, Last-Modified and size) is the one the artifact was extracted from. Regular runs
+# only see new bulletins, which have no artifact, and don't use them.
+EXTRACTION_PAGES = sorted({1} | {int(page) for page in os.getenv('EXTRACTION_PAGES', '1').split(',') if page.strip()})
+PAGE_TEXT_ARTIFACTS = os.getenv('PAGE_TEXT_ARTIFACTS', 'true').lower() in ('1', 'true', 'yes')
+PAGE_TEXT_PREFIX = 'page_text/'
+
+# Stage pipeline (src/pipeline1/stages.py): download -> extract -> transform -> csv sink -> Cosmos DB sink.
+# Stages are connected by queues of PIPELINE_QUEUE_SIZE items, a full queue pauses the stage in front of it, so at most
+# a few PDFs per stage are held in memory however many bulletins are pending.
+PIPELINE_QUEUE_SIZE = int(os.getenv('PIPELINE_QUEUE_SIZE', 4))
+TRANSFORM_WORKERS = int(os.getenv('TRANSFORM_WORKERS', 1)) # parse + DataFrame build, threads (mostly holding the GIL)
+# The sinks coalesce their writes across the bulletins of a run: the csv rows of a month are appended in one go and the
+# Cosmos DB documents of many bulletins are written together (in batches per partition key). Buffered rows are flushed
+# once SINK_FLUSH_ROWS are held, when the oldest waited SINK_FLUSH_SECONDS and at the end of the run, which bounds the
+# memory of large backfills.
+SINK_FLUSH_ROWS = int(os.getenv('SINK_FLUSH_ROWS', 5000))
+SINK_FLUSH_SECONDS = float(os.getenv('SINK_FLUSH_SECONDS', 60))
+
+# Cosmos DB writer
+COSMOS_WRITE_CONCURRENCY = int(os.getenv('COSMOS_WRITE_CONCURRENCY', 16)) # max number of write requests in flight
+COSMOS_BATCH_SIZE = 100 # transactional batch limit of Cosmos DB (operations per batch, all with the same partition key)
+COSMOS_MAX_RETRIES = 5 # retries of a throttled (429) write after the SDK's own retries are exhausted
+# Documents carry their partition key value in a "pk" field, set by COSMOS_PARTITION_SCHEME: 'item' ('<category>|<item>',
+# the price history of an item is one logical partition and item queries are single partition) or 'month' ('YYYY-MM',
+# fewest write requests, item queries fan out over the months of the range); 'none' leaves the field out.
+# Containers created with another partition key path (the earlier /currency) keep working with single document upserts;
+# migrate_cosmos.py copies their documents into a container partitioned on /pk.
+COSMOS_PARTITION_SCHEMES = ('item', 'month', 'none')
+COSMOS_PARTITION_SCHEME = os.getenv('COSMOS_PARTITION_SCHEME', 'item')
+COSMOS_PARTITION_KEY_PATH = '/pk'
+# Documents file of the local stand-in for the Cosmos DB container, used by offline backfills (one JSON document per line)
+LOCAL_COSMOS_FILE = os.getenv('LOCAL_COSMOS_FILE', os.path.join('data', 'cosmos', 'documents.jsonl'))
+
+# Blob storage backend: 'azure' uses the container in connect_str/container_name_blob,
+# 'local' keeps the same blob names as files under LOCAL_BLOB_STORE_DIR (for local runs and measurements)
+BLOB_STORE_BACKEND = os.getenv('BLOB_STORE_BACKEND', 'azure')
+LOCAL_BLOB_STORE_DIR = os.getenv('LOCAL_BLOB_STORE_DIR', os.path.join('data', 'blob'))
+BLOB_WRITE_MAX_ATTEMPTS = 10 # attempts of a conditional (ETag) write that keeps losing to concurrent writers
+
+# Azure Blob connections (src/connector/blob_connector.py), shared by all the blob requests of a run
+BLOB_POOL_CONNECTIONS = int(os.getenv('BLOB_POOL_CONNECTIONS', 10)) # pooled HTTP connections kept open to the storage account
+BLOB_MAX_CONCURRENCY = int(os.getenv('BLOB_MAX_CONCURRENCY', 4)) # parallel connections for one chunked upload/download
+BLOB_MAX_SINGLE_PUT_SIZE = 8 * 1024 * 1024 # larger uploads are split into blocks of BLOB_MAX_BLOCK_SIZE
+BLOB_MAX_BLOCK_SIZE = 4 * 1024 * 1024
+BLOB_MAX_SINGLE_GET_SIZE = 8 * 1024 * 1024 # larger downloads are fetched in chunks of BLOB_MAX_CHUNK_GET_SIZE
+BLOB_MAX_CHUNK_GET_SIZE = 4 * 1024 * 1024
+BLOB_CONNECTION_TIMEOUT = 20 # seconds
+BLOB_READ_TIMEOUT = 60 # seconds
+# Failed bulletins with their retry schedule (exponential backoff), and the permanently broken ones that are no longer tried
+FAILURE_REGISTRY_FILE = 'pdf_failures.json'
+FAILURE_RETRY_BASE_SECONDS = int(os.getenv('FAILURE_RETRY_BASE_SECONDS', 15 * 60)) # wait after the first failure, doubled per failure
+FAILURE_RETRY_MAX_SECONDS = 24 * 60 * 60
+FAILURE_MAX_ATTEMPTS = int(os.getenv('FAILURE_MAX_ATTEMPTS', 8)) # a bulletin is given up on after this many failed attempts
+ROW_HASH_INDEX_EXTENSION = '.hashes' # per row content hashes of the written rows, kept next to each monthly csv (2024-7.hashes)
+
+# Function monitoring heartbeat service, empty disables the heartbeat (offline runs)
+HEARTBEAT_URL = os.getenv('HEARTBEAT_URL', 'https://dataserviceheartbeat.azurewebsites.net/api/Is-Run-Log')
+HEARTBEAT_TIMEOUT_SECONDS = float(os.getenv('HEARTBEAT_TIMEOUT_SECONDS', 10)) # per request, a slow endpoint never holds up the run
+HEARTBEAT_MAX_RETRIES = int(os.getenv('HEARTBEAT_MAX_RETRIES', 2)) # retries of a failed heartbeat request
+HEARTBEAT_QUEUE_SIZE = 100 # heartbeat events waiting to be sent, events beyond this are dropped
+HEARTBEAT_FLUSH_SECONDS = 30 # time allowed at the end of a run for sending the queued events
+
+# Historical backfill (backfill.py)
+BACKFILL_CHECKPOINT_DIR = os.getenv('BACKFILL_CHECKPOINT_DIR', os.path.join('data', 'backfill'))
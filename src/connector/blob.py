@@ -1,98 +1,75 @@
 # connector/blob.py
-from azure.storage.blob import BlobServiceClient
 # from src.configuration.configuration import connect_str, container_name_blob
-from dotenv import load_dotenv
-import os
-from src.configuration.configuration import STATUS_FILE, LOG_FILE_EXTENSION, LOG_FILE_NAME, NUMBER_OF_LOG_FILES_TO_KEEP
+from src.configuration.configuration import LOG_FILE_EXTENSION, LOG_FILE_NAME, NUMBER_OF_LOG_FILES_TO_KEEP, LISTING_STATE_FILE, RUN_SUMMARY_EXTENSION
 from datetime import datetime
-from azure.core.exceptions import ResourceNotFoundError
 import re
+import json
+from src.connector.blob_store import get_blob_store
 
-load_dotenv()
+def get_monthly_csv_name(actual_date_str):
+    """All the csv_data corresponding to a month goes to one file in the name format year-month.csv. eg: 2024-10.csv"""
+    date_object = datetime.strptime(actual_date_str, '%y-%m-%d')
+    return str(date_object.year) + '-' + str(date_object.month) + '.csv'
 
-connect_str = os.getenv('connect_str')
-container_name_blob = os.getenv('container_name_blob')
-
-def upload_to_blob(csv_data, actual_date_str):
-
-        date_object = datetime.strptime(actual_date_str, '%y-%m-%d')
-        year = date_object.year
-        month = date_object.month
-
-        # We want all the csv_data corresponding to a month to be on one file in the name format year-month.csv. eg: 2024-10.csv
-        file_name = str(year) + '-' + str(month) + '.csv'
-        print(f"File name to upload: {file_name}")
-
-        blob_service_client = BlobServiceClient.from_connection_string(connect_str)
-        print("Connected to Azure Blob Storage")
+def upload_to_blob(csv_data, actual_date_str, blob_store=None):
+    """Appends the rows of csv_data to the monthly csv blob. The header row of csv_data is only written
+    when the monthly blob is created. Returns the number of bytes uploaded.
+    """
+    file_name = get_monthly_csv_name(actual_date_str)
+    print(f"File name to upload: {file_name}")
 
-        # Create a container client
-        container_client = blob_service_client.get_container_client(container= container_name_blob) 
-        print(f"Created container client for container: {container_name_blob}")
+    if blob_store is None:
+        blob_store = get_blob_store()
 
-        # Download the current csv data if it exists
-        try:
-            existing_csv_data = container_client.download_blob(file_name, encoding='UTF-8').readall()
-        except ResourceNotFoundError:
-            existing_csv_data = ''
+    header_end = csv_data.index('\n') + 1
+    header, rows = csv_data[:header_end], csv_data[header_end:]
 
-        if existing_csv_data != '':
-             existing_csv_data = existing_csv_data.split('\n', maxsplit=1)[1] # remove header row from existing csv data
-        # Append existing csv data to the new csv data
-        csv_data += existing_csv_data
+    bytes_uploaded = blob_store.append(file_name, rows.encode('utf-8'), header=header.encode('utf-8'))
+    print(f"Appended {bytes_uploaded} bytes to {file_name}")
+    return bytes_uploaded
 
-        # Upload the new CSV data to the blob
-        blob_client = blob_service_client.get_blob_client(container=container_name_blob, blob=file_name)
-        blob_client.upload_blob(csv_data.encode('utf-8'), overwrite=True)
-        print(f"Uploaded {file_name} to Azure Blob Storage")
 
+def download_listing_state(blob_store):
+    """Returns the listing page state saved by the last completed run (validators and newest pdf link), or {}"""
+    listing_state = blob_store.read(LISTING_STATE_FILE)
+    return json.loads(listing_state) if listing_state else {}
 
-def download_processed_pdfs():
-    """Downloads processed pdf link tracker from Azure blob and return it as a string 
-    """
-    blob_service_client = BlobServiceClient.from_connection_string(connect_str)
-    container_client = blob_service_client.get_container_client(container= container_name_blob) 
-    status_file_string = container_client.download_blob(STATUS_FILE, encoding='UTF-8').readall()
-    return status_file_string
+def upload_listing_state(blob_store, listing_state):
+    blob_store.write(LISTING_STATE_FILE, json.dumps(listing_state).encode('utf-8'))
 
-def upload_processed_pdfs(file_as_string):
-    """Overwrites given string to processed pdf link tracker in Azure blob. 
-    """
-    blob_service_client = BlobServiceClient.from_connection_string(connect_str)
-    container_client = blob_service_client.get_container_client(container= container_name_blob) 
-    blob_client = container_client.upload_blob(name=STATUS_FILE, data=file_as_string, overwrite=True)
+def get_log_file_base_name(current_datetime=None):
+    """eg: log2024821103015 (the log of a run is <base name>.txt, its run summary <base name>.json)"""
+    current_datetime = current_datetime or datetime.now()
+    return LOG_FILE_NAME + str(current_datetime.year) + str(current_datetime.month) + str(current_datetime.day) + str(current_datetime.hour) + str(current_datetime.minute) + str(current_datetime.second)
 
-def update_logs(log_messages: list[str]):
-    # each run will generate a log file. We will only store the most recent 10 log files in the blob.
-
-    blob_service_client = BlobServiceClient.from_connection_string(connect_str)
-    container_client = blob_service_client.get_container_client(container= container_name_blob)
-
-    # get existing log file names
-    blob_list = container_client.list_blobs()
+def rotate_logs(blob_store, keep=NUMBER_OF_LOG_FILES_TO_KEEP):
+    """Deletes all but the youngest keep log files and run summaries. Only the blobs starting with LOG_FILE_NAME are listed."""
     log_blobs = []
-    # pattern = r'^log\d+\.txt$'
-    pattern = f'^{LOG_FILE_NAME}\d+\.{LOG_FILE_EXTENSION}$'
-    for blob in blob_list:
-        if bool(re.match(pattern, blob.name)):
-            log_blobs.append(blob.name)
-
+    run_summary_blobs = []
+    pattern = re.compile(f'^{LOG_FILE_NAME}\\d+\\.{LOG_FILE_EXTENSION}$')
+    run_summary_pattern = re.compile(f'^{LOG_FILE_NAME}\\d+\\.{RUN_SUMMARY_EXTENSION}$')
+    for name in blob_store.list_names(prefix=LOG_FILE_NAME):
+        if pattern.match(name):
+            log_blobs.append(name)
+        elif run_summary_pattern.match(name):
+            run_summary_blobs.append(name)
 
     # sort log file names in descending order (so youngest log file is at index 0)
     log_blobs.sort(reverse=True)
+    run_summary_blobs.sort(reverse=True)
+    for log_blob_to_delete in log_blobs[keep:] + run_summary_blobs[keep:]:
+        blob_store.delete(log_blob_to_delete)
 
-    # only keep the youngest specified number of log files, delete the rest
-    log_blobs_to_delete = log_blobs[NUMBER_OF_LOG_FILES_TO_KEEP - 1:]
-    for log_blob_to_delete in log_blobs_to_delete:
-        blob_client = container_client.get_blob_client(log_blob_to_delete)
-        blob_client.delete_blob()
-
-    log_file_string = ''
-
-    # add new logs to the string
-    for log_message in log_messages: log_file_string += (log_message + '\n')
-
-    # upload the new log file
-    current_datetime = datetime.now()
-    new_log_file_name = LOG_FILE_NAME + str(current_datetime.year) + str(current_datetime.month) + str(current_datetime.day) + str(current_datetime.hour) + str(current_datetime.minute) + str(current_datetime.second) + '.' + LOG_FILE_EXTENSION
-    blob_client = container_client.upload_blob(name=new_log_file_name, data=log_file_string, overwrite=True)
+def update_logs(log_shipper, run_summary: str = None):
+    # each run will generate a log file. We will only store the most recent 10 log files in the blob.
+    # The log itself is shipped by log_shipper while the run goes on (see src/logHandling.py); this ships the rest of it,
+    # uploads run_summary (the run's instrumentation as JSON) next to it and deletes the oldest log files.
+    blob_store = log_shipper.blob_store
+    if blob_store is None:
+        return # shipping was never started
+    log_file_base_name = log_shipper.blob_name.rsplit('.', 1)[0]
+    log_shipper.finish()
+
+    if run_summary is not None:
+        blob_store.write(log_file_base_name + '.' + RUN_SUMMARY_EXTENSION, run_summary.encode('utf-8'))
+    rotate_logs(blob_store)
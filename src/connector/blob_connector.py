@@ -0,0 +1,152 @@
+# connector/blob_connector.py
+# One Azure Blob connection layer per run, shared by every connector function. It owns the service and container
+# clients, sync and async, and their HTTP connection pools. Connections (and their TLS sessions) are reused for all
+# the blob requests of the run instead of being set up again for every call. The async clients belong to the event loop
+# they were created on and are closed on it with aclose() (main() does it before its loop ends).
+# Large blobs are uploaded and downloaded in parallel chunks (BLOB_MAX_CONCURRENCY connections, block/chunk sizes below).
+# Works against Azure, Azurite (a development storage connection string) or an in-memory container for local tests.
+# The Azure SDK is imported when the first client is created.
+import asyncio
+import logging
+from src.configuration.configuration import (connect_str, container_name_blob, BLOB_POOL_CONNECTIONS, BLOB_MAX_CONCURRENCY,
+                                             BLOB_MAX_SINGLE_PUT_SIZE, BLOB_MAX_BLOCK_SIZE, BLOB_MAX_SINGLE_GET_SIZE, BLOB_MAX_CHUNK_GET_SIZE,
+                                             BLOB_CONNECTION_TIMEOUT, BLOB_READ_TIMEOUT)
+
+def get_client_options():
+    """Transfer settings passed to the service clients: single request vs chunked transfer thresholds and timeouts"""
+    return {
+        'max_single_put_size': BLOB_MAX_SINGLE_PUT_SIZE,
+        'max_block_size': BLOB_MAX_BLOCK_SIZE,
+        'max_single_get_size': BLOB_MAX_SINGLE_GET_SIZE,
+        'max_chunk_get_size': BLOB_MAX_CHUNK_GET_SIZE,
+        'connection_timeout': BLOB_CONNECTION_TIMEOUT,
+        'read_timeout': BLOB_READ_TIMEOUT,
+    }
+
+class BlobConnector:
+    """Service and container clients of the blob container, created on first use and shared until close().
+
+    container_client can be given (eg: tests.fake_blob.FakeContainerClient), in which case no client is created, and
+    so can async_container_client. transport replaces the pooled requests transport of the sync client.
+    """
+
+    def __init__(self, connection_string=None, container_name=None, container_client=None, transport=None,
+                 pool_connections=BLOB_POOL_CONNECTIONS, max_concurrency=BLOB_MAX_CONCURRENCY, async_container_client=None):
+        self.connection_string = connection_string or connect_str
+        self.container_name = container_name or container_name_blob
+        self.pool_connections = pool_connections
+        self.max_concurrency = max_concurrency
+        self._transport = transport
+        self._session = None
+        self._service_client = None
+        self._container_client = container_client
+        self._async_session = None
+        self._async_service_client = None
+        self._async_container_client = async_container_client
+
+    def _create_transport(self):
+        import requests
+        from azure.core.pipeline.transport import RequestsTransport
+        # a requests session whose pool keeps a connection per concurrent request (chunked transfers, blob thread)
+        self._session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=self.pool_connections, pool_maxsize=self.pool_connections)
+        self._session.mount('https://', adapter)
+        self._session.mount('http://', adapter)
+        return RequestsTransport(session=self._session, session_owner=False)
+
+    @property
+    def service_client(self):
+        if self._service_client is None:
+            from azure.storage.blob import BlobServiceClient
+            transport = self._transport or self._create_transport()
+            self._service_client = BlobServiceClient.from_connection_string(self.connection_string, transport=transport,
+                                                                            **get_client_options())
+        return self._service_client
+
+    @property
+    def container_client(self):
+        if self._container_client is None:
+            self._container_client = self.service_client.get_container_client(container=self.container_name)
+        return self._container_client
+
+    @property
+    def async_service_client(self):
+        """azure.storage.blob.aio client for coroutines. Create and close it on the same event loop (see aclose())."""
+        if self._async_service_client is None:
+            import aiohttp
+            from azure.core.pipeline.transport import AioHttpTransport
+            from azure.storage.blob.aio import BlobServiceClient as AsyncBlobServiceClient
+            session = aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=self.pool_connections))
+            transport = AioHttpTransport(session=session, session_owner=False)
+            try:
+                self._async_service_client = AsyncBlobServiceClient.from_connection_string(
+                    self.connection_string, transport=transport, **get_client_options())
+            except Exception:
+                asyncio.ensure_future(session.close())
+                raise
+            self._async_session = session
+        return self._async_service_client
+
+    @property
+    def async_container_client(self):
+        if self._async_container_client is None:
+            self._async_container_client = self.async_service_client.get_container_client(container=self.container_name)
+        return self._async_container_client
+
+    def has_open_async_clients(self):
+        return self._async_service_client is not None
+
+    async def aclose(self):
+        """Closes the async clients and their connection pool, on the event loop they were created on"""
+        if self._async_service_client is not None:
+            await self._async_service_client.close()
+            await self._async_session.close()
+            self._async_service_client = self._async_container_client = self._async_session = None
+
+    def close(self):
+        if self._service_client is not None:
+            self._service_client.close()
+            self._service_client = None
+            self._container_client = None
+        if self._session is not None:
+            self._session.close()
+            self._session = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.aclose()
+        self.close()
+
+_blob_connector = None
+
+def get_blob_connector():
+    """The connector of the current run, created on first use"""
+    global _blob_connector
+    if _blob_connector is None:
+        _blob_connector = BlobConnector()
+    return _blob_connector
+
+def set_blob_connector(blob_connector):
+    """Makes blob_connector the connector of the current run (eg: one on an in-memory container for local tests)"""
+    global _blob_connector
+    _blob_connector = blob_connector
+
+def close_blob_connector():
+    """Closes the connector of the run; the next run creates a new one. Its async clients have to be closed with
+    aclose() on their event loop before, they can't be closed from here.
+    """
+    global _blob_connector
+    if _blob_connector is not None:
+        if _blob_connector.has_open_async_clients():
+            logging.warning("Async blob clients of the run are still open, they should be closed with aclose() before "
+                            "their event loop ends")
+        _blob_connector.close()
+        _blob_connector = None
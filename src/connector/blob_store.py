@@ -0,0 +1,245 @@
+# connector/blob_store.py
+# Small storage interface shared by the CSV sink and the other state kept next to it in the blob container.
+# AzureBlobStore works on the Azure container, LocalBlobStore keeps the same blob names as files in a local directory.
+# Both count the bytes they transfer so the cost of a run can be measured.
+# AzureBlobStore uses the pooled clients of the run's BlobConnector (src/connector/blob_connector.py).
+import os
+import time
+import logging
+from azure.core import MatchConditions
+from azure.core.exceptions import HttpResponseError, ResourceNotFoundError, ResourceExistsError, ResourceModifiedError
+from src.connector.blob_connector import get_blob_connector
+from src.configuration.configuration import BLOB_STORE_BACKEND, LOCAL_BLOB_STORE_DIR, BLOB_WRITE_MAX_ATTEMPTS
+
+APPEND_BLOCK_MAX_BYTES = 4 * 1024 * 1024 # largest block accepted by a single Append Block call
+# Converting a block blob to an append blob (see AzureBlobStore._convert_to_append_blob)
+CONVERSION_BACKUP_SUFFIX = '.converting' # copy of the content of the blob being converted, deleted once it is converted
+CONVERSION_METADATA_KEY = 'converting_from' # metadata of the new append blob until the backup content is in it
+CONVERSION_LEASE_SECONDS = 60 # the blob is leased while it is converted (a lease lasts 15 to 60 seconds)
+CONVERSION_WAIT_SECONDS = 2 # wait of a writer that finds the blob leased by a conversion before it tries again
+LEASE_CONFLICT_ERROR_CODES = ('LeaseAlreadyPresent', 'LeaseIdMissing', 'LeaseIdMismatchWithBlobOperation',
+                              'LeaseIdMismatchWithLeaseOperation')
+
+def is_lease_conflict(error):
+    """True when a blob request failed because another writer holds a lease on the blob"""
+    return getattr(error, 'error_code', None) in LEASE_CONFLICT_ERROR_CODES
+
+class ConditionalWriteError(Exception):
+    """A conditional write lost against a concurrent writer (ETag changed, or blob already exists)"""
+
+class AzureBlobStore:
+    """Works on the container client of a BlobConnector, by default the shared connector of the run"""
+
+    def __init__(self, container_client=None, blob_connector=None):
+        blob_connector = blob_connector or get_blob_connector()
+        self.container_client = container_client or blob_connector.container_client
+        self.max_concurrency = blob_connector.max_concurrency
+        self.bytes_uploaded = 0
+        self.bytes_downloaded = 0
+
+    def read_with_etag(self, name):
+        """Returns (content bytes, etag), or (None, None) if the blob doesn't exist"""
+        try:
+            downloader = self.container_client.download_blob(name, max_concurrency=self.max_concurrency)
+            data = downloader.readall()
+        except ResourceNotFoundError:
+            return None, None
+        self.bytes_downloaded += len(data)
+        return data, downloader.properties.etag
+
+    def read(self, name):
+        return self.read_with_etag(name)[0]
+
+    def exists(self, name):
+        return self.container_client.get_blob_client(name).exists()
+
+    def write(self, name, data: bytes, etag=None, if_missing=False):
+        """Overwrites the blob. With etag only succeeds if the blob is unchanged since it was read,
+        with if_missing only succeeds if the blob doesn't exist yet; otherwise raises ConditionalWriteError.
+        Returns the new etag.
+        """
+        kwargs = {}
+        if etag is not None:
+            kwargs = {'etag': etag, 'match_condition': MatchConditions.IfNotModified}
+        elif if_missing:
+            kwargs = {'match_condition': MatchConditions.IfMissing}
+        try:
+            result = self.container_client.get_blob_client(name).upload_blob(data, overwrite=True,
+                                                                             max_concurrency=self.max_concurrency, **kwargs)
+        except (ResourceModifiedError, ResourceExistsError) as e:
+            raise ConditionalWriteError(f"Conditional write of {name} failed: {e}") from e
+        self.bytes_uploaded += len(data)
+        return result['etag']
+
+    def _convert_to_append_blob(self, blob_client, properties):
+        # blobs written by the earlier read-modify-write code are block blobs, which can't be appended to.
+        # They are rewritten once as an append blob with the same content. The content is saved to a backup blob first,
+        # then the blob is leased (only if unchanged since properties were read) and recreated as an append blob holding
+        # it. Writers without the lease can't append meanwhile, and a conversion that is interrupted after the blob was
+        # recreated is completed from the backup by the next append (see _complete_conversion).
+        logging.info(f"Converting {blob_client.blob_name} to an append blob")
+        existing_data = blob_client.download_blob(max_concurrency=self.max_concurrency, etag=properties.etag,
+                                                  match_condition=MatchConditions.IfNotModified).readall()
+        self.bytes_downloaded += len(existing_data)
+        backup_name = blob_client.blob_name + CONVERSION_BACKUP_SUFFIX
+        self.container_client.get_blob_client(backup_name).upload_blob(existing_data, overwrite=True,
+                                                                       max_concurrency=self.max_concurrency)
+        self.bytes_uploaded += len(existing_data)
+        lease = blob_client.acquire_lease(CONVERSION_LEASE_SECONDS, etag=properties.etag,
+                                          match_condition=MatchConditions.IfNotModified)
+        self._fill_from_backup(blob_client, lease, existing_data, backup_name)
+
+    def _complete_conversion(self, blob_client, properties):
+        """Completes a conversion that was interrupted after the blob was recreated as an append blob"""
+        backup_name = properties.metadata[CONVERSION_METADATA_KEY]
+        lease = blob_client.acquire_lease(CONVERSION_LEASE_SECONDS, etag=properties.etag,
+                                          match_condition=MatchConditions.IfNotModified)
+        logging.warning(f"Completing the interrupted append blob conversion of {blob_client.blob_name} from {backup_name}")
+        backup_data = self.read(backup_name)
+        if backup_data is None:
+            lease.release()
+            raise RuntimeError(f"Backup {backup_name} of the append blob conversion of {blob_client.blob_name} is missing")
+        self._fill_from_backup(blob_client, lease, backup_data, backup_name)
+
+    def _fill_from_backup(self, blob_client, lease, data, backup_name):
+        """Recreates the leased blob as an append blob holding data (the content saved in backup_name). The blob is
+        marked as being converted until all of data is in it, then the lease is released and the backup deleted.
+        """
+        try:
+            blob_client.create_append_blob(metadata={CONVERSION_METADATA_KEY: backup_name}, lease=lease)
+            for i in range(0, len(data), APPEND_BLOCK_MAX_BYTES):
+                blob_client.append_block(data[i:i + APPEND_BLOCK_MAX_BYTES], lease=lease)
+            blob_client.set_blob_metadata({}, lease=lease)
+        finally:
+            lease.release()
+        self.bytes_uploaded += len(data)
+        self.delete(backup_name)
+
+    def append(self, name, data: bytes, header: bytes = b''):
+        """Appends data to an append blob, creating it if needed. header is written first when the blob is empty.
+        Each append is conditional on the blob's ETag so concurrent writers can't interleave a header
+        with each other's rows; a lost race is retried with fresh properties. Returns the number of bytes uploaded.
+        """
+        from azure.storage.blob import BlobType
+        blob_client = self.container_client.get_blob_client(name)
+        for _ in range(BLOB_WRITE_MAX_ATTEMPTS):
+            try:
+                properties = blob_client.get_blob_properties()
+            except ResourceNotFoundError:
+                try:
+                    blob_client.create_append_blob(match_condition=MatchConditions.IfMissing)
+                except ResourceExistsError:
+                    pass # created by a concurrent writer
+                continue
+
+            try:
+                if properties.blob_type != BlobType.APPENDBLOB:
+                    self._convert_to_append_blob(blob_client, properties)
+                    continue
+                if CONVERSION_METADATA_KEY in (properties.metadata or {}):
+                    self._complete_conversion(blob_client, properties)
+                    continue
+
+                payload = header + data if properties.size == 0 else data
+                if len(payload) > APPEND_BLOCK_MAX_BYTES:
+                    raise ValueError(f"Append to {name} of {len(payload)} bytes exceeds the append block limit")
+                if not payload:
+                    return 0 # the blob exists now, which is all an empty append asks for
+                blob_client.append_block(payload, etag=properties.etag, match_condition=MatchConditions.IfNotModified)
+            except HttpResponseError as e:
+                if is_lease_conflict(e):
+                    time.sleep(CONVERSION_WAIT_SECONDS) # being converted by another writer
+                    continue
+                if isinstance(e, ResourceModifiedError):
+                    continue
+                raise
+            self.bytes_uploaded += len(payload)
+            return len(payload)
+        raise ConditionalWriteError(f"Could not append to {name} after {BLOB_WRITE_MAX_ATTEMPTS} attempts")
+
+    def list_names(self, prefix=''):
+        return [blob.name for blob in self.container_client.list_blobs(name_starts_with=prefix)]
+
+    def delete(self, name):
+        try:
+            self.container_client.delete_blob(name)
+        except ResourceNotFoundError:
+            pass
+
+class LocalBlobStore:
+    """Filesystem backend with the same interface. Blob names map to paths under directory.
+    The ETag of a file is derived from its modification time and size.
+    """
+
+    def __init__(self, directory=LOCAL_BLOB_STORE_DIR):
+        self.directory = directory
+        self.bytes_uploaded = 0
+        self.bytes_downloaded = 0
+
+    def _path(self, name):
+        return os.path.join(self.directory, *name.split('/'))
+
+    def _etag(self, path):
+        stat = os.stat(path)
+        return f'{stat.st_mtime_ns}-{stat.st_size}'
+
+    def read_with_etag(self, name):
+        path = self._path(name)
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+            etag = self._etag(path)
+        except FileNotFoundError:
+            return None, None
+        self.bytes_downloaded += len(data)
+        return data, etag
+
+    def read(self, name):
+        return self.read_with_etag(name)[0]
+
+    def exists(self, name):
+        return os.path.exists(self._path(name))
+
+    def write(self, name, data: bytes, etag=None, if_missing=False):
+        path = self._path(name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        exists = os.path.exists(path)
+        if etag is not None and (not exists or self._etag(path) != etag):
+            raise ConditionalWriteError(f"Conditional write of {name} failed: ETag changed")
+        if if_missing and exists:
+            raise ConditionalWriteError(f"Conditional write of {name} failed: blob already exists")
+        temporary_path = f'{path}.{os.getpid()}.tmp'
+        with open(temporary_path, 'wb') as f:
+            f.write(data)
+        os.replace(temporary_path, path)
+        self.bytes_uploaded += len(data)
+        return self._etag(path)
+
+    def append(self, name, data: bytes, header: bytes = b''):
+        path = self._path(name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'ab') as f:
+            payload = header + data if f.tell() == 0 else data
+            f.write(payload)
+        self.bytes_uploaded += len(payload)
+        return len(payload)
+
+    def list_names(self, prefix=''):
+        names = []
+        for root, _, files in os.walk(self.directory):
+            for file_name in files:
+                name = os.path.relpath(os.path.join(root, file_name), self.directory).replace(os.sep, '/')
+                if name.startswith(prefix) and not name.endswith('.tmp'):
+                    names.append(name)
+        return sorted(names)
+
+    def delete(self, name):
+        try:
+            os.remove(self._path(name))
+        except FileNotFoundError:
+            pass
+
+def get_blob_store(backend=BLOB_STORE_BACKEND):
+    if backend == 'local':
+        return LocalBlobStore()
+    return AzureBlobStore()
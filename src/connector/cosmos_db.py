@@ -1,15 +1,13 @@
+import os
+import json
+import time
+import asyncio
+import logging
 from azure.cosmos.aio import CosmosClient
 from azure.cosmos import exceptions, PartitionKey
-# from src.configuration.configuration import endpoint, key, database_name, container_name_cosmos
-from dotenv import load_dotenv
-import os
-
-load_dotenv()
-
-endpoint = os.getenv('endpoint')
-key = os.getenv('key')
-database_name = os.getenv('database_name')
-container_name_cosmos = os.getenv('container_name_cosmos')
+from src.configuration.configuration import endpoint, key, database_name, container_name_cosmos
+from src.configuration.configuration import (COSMOS_WRITE_CONCURRENCY, COSMOS_BATCH_SIZE, COSMOS_MAX_RETRIES, COSMOS_PARTITION_KEY_PATH,
+                                             COSMOS_PARTITION_SCHEME, LOCAL_COSMOS_FILE)
 
 async def get_cosmos_client():
     return CosmosClient(endpoint, credential=key)
@@ -24,22 +22,213 @@ async def get_or_create_database(client, database_name):
         print(f"Database '{database_name}' created")
     return database
 
-async def get_or_create_container(database, container_name):
+# Only the fields the price queries filter or sort on are indexed (fewer RUs per write). The composite indexes serve
+# "price of an item over a date range" queries (equality on category/item, range and ORDER BY on date) also when they
+# are not single partition queries (the 'month' partition scheme).
+INDEXING_POLICY = {
+    'indexingMode': 'consistent',
+    'automatic': True,
+    'includedPaths': [{'path': '/pk/?'}, {'path': '/category/?'}, {'path': '/item/?'}, {'path': '/date/?'}],
+    'excludedPaths': [{'path': '/*'}, {'path': '/"_etag"/?'}],
+    'compositeIndexes': [
+        [{'path': '/item', 'order': 'ascending'}, {'path': '/date', 'order': 'ascending'}],
+        [{'path': '/category', 'order': 'ascending'}, {'path': '/item', 'order': 'ascending'}, {'path': '/date', 'order': 'ascending'}],
+    ],
+}
+
+async def get_or_create_container(database, container_name, partition_key_path=COSMOS_PARTITION_KEY_PATH,
+                                  indexing_policy=INDEXING_POLICY):
+    """Returns (container, partition key path of the container), creating it with partition_key_path and
+    indexing_policy if it doesn't exist. An existing container keeps the partition key it was created with.
+    """
     try:
         container = database.get_container_client(container_name)
-        await container.read()
+        properties = await container.read()
         print(f"Container '{container_name}' already exists")
     except exceptions.CosmosResourceNotFoundError:
-        container = await database.create_container(id=container_name, partition_key=PartitionKey(path="/currency"))
+        container = await database.create_container(id=container_name, partition_key=PartitionKey(path=partition_key_path),
+                                                    indexing_policy=indexing_policy)
+        properties = await container.read()
         print(f"Container '{container_name}' created")
-    return container
+    return container, properties['partitionKey']['paths'][0]
+
+def get_retry_after_seconds(error, attempt):
+    """Wait time requested by a throttled (429) response, falling back to exponential backoff"""
+    headers = getattr(error, 'headers', None) or {}
+    retry_after_ms = headers.get('x-ms-retry-after-ms')
+    if retry_after_ms is not None:
+        return float(retry_after_ms) / 1000
+    return min(2 ** attempt * 0.1, 10)
+
+class LocalCosmosContainer:
+    """Stand-in for the Cosmos DB container with the two write calls CosmosWriter uses. Upserted documents are appended
+    to a local JSON lines file (a later line with the same id replaces an earlier one), for offline runs.
+    """
+
+    def __init__(self, path=LOCAL_COSMOS_FILE):
+        self.path = path
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+
+    def _append(self, documents):
+        with open(self.path, 'a', encoding='utf-8') as f:
+            f.writelines(json.dumps(document) + '\n' for document in documents)
+
+    async def upsert_item(self, body, response_hook=None, **kwargs):
+        self._append([body])
+        return body
+
+    async def execute_item_batch(self, batch_operations, partition_key=None, response_hook=None, **kwargs):
+        documents = [args[0] for _, args in batch_operations]
+        self._append(documents)
+        return documents
+
+    def read_documents(self):
+        """Returns {id: latest document}"""
+        documents = {}
+        if os.path.exists(self.path):
+            with open(self.path, encoding='utf-8') as f:
+                for line in f:
+                    document = json.loads(line)
+                    documents[document['id']] = document
+        return documents
+
+class CosmosWriter:
+    """Long lived Cosmos DB writer. The database and container are resolved once when entering the context,
+    after which write() pushes documents with at most max_concurrency requests in flight, using transactional
+    batches for documents that share a partition key value. Throttled requests (429) are retried after the
+    retry-after time returned by the service.
+
+    A container (e.g. a local fake exposing upsert_item/execute_item_batch) can be passed in for testing,
+    in which case no client is created.
+    """
+
+    def __init__(self, container=None, max_concurrency=COSMOS_WRITE_CONCURRENCY, batch_size=COSMOS_BATCH_SIZE,
+                 max_retries=COSMOS_MAX_RETRIES, partition_key_path=COSMOS_PARTITION_KEY_PATH):
+        self.container = container
+        self.max_concurrency = max_concurrency
+        self.batch_size = batch_size
+        self.max_retries = max_retries
+        self.partition_key_field = partition_key_path.lstrip('/')
+        self._client = None
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+
+        self.documents_written = 0
+        self.request_charge = 0.0
+        self.throttled_retries = 0
+        self.write_seconds = 0.0
+
+    async def __aenter__(self):
+        if self.container is None:
+            self._client = CosmosClient(endpoint, credential=key)
+            database = await get_or_create_database(self._client, database_name)
+            self.container, partition_key_path = await get_or_create_container(database, container_name_cosmos)
+            if partition_key_path != COSMOS_PARTITION_KEY_PATH:
+                logging.warning(f"Cosmos DB container '{container_name_cosmos}' is partitioned on {partition_key_path}, not "
+                                f"{COSMOS_PARTITION_KEY_PATH}: documents are upserted one by one (see migrate_cosmos.py)")
+            self.partition_key_field = partition_key_path.lstrip('/')
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        if self._client is not None:
+            await self._client.close()
+            self._client = None
+
+    def _record_charge(self, headers, result):
+        self.request_charge += float(headers.get('x-ms-request-charge', 0) or 0)
+
+    async def _with_retries(self, write_operation):
+        attempt = 0
+        while True:
+            try:
+                async with self._semaphore:
+                    return await write_operation()
+            except exceptions.CosmosHttpResponseError as e:
+                if e.status_code != 429 or attempt >= self.max_retries:
+                    raise
+                self.throttled_retries += 1
+                await asyncio.sleep(get_retry_after_seconds(e, attempt))
+                attempt += 1
+
+    async def _upsert(self, document):
+        await self._with_retries(lambda: self.container.upsert_item(document, response_hook=self._record_charge))
+        self.documents_written += 1
+
+    async def _upsert_batch(self, partition_key_value, documents):
+        batch_operations = [('upsert', (document,)) for document in documents]
+        await self._with_retries(lambda: self.container.execute_item_batch(
+            batch_operations, partition_key=partition_key_value, response_hook=self._record_charge))
+        self.documents_written += len(documents)
+
+    async def write(self, documents):
+        """Upserts all documents. Documents carrying the partition key field are grouped into transactional
+        batches per partition key value, the others are upserted individually.
+        """
+        start = time.perf_counter()
+        batches = {}
+        single_documents = []
+        for document in documents:
+            if self.partition_key_field in document:
+                batches.setdefault(document[self.partition_key_field], []).append(document)
+            else:
+                single_documents.append(document)
+
+        writes = [self._upsert(document) for document in single_documents]
+        for partition_key_value, partition_documents in batches.items():
+            for i in range(0, len(partition_documents), self.batch_size):
+                writes.append(self._upsert_batch(partition_key_value, partition_documents[i:i + self.batch_size]))
+        try:
+            await asyncio.gather(*writes)
+        finally:
+            self.write_seconds += time.perf_counter() - start
+
+    def get_summary(self):
+        return {
+            'documents_written': self.documents_written,
+            'write_seconds': round(self.write_seconds, 3),
+            'documents_per_second': round(self.documents_written / self.write_seconds, 2) if self.write_seconds else 0.0,
+            'request_charge': round(self.request_charge, 2),
+            'throttled_retries': self.throttled_retries,
+        }
+
+    def log_summary(self):
+        summary = self.get_summary()
+        logging.info(f"Cosmos DB writer: {summary['documents_written']} documents in {summary['write_seconds']}s "
+                     f"({summary['documents_per_second']} docs/s), {summary['request_charge']} RUs, "
+                     f"{summary['throttled_retries']} throttled retries")
 
 async def write_harti_data_to_cosmosdb(harti_data_dict):
+    """Writes the documents with a writer of its own. Prefer one CosmosWriter per run when writing several PDFs."""
+    async with CosmosWriter() as writer:
+        await writer.write(harti_data_dict)
+
+ITEM_PRICES_QUERY = ('SELECT c.date, c.pettah_average, c.pettah_min_value, c.pettah_max_value FROM c '
+                     'WHERE c.category = @category AND c.item = @item AND c.date >= @start_date AND c.date <= @end_date '
+                     'ORDER BY c.date')
+
+def get_month_partitions(start_date, end_date):
+    """'YYYY-MM' partition key values of the months from start_date to end_date (iso date strings)"""
+    year, month = int(start_date[:4]), int(start_date[5:7])
+    months = []
+    while f'{year:04d}-{month:02d}' <= end_date[:7]:
+        months.append(f'{year:04d}-{month:02d}')
+        year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+    return months
+
+async def query_item_prices(container, category, item, start_date, end_date, partition_scheme=COSMOS_PARTITION_SCHEME):
+    """Prices of an item between two iso dates (YYYY-MM-DD, inclusive), ordered by date. With the 'item' partition scheme this is a
+    single partition query, with 'month' one query per month partition of the range (run concurrently), otherwise a
+    cross partition query.
+    """
+    from src.pipeline1.data_format_converter import get_partition_key_value
+    parameters = [{'name': '@category', 'value': category}, {'name': '@item', 'value': item},
+                  {'name': '@start_date', 'value': start_date}, {'name': '@end_date', 'value': end_date + 'T23:59:59'}]
 
-    client = await get_cosmos_client()
-    async with CosmosClient(endpoint, credential=key) as client:
-        database = await get_or_create_database(client, database_name)
-        container = await get_or_create_container(database, container_name_cosmos)
+    async def query(**partition):
+        return [row async for row in container.query_items(ITEM_PRICES_QUERY, parameters=parameters, **partition)]
 
-        for rate in harti_data_dict:
-            await container.upsert_item(rate)
+    if partition_scheme == 'item':
+        return await query(partition_key=get_partition_key_value(start_date, category, item, partition_scheme))
+    if partition_scheme == 'month':
+        month_rows = await asyncio.gather(*(query(partition_key=month) for month in get_month_partitions(start_date, end_date)))
+        return [row for rows in month_rows for row in rows]
+    return await query()
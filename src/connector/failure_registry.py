@@ -0,0 +1,95 @@
+# connector/failure_registry.py
+# Bulletins that failed to download or process, kept in a JSON blob with the number of attempts, the last error and
+# when the next attempt is due. Retries back off exponentially, so one poisoned bulletin doesn't cost every run a
+# download and a full processing attempt. Bulletins that fail permanently (404/410, or too many attempts) form a
+# negative cache: they are skipped until their entry is removed from the blob.
+import json
+import logging
+from datetime import datetime, timedelta, timezone
+from src.connector.blob_store import ConditionalWriteError
+from src.configuration.configuration import (FAILURE_REGISTRY_FILE, FAILURE_RETRY_BASE_SECONDS, FAILURE_RETRY_MAX_SECONDS,
+                                             FAILURE_MAX_ATTEMPTS, BLOB_WRITE_MAX_ATTEMPTS)
+
+def is_permanent_error(error):
+    """A download error that retrying can't fix: the server says the PDF is gone"""
+    response = getattr(error, 'response', None)
+    return getattr(response, 'status_code', None) in (404, 410)
+
+def get_retry_delay(attempts, base_seconds=FAILURE_RETRY_BASE_SECONDS, max_seconds=FAILURE_RETRY_MAX_SECONDS):
+    """Wait before the next attempt after the given number of failed attempts: base, 2 x base, 4 x base, ... up to max"""
+    return min(base_seconds * 2 ** (attempts - 1), max_seconds)
+
+class FailureRegistry:
+    """{pdf link: {'attempts', 'last_error', 'next_retry', 'permanent'}}, loaded once per run and saved with save()"""
+
+    def __init__(self, blob_store, max_attempts=FAILURE_MAX_ATTEMPTS):
+        self.blob_store = blob_store
+        self.max_attempts = max_attempts
+        self._failures = {}
+        self._changed = {} # link -> entry, or None for a removed entry; reapplied when save() loses a race
+        self._etag = None
+
+    def load(self):
+        data, self._etag = self.blob_store.read_with_etag(FAILURE_REGISTRY_FILE)
+        self._failures = json.loads(data) if data else {}
+        return self
+
+    def should_skip(self, pdf_link, now=None):
+        """True for a permanently failed link, or one whose next retry is not due yet"""
+        failure = self._failures.get(pdf_link)
+        if failure is None:
+            return False
+        if failure['permanent']:
+            return True
+        now = now or datetime.now(timezone.utc)
+        return datetime.fromisoformat(failure['next_retry']) > now
+
+    def is_permanent(self, pdf_link):
+        failure = self._failures.get(pdf_link)
+        return failure is not None and failure['permanent']
+
+    def record_failure(self, pdf_link, error, permanent=False, now=None):
+        now = now or datetime.now(timezone.utc)
+        attempts = self._failures.get(pdf_link, {}).get('attempts', 0) + 1
+        permanent = permanent or attempts >= self.max_attempts
+        failure = {
+            'attempts': attempts,
+            'last_error': str(error)[:500],
+            'next_retry': (now + timedelta(seconds=get_retry_delay(attempts))).isoformat(),
+            'permanent': permanent,
+        }
+        self._failures[pdf_link] = self._changed[pdf_link] = failure
+        if permanent:
+            logging.warning(f"Giving up on {pdf_link} after {attempts} attempts: {failure['last_error']}")
+        else:
+            logging.warning(f"Attempt {attempts} of {pdf_link} failed, next retry after {failure['next_retry']}")
+
+    def record_success(self, pdf_link):
+        if pdf_link in self._failures:
+            del self._failures[pdf_link]
+            self._changed[pdf_link] = None
+
+    def pending_retries(self):
+        """Links that failed transiently and will be retried by a later run"""
+        return [pdf_link for pdf_link, failure in self._failures.items() if not failure['permanent']]
+
+    def save(self):
+        """Writes the registry if it changed. A concurrent update of the blob is merged by reapplying this run's changes."""
+        if not self._changed:
+            return
+        for _ in range(BLOB_WRITE_MAX_ATTEMPTS):
+            data = json.dumps(self._failures, indent=1, sort_keys=True).encode('utf-8')
+            try:
+                self._etag = self.blob_store.write(FAILURE_REGISTRY_FILE, data, etag=self._etag, if_missing=self._etag is None)
+                self._changed = {}
+                return
+            except ConditionalWriteError:
+                changed = self._changed
+                self.load()
+                for pdf_link, failure in changed.items():
+                    if failure is None:
+                        self._failures.pop(pdf_link, None)
+                    else:
+                        self._failures[pdf_link] = failure
+                self._changed = changed
+        raise ConditionalWriteError(f"Could not save {FAILURE_REGISTRY_FILE} after {BLOB_WRITE_MAX_ATTEMPTS} attempts")
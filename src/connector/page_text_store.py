@@ -0,0 +1,72 @@
+# connector/page_text_store.py
+# Page text artifacts: the extracted text of the pages of a bulletin, one JSON blob per bulletin keyed off the path of
+# its url (page_text/images/download/market_information/2024/daily_21-08-2024.json for
+# https://www.harti.gov.lk/images/download/market_information/2024/daily_21-08-2024.pdf). Written when a backfill
+# extracts the bulletin, read by later backfills of it instead of downloading and parsing the PDF again.
+# An artifact records the version of the PDF it was extracted from (ETag, Last-Modified and size), a bulletin
+# re-published at the same url is extracted again.
+import json
+import logging
+import posixpath
+from urllib.parse import urlparse
+from src.configuration.configuration import PAGE_TEXT_PREFIX, EXTRACTION_ENGINE
+
+def get_page_text_blob_name(pdf_link):
+    """Returns the artifact blob of pdf_link: the path of the url with .json for .pdf under PAGE_TEXT_PREFIX, eg:
+    page_text/images/download/market_information/2024/daily_21-08-2024.json
+    """
+    path = urlparse(pdf_link).path.lstrip('/')
+    return PAGE_TEXT_PREFIX + posixpath.splitext(path)[0] + '.json'
+
+class PageTextStore:
+    """Reads and writes the page text artifacts in blob_store. An artifact records the pages that were requested, so a
+    page it doesn't hold is one the PDF doesn't have. Artifacts of another extraction engine, and artifacts of another
+    version of the PDF (pdf_version, see get_pdf_version) are not used.
+    """
+
+    def __init__(self, blob_store, engine=EXTRACTION_ENGINE):
+        self.blob_store = blob_store
+        self.engine = engine
+        self.hits = 0
+        self.misses = 0
+        self.stale = 0
+        self.writes = 0
+
+    def get(self, pdf_link, page_numbers, pdf_version):
+        """Returns {page number: text} of the requested page_numbers the PDF has, or None when there is no artifact of
+        pdf_link covering them extracted from pdf_version of the PDF (a PDF without a version is never looked up)
+        """
+        if pdf_version is None:
+            self.misses += 1
+            return None
+        data = self.blob_store.read(get_page_text_blob_name(pdf_link))
+        artifact = json.loads(data) if data else None
+        if artifact is None or artifact['engine'] != self.engine or not set(page_numbers) <= set(artifact['page_numbers']):
+            self.misses += 1
+            return None
+        if artifact.get('pdf_version') != pdf_version:
+            logging.info(f"Page text artifact of {pdf_link} is of another version of the PDF, extracting it again")
+            self.stale += 1
+            return None
+        self.hits += 1
+        pages = artifact['pages']
+        return {page_number: pages[str(page_number)] for page_number in page_numbers if str(page_number) in pages}
+
+    def put(self, pdf_link, page_texts, page_numbers, pdf_version):
+        """Stores page_texts ({page number: text}) extracted for the requested page_numbers of pdf_version of pdf_link"""
+        artifact = {
+            'pdf_link': pdf_link,
+            'pdf_version': pdf_version,
+            'engine': self.engine,
+            'page_numbers': sorted(page_numbers),
+            'pages': {str(page_number): text for page_number, text in sorted(page_texts.items())},
+        }
+        self.blob_store.write(get_page_text_blob_name(pdf_link), json.dumps(artifact, ensure_ascii=False).encode('utf-8'))
+        self.writes += 1
+
+    def get_summary(self):
+        return {'hits': self.hits, 'misses': self.misses, 'stale': self.stale, 'writes': self.writes}
+
+    def log_summary(self):
+        logging.info(f"Page text artifacts: {self.hits} used, {self.misses} missing, {self.stale} of another PDF version, "
+                     f"{self.writes} written")
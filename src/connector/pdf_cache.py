@@ -0,0 +1,136 @@
+# connector/pdf_cache.py
+# On disk PDF cache. PDF content is stored once per sha256 under objects/, and index.json maps each url to its
+# content hash, size, server validators (ETag/Last-Modified) and last access time, for size bounded LRU eviction.
+import os
+import json
+import time
+import hashlib
+import logging
+import threading
+from src.configuration.configuration import PDF_CACHE_DIR, PDF_CACHE_MAX_BYTES
+
+class PdfCache:
+
+    def __init__(self, directory=PDF_CACHE_DIR, max_bytes=PDF_CACHE_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._index_path = os.path.join(directory, 'index.json')
+        self._lock = threading.Lock()
+        self._index_changed = False
+        os.makedirs(os.path.join(directory, 'objects'), exist_ok=True)
+        try:
+            with open(self._index_path, 'r', encoding='utf-8') as f:
+                self._index = json.load(f)
+        except (FileNotFoundError, ValueError):
+            self._index = {}
+
+        self.hits = 0
+        self.misses = 0
+        self.bytes_saved = 0
+
+    def _object_path(self, sha256):
+        return os.path.join(self.directory, 'objects', sha256 + '.pdf')
+
+    def get(self, url):
+        """Returns the cached content of url (counted as a hit), or None"""
+        with self._lock:
+            entry = self._index.get(url)
+            content = None
+            if entry is not None:
+                try:
+                    with open(self._object_path(entry['sha256']), 'rb') as f:
+                        content = f.read()
+                except FileNotFoundError:
+                    del self._index[url]
+                    self._index_changed = True
+            if content is None:
+                return None
+            entry['last_access'] = time.time()
+            self._index_changed = True
+            self.hits += 1
+            self.bytes_saved += len(content)
+            return content
+
+    def get_validators(self, url):
+        """Request headers for revalidating the cached copy of url with a conditional GET"""
+        entry = self._index.get(url) or {}
+        headers = {}
+        if entry.get('etag'):
+            headers['If-None-Match'] = entry['etag']
+        if entry.get('last_modified'):
+            headers['If-Modified-Since'] = entry['last_modified']
+        return headers
+
+    def put(self, url, content: bytes, etag=None, last_modified=None):
+        """Stores content downloaded from the server for url (counted as a miss)"""
+        sha256 = hashlib.sha256(content).hexdigest()
+        with self._lock:
+            self.misses += 1
+            object_path = self._object_path(sha256)
+            if not os.path.exists(object_path):
+                temporary_path = f'{object_path}.{threading.get_ident()}.tmp'
+                with open(temporary_path, 'wb') as f:
+                    f.write(content)
+                os.replace(temporary_path, object_path)
+            self._index[url] = {'sha256': sha256, 'size': len(content), 'etag': etag,
+                                'last_modified': last_modified, 'last_access': time.time()}
+            self._index_changed = True
+            self._evict()
+            self._save_index()
+
+    def _evict(self):
+        # sizes are counted per content hash, urls sharing content share one object
+        object_sizes = {}
+        object_last_access = {}
+        for entry in self._index.values():
+            object_sizes[entry['sha256']] = entry['size']
+            object_last_access[entry['sha256']] = max(entry['last_access'], object_last_access.get(entry['sha256'], 0))
+        total_bytes = sum(object_sizes.values())
+        for sha256 in sorted(object_last_access, key=object_last_access.get):
+            if total_bytes <= self.max_bytes:
+                break
+            for url in [url for url, entry in self._index.items() if entry['sha256'] == sha256]:
+                del self._index[url]
+            try:
+                os.remove(self._object_path(sha256))
+            except FileNotFoundError:
+                pass
+            total_bytes -= object_sizes[sha256]
+            self._index_changed = True
+
+    def _save_index(self):
+        if not self._index_changed:
+            return
+        temporary_path = f'{self._index_path}.{threading.get_ident()}.tmp'
+        with open(temporary_path, 'w', encoding='utf-8') as f:
+            json.dump(self._index, f)
+        os.replace(temporary_path, self._index_path)
+        self._index_changed = False
+
+    def flush(self):
+        """Persists last access times updated by cache hits"""
+        with self._lock:
+            self._save_index()
+
+    def log_stats(self):
+        requests = self.hits + self.misses
+        hit_rate = self.hits / requests * 100 if requests else 0.0
+        logging.info(f"PDF cache: {self.hits} hits, {self.misses} misses ({hit_rate:.1f}% hit rate), {self.bytes_saved} bytes saved")
+
+    def reset_stats(self):
+        self.hits = 0
+        self.misses = 0
+        self.bytes_saved = 0
+
+_pdf_cache = None
+_pdf_cache_lock = threading.Lock()
+
+def get_pdf_cache():
+    """Returns the process wide PdfCache, or None when PDF_CACHE_DIR is empty (cache disabled)"""
+    global _pdf_cache
+    if not PDF_CACHE_DIR:
+        return None
+    with _pdf_cache_lock:
+        if _pdf_cache is None:
+            _pdf_cache = PdfCache()
+    return _pdf_cache
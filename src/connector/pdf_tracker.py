@@ -0,0 +1,91 @@
+# connector/pdf_tracker.py
+# Processed pdf link tracker, stored as one append blob per bulletin month (keyed off the daily_DD-MM-YYYY.pdf name),
+# so a run only reads the months of the links on the listing page and only uploads the links it added.
+import logging
+from src.configuration.configuration import STATUS_FILE, TRACKER_PREFIX
+from src.utils.link_utils import get_bulletin_date
+
+MIGRATION_MARKER = TRACKER_PREFIX + '_migrated'
+
+def get_month_shard_name(year, month):
+    return f'{TRACKER_PREFIX}{year}-{month:02d}.txt'
+
+def get_shard_name(pdf_link):
+    """Returns the tracker shard holding pdf_link, eg: processed_pdfs/2024-08.txt for .../daily_21-08-2024.pdf"""
+    bulletin_date = get_bulletin_date(pdf_link)
+    if bulletin_date is None:
+        return TRACKER_PREFIX + 'undated.txt'
+    return get_month_shard_name(bulletin_date.year, bulletin_date.month)
+
+def parse_links(tracker_string: str):
+    """Expects a string consisting of pdf_link lines, returns it as a set"""
+    return {line.strip() for line in tracker_string.split('\n') if line.strip()}
+
+def migrate_legacy_tracker(blob_store):
+    """Splits the single processed_pdfs.txt tracker into month shards, once. Later runs only check the marker blob."""
+    if blob_store.exists(MIGRATION_MARKER):
+        return
+    legacy_tracker = blob_store.read(STATUS_FILE)
+    if legacy_tracker:
+        shards = {}
+        for pdf_link in parse_links(legacy_tracker.decode('utf-8')):
+            shards.setdefault(get_shard_name(pdf_link), []).append(pdf_link)
+        for shard_name, pdf_links in shards.items():
+            blob_store.append(shard_name, ('\n'.join(sorted(pdf_links)) + '\n').encode('utf-8'))
+        logging.info(f"Migrated {STATUS_FILE} into {len(shards)} tracker shards")
+    blob_store.write(MIGRATION_MARKER, b'')
+
+class ProcessedPdfTracker:
+    """Set-like view of the processed pdf links. Shards are loaded on first use (or up front with load()),
+    after which lookups are O(1). New links are kept pending until commit() appends them to their shards.
+    """
+
+    def __init__(self, blob_store):
+        self.blob_store = blob_store
+        self._links = set()
+        self._loaded_shards = set()
+        self._pending = {}
+
+    def _load_shard(self, shard_name):
+        shard = self.blob_store.read(shard_name)
+        if shard:
+            self._links |= parse_links(shard.decode('utf-8'))
+        self._loaded_shards.add(shard_name)
+
+    def load(self, pdf_links=()):
+        """Loads the shards covering pdf_links (migrating the legacy tracker first if needed)"""
+        migrate_legacy_tracker(self.blob_store)
+        for shard_name in {get_shard_name(pdf_link) for pdf_link in pdf_links} - self._loaded_shards:
+            self._load_shard(shard_name)
+
+    def links_between(self, start_date, end_date):
+        """Returns the processed links with a bulletin date from start_date to end_date (inclusive), oldest first"""
+        year, month = start_date.year, start_date.month
+        while (year, month) <= (end_date.year, end_date.month):
+            shard_name = get_month_shard_name(year, month)
+            if shard_name not in self._loaded_shards:
+                self._load_shard(shard_name)
+            year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+        links = [(get_bulletin_date(pdf_link), pdf_link) for pdf_link in self._links]
+        return [pdf_link for bulletin_date, pdf_link in sorted(links)
+                if bulletin_date is not None and start_date <= bulletin_date <= end_date]
+
+    def __contains__(self, pdf_link):
+        shard_name = get_shard_name(pdf_link)
+        if shard_name not in self._loaded_shards:
+            self._load_shard(shard_name)
+        return pdf_link in self._links
+
+    def add(self, pdf_link):
+        if pdf_link not in self:
+            self._links.add(pdf_link)
+            self._pending.setdefault(get_shard_name(pdf_link), []).append(pdf_link)
+
+    def commit(self):
+        """Appends the links added since the last commit to their shards. Returns the number of links committed."""
+        committed = 0
+        for shard_name, pdf_links in list(self._pending.items()):
+            self.blob_store.append(shard_name, ('\n'.join(pdf_links) + '\n').encode('utf-8'))
+            committed += len(pdf_links)
+            del self._pending[shard_name]
+        return committed
@@ -0,0 +1,144 @@
+# connector/range_reader.py
+# Seekable read-only file object over a PDF url, backed by HTTP Range requests. Only the blocks that are actually read
+# are fetched (and cached), so opening a bulletin and extracting its first page transfers the trailer, the xref and the
+# objects of the first page instead of the whole file. Servers that ignore Range get a single full download.
+# pdfplumber/pdfminer and PDFium read from it like from a local file.
+import io
+import logging
+from src.connector.url_connector import get_http_session
+from src.configuration.configuration import RANGE_READ_BLOCK_SIZE, DOWNLOAD_TIMEOUT
+
+class HttpRangeReader(io.RawIOBase):
+    """The first request (the last block of the file, where the trailer and xref start) is made on construction, so a
+    missing PDF raises requests.HTTPError right away. Afterwards reads fetch the missing blocks of the requested range,
+    consecutive missing blocks in a single request. bytes_fetched/requests vs size report what the reads cost.
+    """
+
+    def __init__(self, url, block_size=RANGE_READ_BLOCK_SIZE, timeout=DOWNLOAD_TIMEOUT):
+        super().__init__()
+        self.url = url
+        self.block_size = block_size
+        self.timeout = timeout
+        self.position = 0
+        self.blocks = {} # block index -> bytes (the last block may be shorter)
+        self.bytes_fetched = 0
+        self.requests = 0
+        self.ranges_supported = True
+        self._tail = None # (offset, bytes) of the first response when it doesn't start on a block boundary
+        self._open()
+
+    def _get(self, headers):
+        response = get_http_session().get(self.url, headers=headers, timeout=self.timeout)
+        response.raise_for_status()
+        self.requests += 1
+        self.bytes_fetched += len(response.content)
+        return response
+
+    def _open(self):
+        response = self._get({'Range': f'bytes=-{self.block_size}'})
+        content_range = response.headers.get('Content-Range', '')
+        if response.status_code != 206 or '/' not in content_range:
+            # the server ignored the range: this was a full download, serve every read from it
+            logging.info(f"{self.url}: server ignores Range requests, downloaded the whole file")
+            self.ranges_supported = False
+            self.size = len(response.content)
+            self._store(0, response.content)
+            return
+        self.size = int(content_range.rsplit('/', 1)[1])
+        start = self.size - len(response.content)
+        first_block = -(-start // self.block_size) # the suffix may start mid block: keep the complete blocks only
+        self._store(first_block * self.block_size, response.content[first_block * self.block_size - start:])
+        if start % self.block_size:
+            self._tail = (start, response.content)
+
+    def _store(self, offset, data):
+        for i in range(0, len(data), self.block_size):
+            self.blocks[(offset + i) // self.block_size] = data[i:i + self.block_size]
+
+    def _fetch_blocks(self, first, last):
+        """Fetches blocks first..last (inclusive), skipping the ones already cached"""
+        missing = [index for index in range(first, last + 1) if index not in self.blocks]
+        while missing:
+            run_end = 0
+            while run_end + 1 < len(missing) and missing[run_end + 1] == missing[run_end] + 1:
+                run_end += 1
+            start = missing[0] * self.block_size
+            end = min((missing[run_end] + 1) * self.block_size, self.size) - 1
+            response = self._get({'Range': f'bytes={start}-{end}'})
+            if response.status_code != 206:
+                raise IOError(f"{self.url}: expected a partial response to a Range request, got {response.status_code}")
+            self._store(start, response.content)
+            missing = missing[run_end + 1:]
+
+    def _read_range(self, start, end):
+        """Bytes [start, end) of the file"""
+        if self._tail is not None and start >= self._tail[0]:
+            tail_start, tail = self._tail
+            return tail[start - tail_start:end - tail_start]
+        first, last = start // self.block_size, (end - 1) // self.block_size
+        self._fetch_blocks(first, last)
+        data = b''.join(self.blocks[index] for index in range(first, last + 1))
+        offset = first * self.block_size
+        return data[start - offset:end - offset]
+
+    # io.RawIOBase interface
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self.position
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_SET:
+            self.position = offset
+        elif whence == io.SEEK_CUR:
+            self.position += offset
+        elif whence == io.SEEK_END:
+            self.position = self.size + offset
+        else:
+            raise ValueError(f"invalid whence ({whence})")
+        if self.position < 0:
+            raise ValueError("negative seek position")
+        return self.position
+
+    def readinto(self, buffer):
+        end = min(self.position + len(buffer), self.size)
+        if end <= self.position:
+            return 0
+        data = self._read_range(self.position, end)
+        buffer[:len(data)] = data
+        self.position += len(data)
+        return len(data)
+
+    def readall(self):
+        return self.read(max(self.size - self.position, 0))
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            size = max(self.size - self.position, 0)
+        end = min(self.position + size, self.size)
+        if end <= self.position:
+            return b''
+        data = self._read_range(self.position, end)
+        self.position += len(data)
+        return data
+
+    def getvalue(self):
+        """The whole file (fetches the blocks not read yet)"""
+        return self._read_range(0, self.size) if self.size else b''
+
+    def get_fetch_stats(self):
+        return {'bytes_fetched': self.bytes_fetched, 'size': self.size, 'requests': self.requests,
+                'ranges_supported': self.ranges_supported}
+
+    def __getstate__(self):
+        # picklable for the extraction process pool: the cached blocks go along, the worker fetches the rest itself
+        return {name: value for name, value in self.__dict__.items() if not name.startswith('_io')}
+
+    def __setstate__(self, state):
+        super().__init__()
+        self.__dict__.update(state)
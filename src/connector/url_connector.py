@@ -1,4 +1,24 @@
+import threading
 import requests
+from requests.adapters import HTTPAdapter
+from src.configuration.configuration import DOWNLOAD_CONCURRENCY
+
+_session = None
+_session_lock = threading.Lock()
+
+def get_http_session():
+    """Returns a process wide requests.Session whose connection pool is large enough for DOWNLOAD_CONCURRENCY
+    parallel downloads, so connections to the same host are kept alive and reused between requests.
+    """
+    global _session
+    with _session_lock:
+        if _session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=4, pool_maxsize=DOWNLOAD_CONCURRENCY)
+            session.mount('https://', adapter)
+            session.mount('http://', adapter)
+            _session = session
+    return _session
 
 def fetch_url(url):
     response = requests.get(url)
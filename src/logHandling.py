@@ -1,33 +1,143 @@
-import logging
-import sys
-
-format_string = "[%(asctime)s: %(levelname)s: %(module)s: %(message)s]"
-
-log_messages = []
-
-# make custom logging.Handler inherited class to store log messages in the log_messages list
-class ListHandler(logging.Handler):
-
-    def emit(self, record):
-        log_entry = self.format(record)
-        log_messages.append(log_entry)
-
-
-list_handler = ListHandler()
-
-
-logging.basicConfig(
-    level = logging.INFO,
-    format = format_string,
-
-    handlers=[
-        logging.StreamHandler(sys.stdout),    # To send logs to terminal output
-        list_handler
-        # logging.FileHandler(log_filepath)
-    ]
-)
-
-
-
-logging.getLogger('azure').setLevel('WARNING') # otherwise Azure info logs are too numerous
-
+import sys
+import time
+import logging
+import threading
+from collections import deque
+from src.configuration.configuration import LOG_BUFFER_MAX_RECORDS, LOG_FLUSH_INTERVAL_SECONDS, LOG_FLUSH_BYTES, LOG_UPLOAD_CHUNK_BYTES
+
+format_string = "[%(asctime)s: %(levelname)s: %(module)s: %(message)s]"
+
+class LogShipper(logging.Handler):
+    """Ships the log records of a run to an append blob in chunks.
+
+    Formatted records wait in a ring buffer of at most max_records (the oldest are dropped when it is full). Until
+    start() is called nothing is uploaded, so a run that turns out to be a no-op can drop its log with reset().
+    After start() a background thread appends the buffered records to the log blob every flush_interval seconds,
+    or as soon as flush_bytes are waiting. finish() ships the rest and resets the shipper for the next invocation.
+    """
+
+    def __init__(self, max_records=LOG_BUFFER_MAX_RECORDS, flush_interval=LOG_FLUSH_INTERVAL_SECONDS,
+                 flush_bytes=LOG_FLUSH_BYTES, chunk_bytes=LOG_UPLOAD_CHUNK_BYTES):
+        super().__init__()
+        self.flush_interval = flush_interval
+        self.flush_bytes = flush_bytes
+        self.chunk_bytes = chunk_bytes
+        self._records = deque(maxlen=max_records)
+        self._upload_lock = threading.Lock()
+        self._flush_requested = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = None
+        self.blob_store = None
+        self.blob_name = None
+        self.reset()
+
+    def reset(self):
+        """Drops the buffered records and stops shipping (between invocations of a warm Functions host)"""
+        self._stop_thread()
+        self._records.clear()
+        self._pending_bytes = 0
+        self._failed_chunk = None
+        self.dropped_records = 0
+        self.bytes_shipped = 0
+        self.blob_store = None
+        self.blob_name = None
+
+    def emit(self, record):
+        try:
+            log_entry = self.format(record)
+        except Exception:
+            self.handleError(record)
+            return
+        self._buffer(log_entry)
+
+    def _buffer(self, log_entry):
+        log_entry = (log_entry + '\n').encode('utf-8')
+        if len(log_entry) > self.chunk_bytes: # a single record never spans two appends
+            log_entry = log_entry[:self.chunk_bytes - 1].decode('utf-8', 'ignore').encode('utf-8') + b'\n'
+        if len(self._records) == self._records.maxlen:
+            self.dropped_records += 1
+        self._records.append(log_entry)
+        self._pending_bytes += len(log_entry)
+        if self.blob_store is not None and self._pending_bytes >= self.flush_bytes:
+            self._flush_requested.set()
+
+    def start(self, blob_store, blob_name):
+        """Ships the records buffered so far and everything logged from now on to the append blob blob_name"""
+        self.blob_store = blob_store
+        self.blob_name = blob_name
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._run, name='log-shipper', daemon=True)
+        self._thread.start()
+        self._flush_requested.set()
+
+    def _run(self):
+        while not self._stopped.is_set():
+            self._flush_requested.wait(self.flush_interval)
+            self._flush_requested.clear()
+            self.ship()
+
+    def _next_chunk(self):
+        lines = []
+        size = 0
+        while self._records and size + len(self._records[0]) <= self.chunk_bytes:
+            line = self._records.popleft()
+            lines.append(line)
+            size += len(line)
+        self._pending_bytes = max(self._pending_bytes - size, 0)
+        return b''.join(lines)
+
+    def ship(self):
+        """Appends the buffered records to the log blob, one chunk per append. A chunk that failed to upload is
+        kept and retried first by the next call.
+        """
+        if self.blob_store is None:
+            return
+        with self._upload_lock:
+            while True:
+                chunk = self._failed_chunk or self._next_chunk()
+                if not chunk:
+                    return
+                try:
+                    self.bytes_shipped += self.blob_store.append(self.blob_name, chunk)
+                    self._failed_chunk = None
+                except Exception as e:
+                    self._failed_chunk = chunk
+                    print(f"Could not ship the log to {self.blob_name}: {e}", file=sys.stderr) # not logged: would recurse
+                    return
+
+    def _stop_thread(self):
+        if self._thread is not None:
+            self._stopped.set()
+            self._flush_requested.set()
+            self._thread.join()
+            self._thread = None
+
+    def finish(self):
+        """Ships the remaining records and resets the shipper. Returns the number of bytes shipped in the run."""
+        self._stop_thread()
+        if self.dropped_records:
+            self._buffer(f"[{time.strftime('%Y-%m-%d %H:%M:%S')}: WARNING: logHandling: "
+                         f"{self.dropped_records} log records dropped, the log buffer was full]")
+        self.ship()
+        bytes_shipped = self.bytes_shipped
+        self.reset()
+        return bytes_shipped
+
+
+log_shipper = LogShipper()
+
+
+logging.basicConfig(
+    level = logging.INFO,
+    format = format_string,
+
+    handlers=[
+        logging.StreamHandler(sys.stdout),    # To send logs to terminal output
+        log_shipper
+        # logging.FileHandler(log_filepath)
+    ]
+)
+
+
+
+logging.getLogger('azure').setLevel('WARNING') # otherwise Azure info logs are too numerous
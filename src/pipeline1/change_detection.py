@@ -0,0 +1,141 @@
+# Per-row change detection for the csv and Cosmos DB sinks. Every written row is recorded as "<document id> <content hash>"
+# in an append blob next to its monthly csv (2024-7.csv -> 2024-7.hashes), so reprocessing a bulletin (after a crash, or
+# after the processed pdf tracker was lost) only writes the rows that are new or whose prices changed.
+# A row is first recorded as "<document id> <content hash> csv" once it is in the csv, so when the Cosmos DB write fails
+# afterwards, the retry only writes it to Cosmos DB instead of appending it to the csv again.
+import io
+import logging
+import pandas as pd
+from src.connector.blob import get_monthly_csv_name
+from src.pipeline1.data_format_converter import get_row_hashes
+from src.configuration.configuration import ROW_HASH_INDEX_EXTENSION
+
+CSV_ONLY_MARKER = 'csv' # third field of an index line: the row is in the csv but not yet in Cosmos DB
+
+def get_row_hash_index_name(csv_name):
+    """eg: 2024-7.csv -> 2024-7.hashes"""
+    return csv_name.rsplit('.', 1)[0] + ROW_HASH_INDEX_EXTENSION
+
+def parse_row_hash_index(index_string: str):
+    """Returns {document id: (content hash, written to both sinks)}. Later lines win: a changed row is recorded again
+    with its new hash, and a row recorded as csv only is completed by a later line without the marker.
+    """
+    row_hashes = {}
+    for line in index_string.split('\n'):
+        parts = line.split()
+        if len(parts) == 2:
+            row_hashes[parts[0]] = (parts[1], True)
+        elif len(parts) == 3 and parts[2] == CSV_ONLY_MARKER:
+            row_hashes[parts[0]] = (parts[1], False)
+    return row_hashes
+
+def format_row_hash_lines(rows, marker=''):
+    suffix = f' {marker}' if marker else ''
+    return ''.join(f'{document_id} {content_hash}{suffix}\n' for document_id, content_hash in rows).encode('utf-8')
+
+class RowClaim:
+    """The rows of one bulletin claimed by select_changed_rows: [document id, content hash, previous state, needs csv]"""
+
+    def __init__(self, csv_name):
+        self.csv_name = csv_name
+        self.rows = []
+
+class RowHashIndex:
+    """Content hashes of the rows already written, loaded per month on first use.
+
+    select_changed_rows() claims the new/changed rows of a DataFrame right away (so a second copy of the same bulletin
+    processed concurrently in the run is skipped). record_csv() and record() append them to the index blob once they
+    are written to the csv and to Cosmos DB, release() gives the claim back when writing failed.
+    With rewrite_cosmos all rows go to Cosmos DB, also the unchanged ones (eg: to load history into a new container);
+    the csv still only gets the new or changed rows.
+    """
+
+    def __init__(self, blob_store, rewrite_cosmos=False):
+        self.blob_store = blob_store
+        self.rewrite_cosmos = rewrite_cosmos
+        self._months = {}
+        self.rows_written = 0
+        self.rows_skipped = 0
+
+    def _bootstrap_from_csv(self, csv_name):
+        """Hashes of the rows of a monthly csv written before change detection existed (to both sinks, by that code).
+        Creates the index blob, also when there is nothing to index, so the csv is only indexed this once.
+        """
+        row_hashes = {}
+        csv_data = self.blob_store.read(csv_name)
+        if csv_data:
+            try:
+                df = pd.read_csv(io.BytesIO(csv_data), parse_dates=['Date'])
+                row_hashes = dict(get_row_hashes(df))
+                logging.info(f"Indexed {len(row_hashes)} existing rows of {csv_name}")
+            except Exception as e:
+                logging.warning(f"Could not index the existing rows of {csv_name}, treating them as unknown: {e}")
+        self.blob_store.append(get_row_hash_index_name(csv_name), format_row_hash_lines(row_hashes.items()))
+        return {document_id: (content_hash, True) for document_id, content_hash in row_hashes.items()}
+
+    def _load_month(self, csv_name):
+        if csv_name not in self._months:
+            index_data = self.blob_store.read(get_row_hash_index_name(csv_name))
+            if index_data is None:
+                self._months[csv_name] = self._bootstrap_from_csv(csv_name)
+            else:
+                self._months[csv_name] = parse_row_hash_index(index_data.decode('utf-8'))
+        return self._months[csv_name]
+
+    def select_changed_rows(self, df, actual_date_str):
+        """Returns (DataFrame of the rows to append to the csv, DataFrame of the rows to write to Cosmos DB, claim).
+        The csv rows are the new or changed rows; Cosmos DB also gets the rows that only made it into the csv before.
+        """
+        claim = RowClaim(get_monthly_csv_name(actual_date_str))
+        known_rows = self._load_month(claim.csv_name)
+
+        needs_csv = []
+        needs_cosmos = []
+        for document_id, content_hash in get_row_hashes(df):
+            previous = known_rows.get(document_id)
+            unchanged = previous is not None and previous[0] == content_hash
+            needs_csv.append(not unchanged)
+            needs_index = not unchanged or not previous[1]
+            needs_cosmos.append(needs_index or self.rewrite_cosmos)
+            if needs_index:
+                claim.rows.append([document_id, content_hash, previous, needs_csv[-1]])
+                known_rows[document_id] = (content_hash, True)
+
+        self.rows_skipped += len(needs_cosmos) - sum(needs_cosmos)
+        return df[needs_csv].reset_index(drop=True), df[needs_cosmos].reset_index(drop=True), claim
+
+    def record_csv(self, *claims):
+        """Appends the claimed rows that went to the csv to the index blob (as csv only), after the csv append.
+        Several claims (of the same month) are recorded in a single append.
+        """
+        csv_rows = [row for claim in claims for row in claim.rows if row[3]]
+        if csv_rows:
+            self.blob_store.append(get_row_hash_index_name(claims[0].csv_name),
+                                   format_row_hash_lines(((row[0], row[1]) for row in csv_rows), CSV_ONLY_MARKER))
+        for row in csv_rows:
+            row[2], row[3] = (row[1], False), False # a release from here on leaves the row as csv only
+
+    def record(self, *claims):
+        """Appends the claimed rows to the month's index blob, after they were written to both sinks.
+        Several claims (of the same month) are recorded in a single append.
+        """
+        rows = [row for claim in claims for row in claim.rows]
+        if rows:
+            self.blob_store.append(get_row_hash_index_name(claims[0].csv_name),
+                                   format_row_hash_lines((row[0], row[1]) for row in rows))
+        self.rows_written += len(rows)
+
+    def release(self, claim):
+        """Gives the claimed rows back so they are written again by a later attempt"""
+        known_rows = self._months[claim.csv_name]
+        for document_id, _, previous, _ in claim.rows:
+            if previous is None:
+                known_rows.pop(document_id, None)
+            else:
+                known_rows[document_id] = previous
+
+    def get_summary(self):
+        return {'rows_written': self.rows_written, 'rows_skipped': self.rows_skipped}
+
+    def log_summary(self):
+        logging.info(f"Change detection: {self.rows_written} rows written, {self.rows_skipped} unchanged rows skipped")
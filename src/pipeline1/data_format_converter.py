@@ -1,13 +1,15 @@
 # csv_data.py
 import uuid
+import hashlib
+import numpy as np
 import pandas as pd
 from io import StringIO
-from src.configuration.configuration import date_col
+from src.configuration.configuration import date_col, COSMOS_PARTITION_SCHEME, COSMOS_PARTITION_SCHEMES
 
 def dataframe_to_csv_string(df, date_column=date_col, row_index=1):
    
         # Retrieve the date from the DataFrame (adjust indexing as needed)
-        actual_date = df.loc[row_index, date_column]
+        actual_date = df.loc[row_index, date_column] if row_index in df.index else df[date_column].iloc[0]
         
         # Ensure the date is in the correct format (if it's not already a string)
         if not isinstance(actual_date, str):
@@ -18,8 +20,8 @@ def dataframe_to_csv_string(df, date_column=date_col, row_index=1):
         # Create a StringIO object to hold the CSV data
         csv_buffer = StringIO()
 
-        # Save the DataFrame to the StringIO object
-        df.to_csv(csv_buffer, index=False)
+        # Save the DataFrame to the StringIO object (prices with two decimals, as printed in the bulletin)
+        df.to_csv(csv_buffer, index=False, float_format='%.2f')
 
         # Get the CSV data as a string
         csv_data = csv_buffer.getvalue()
@@ -27,29 +29,92 @@ def dataframe_to_csv_string(df, date_column=date_col, row_index=1):
         return csv_data, actual_date_str
 
     
-def convert_dataframe_to_cosmos_format(df):
-    cosmos_db_hartidata = []
-    
-    required_columns = ['Date', 'Category','Page', 'Pettah Average', 'Pettah_Min_Value', 'Pettah_Max_Value']
-    
-    # Check if all required columns are present
-    if not all(col in df.columns for col in required_columns):
-        raise KeyError(f"One or more required columns are missing: {required_columns}")
-    
-    for _, row in df.iterrows():
-  
-            # Assuming 'Date' column is in datetime format or can be parsed to datetime
-            date_str = row['Date'].isoformat()  # Convert datetime to ISO 8601 format
-            rate_document = {
-                "id": str(uuid.uuid4()),
-                "date": date_str,
-                "category": row['Category'],
-                "item": row['Item'],
-                "page": row['Page'],
-                "pettah_average": float(row['Pettah Average']) if pd.notna(row['Pettah Average']) else None,
-                "pettah_min_value": float(row['Pettah_Min_Value']) if pd.notna(row['Pettah_Min_Value']) else None,
-                "pettah_max_value": float(row['Pettah_Max_Value']) if pd.notna(row['Pettah_Max_Value']) else None,
-            }
-            cosmos_db_hartidata.append(rate_document)
-
-    return cosmos_db_hartidata
+# Namespace of the deterministic document ids, do not change: it would give every document a new id
+COSMOS_ID_NAMESPACE = uuid.UUID('7d3c1f4e-2b6a-5c8d-9e0f-1a2b3c4d5e6f')
+
+COSMOS_REQUIRED_COLUMNS = ['Date', 'Category', 'Item', 'Page', 'Pettah Average', 'Pettah_Min_Value', 'Pettah_Max_Value']
+
+def get_document_id(date_str, category, item, page):
+    """Same price row, same id: re-processing a bulletin upserts its documents instead of duplicating them.
+    Equal to str(uuid.uuid5(COSMOS_ID_NAMESPACE, name)), without building a UUID object per row.
+    """
+    name = f'{date_str}|{category or ""}|{item}|{page}'
+    digest = bytearray(hashlib.sha1(COSMOS_ID_NAMESPACE.bytes + name.encode('utf-8')).digest()[:16])
+    digest[6] = (digest[6] & 0x0f) | 0x50 # version 5
+    digest[8] = (digest[8] & 0x3f) | 0x80 # RFC 4122 variant
+    hex_id = digest.hex()
+    return f'{hex_id[:8]}-{hex_id[8:12]}-{hex_id[12:16]}-{hex_id[16:20]}-{hex_id[20:]}'
+
+def get_partition_key_value(date_str, category, item, partition_scheme=COSMOS_PARTITION_SCHEME):
+    """Partition key ("pk" field) of a document: 'item' gives '<category>|<item>' (the price history of an item in one
+    logical partition), 'month' the bulletin month as 'YYYY-MM' (the documents of a bulletin in one partition)
+    """
+    if partition_scheme == 'item':
+        return f'{category or ""}|{item}'
+    if partition_scheme == 'month':
+        return date_str[:7]
+    raise ValueError(f"Unknown Cosmos DB partition scheme '{partition_scheme}', expected one of {COSMOS_PARTITION_SCHEMES}")
+
+def _column_values(column):
+    """Column as a list of Python objects with missing values as None"""
+    values = column.astype(object)
+    return values.where(column.notna(), None).tolist()
+
+def _float_values(column):
+    """Numeric column as a list of Python floats with missing values as None"""
+    values = column.to_numpy(dtype=np.float64, na_value=np.nan)
+    return np.where(np.isnan(values), None, values).tolist()
+
+def _document_columns(df):
+    """The document fields of every row as lists of Python values: date strings, categories, items, pages and the
+    three prices. The conversions run once per column, not per cell.
+    """
+    if not all(col in df.columns for col in COSMOS_REQUIRED_COLUMNS):
+        raise KeyError(f"One or more required columns are missing: {COSMOS_REQUIRED_COLUMNS}")
+
+    # a bulletin has one date, so only the distinct dates are formatted
+    date_codes, distinct_dates = pd.factorize(df['Date'], use_na_sentinel=False)
+    distinct_date_strs = np.array([date.isoformat() for date in distinct_dates], dtype=object)
+    dates = distinct_date_strs[date_codes].tolist()
+    categories = _column_values(df['Category'])
+    items = _column_values(df['Item'])
+    pages = df['Page'].tolist()
+    pettah_averages = _float_values(df['Pettah Average'])
+    pettah_min_values = _float_values(df['Pettah_Min_Value'])
+    pettah_max_values = _float_values(df['Pettah_Max_Value'])
+    return dates, categories, items, pages, pettah_averages, pettah_min_values, pettah_max_values
+
+def get_row_hashes(df):
+    """Returns a (document id, content hash) pair per row. The id identifies the row (date/category/item/page),
+    the hash changes when any of its prices change.
+    """
+    row_hashes = []
+    for date_str, category, item, page, pettah_average, pettah_min_value, pettah_max_value in zip(*_document_columns(df)):
+        content = f'{pettah_average}|{pettah_min_value}|{pettah_max_value}'
+        row_hashes.append((get_document_id(date_str, category, item, page),
+                           hashlib.sha1(content.encode('utf-8')).hexdigest()[:16]))
+    return row_hashes
+
+def iter_cosmos_documents(df, partition_scheme=COSMOS_PARTITION_SCHEME):
+    """Lazily yields the Cosmos DB document of each row. The column conversions (iso dates, floats, missing values)
+    are done once per column up front, only the dict assembly and the id happen per row.
+    The partition key value of partition_scheme is added as the "pk" field (partition_scheme 'none' leaves it out).
+    """
+    for date_str, category, item, page, pettah_average, pettah_min_value, pettah_max_value in zip(*_document_columns(df)):
+        document = {
+            "id": get_document_id(date_str, category, item, page),
+            "date": date_str,
+            "category": category,
+            "item": item,
+            "page": page,
+            "pettah_average": pettah_average,
+            "pettah_min_value": pettah_min_value,
+            "pettah_max_value": pettah_max_value,
+        }
+        if partition_scheme != 'none':
+            document["pk"] = get_partition_key_value(date_str, category, item, partition_scheme)
+        yield document
+
+def convert_dataframe_to_cosmos_format(df, partition_scheme=COSMOS_PARTITION_SCHEME):
+    """Returns the list of Cosmos DB documents of the DataFrame, see iter_cosmos_documents"""
+    return list(iter_cosmos_documents(df, partition_scheme))
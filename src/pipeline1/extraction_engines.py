@@ -0,0 +1,142 @@
+# Text extraction engines. All take a PDF file-like object (or bytes) and return the first page text (the page variants:
+# the text of each requested page) with one table row per line, the layout parse_text expects. Select one with the
+# EXTRACTION_ENGINE setting;
+# tests/engine_benchmark.py checks which engines give identical rows to pdfplumber and how fast they are.
+import io
+import time
+import pdfplumber
+import pypdfium2
+from PyPDF2 import PdfReader
+from pdfminer.layout import LAParams
+from pdfminer.converter import TextConverter
+from pdfminer.pdfinterp import PDFResourceManager, PDFPageInterpreter
+from pdfminer.pdfpage import PDFPage
+
+# A large char_margin joins the characters of a table row into one text line even across the wide gaps between columns,
+# boxes_flow=None keeps the lines in top to bottom order like pdfplumber
+PDFMINER_LAPARAMS = LAParams(char_margin=100, line_margin=0.5, boxes_flow=None)
+
+def _as_file(pdf_data):
+    return io.BytesIO(pdf_data) if isinstance(pdf_data, bytes) else pdf_data
+
+def _as_pdfium_input(pdf_data):
+    # PDFium copies bytes into its own buffer; other file objects (eg: an HttpRangeReader) are read from as needed
+    return pdf_data.getvalue() if isinstance(pdf_data, io.BytesIO) else pdf_data
+
+def extract_pages_with_pdfplumber(pdf_data, page_numbers):
+    """Full character layout analysis (the original engine, slowest)"""
+    page_texts = {}
+    with pdfplumber.open(_as_file(pdf_data)) as pdf:
+        for page_number in page_numbers:
+            if page_number <= len(pdf.pages):
+                page = pdf.pages[page_number - 1]
+                page_texts[page_number] = page.extract_text()
+                page.close() # drops the parsed objects of the page
+    return page_texts
+
+def extract_pages_with_pdfminer(pdf_data, page_numbers):
+    """pdfminer.six layout analysis of the requested pages only, with LAParams tuned for the bulletin tables"""
+    page_texts = {}
+    resource_manager = PDFResourceManager(caching=True)
+    with io.StringIO() as output:
+        device = TextConverter(resource_manager, output, laparams=PDFMINER_LAPARAMS)
+        interpreter = PDFPageInterpreter(resource_manager, device)
+        for index, page in enumerate(PDFPage.get_pages(_as_file(pdf_data), maxpages=max(page_numbers))):
+            if index + 1 in page_numbers:
+                interpreter.process_page(page)
+                page_texts[index + 1] = output.getvalue()
+                output.seek(0)
+                output.truncate()
+    return page_texts
+
+def extract_pages_with_pypdfium2(pdf_data, page_numbers):
+    """Text only extraction by PDFium (C++), no Python side layout analysis"""
+    page_texts = {}
+    pdf = pypdfium2.PdfDocument(_as_pdfium_input(pdf_data))
+    try:
+        for page_number in page_numbers:
+            if page_number <= len(pdf):
+                page = pdf[page_number - 1]
+                text_page = page.get_textpage()
+                page_texts[page_number] = text_page.get_text_range().replace('\r\n', '\n')
+                text_page.close()
+                page.close()
+    finally:
+        pdf.close()
+    return page_texts
+
+def extract_pages_with_pypdf2(pdf_data, page_numbers):
+    """Text only extraction by PyPDF2 (pure Python)"""
+    pages = PdfReader(_as_file(pdf_data)).pages
+    return {page_number: pages[page_number - 1].extract_text() for page_number in page_numbers if page_number <= len(pages)}
+
+def extract_with_pdfplumber(pdf_data):
+    return extract_pages_with_pdfplumber(pdf_data, [1])[1]
+
+def extract_with_pdfminer(pdf_data):
+    return extract_pages_with_pdfminer(pdf_data, [1])[1]
+
+def extract_with_pypdfium2(pdf_data):
+    return extract_pages_with_pypdfium2(pdf_data, [1])[1]
+
+def extract_with_pypdf2(pdf_data):
+    return extract_pages_with_pypdf2(pdf_data, [1])[1]
+
+def extract_header_text(pdf_data, header_fraction):
+    """Text of the top header_fraction of the first page, read with PDFium (a few ms, independent of the engine).
+    Used to decide whether a PDF is worth a full extraction.
+    """
+    pdf = pypdfium2.PdfDocument(_as_pdfium_input(pdf_data))
+    try:
+        page = pdf[0]
+        width, height = page.get_size()
+        text_page = page.get_textpage()
+        header_text = text_page.get_text_bounded(left=0, bottom=height * (1 - header_fraction), right=width, top=height)
+        text_page.close()
+        page.close()
+    finally:
+        pdf.close()
+    return header_text.replace('\r\n', '\n')
+
+EXTRACTION_ENGINES = {
+    'pdfplumber': extract_with_pdfplumber,
+    'pdfminer': extract_with_pdfminer,
+    'pypdfium2': extract_with_pypdfium2,
+    'pypdf2': extract_with_pypdf2,
+}
+
+# Same engines for a set of pages of one opened PDF: take the PDF and page numbers (1 based), return {page number: text}
+# for the requested pages the PDF has
+PAGE_EXTRACTION_ENGINES = {
+    'pdfplumber': extract_pages_with_pdfplumber,
+    'pdfminer': extract_pages_with_pdfminer,
+    'pypdfium2': extract_pages_with_pypdfium2,
+    'pypdf2': extract_pages_with_pypdf2,
+}
+
+def get_extraction_engine(name):
+    try:
+        return EXTRACTION_ENGINES[name]
+    except KeyError:
+        raise ValueError(f"Unknown extraction engine '{name}', expected one of {list(EXTRACTION_ENGINES)}")
+
+def get_page_extraction_engine(name):
+    get_extraction_engine(name) # same error for an unknown name
+    return PAGE_EXTRACTION_ENGINES[name]
+
+def benchmark_engines(sample_pdfs, parse_rows, reference_engine='pdfplumber'):
+    """Runs every engine over sample_pdfs (a list of PDF bytes). parse_rows turns extracted text into rows.
+    Returns {engine name: (seconds, rows identical to reference_engine)}.
+    """
+    reference_rows = [parse_rows(EXTRACTION_ENGINES[reference_engine](pdf_bytes)) for pdf_bytes in sample_pdfs]
+    results = {}
+    for name, engine in EXTRACTION_ENGINES.items():
+        start = time.perf_counter()
+        rows = [parse_rows(engine(pdf_bytes)) for pdf_bytes in sample_pdfs]
+        results[name] = (time.perf_counter() - start, rows == reference_rows)
+    return results
+
+def select_fastest_engine(benchmark_results):
+    """Name of the fastest engine that passed the equivalence check of benchmark_engines"""
+    passing_engines = {name: seconds for name, (seconds, identical) in benchmark_results.items() if identical}
+    return min(passing_engines, key=passing_engines.get)
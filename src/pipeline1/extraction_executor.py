@@ -0,0 +1,159 @@
+# Runs the CPU bound text extraction (first page, or a set of pages per bulletin) off the event loop, in a process pool
+import io
+import os
+import time
+import asyncio
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from src.configuration.configuration import (EXTRACTION_WORKERS, EXTRACTION_ENGINE, EXTRACTION_PAGES,
+                                             HEADER_PROBE_ENABLED, HEADER_PROBE_FRACTION, WEBSITE_SKU)
+from src.pipeline1.text_extractor_all import extract_text_from_pages
+from src.pipeline1.extraction_engines import extract_header_text
+from src.pipeline1.metadata_reader import find_line_with_metadata
+from src.utils.instrumentation import run_metrics
+
+def probe_and_extract_pages(pdf_data, metadata_line, page_numbers=EXTRACTION_PAGES, engine=EXTRACTION_ENGINE,
+                             probe=HEADER_PROBE_ENABLED):
+    """Process pool entry point: checks the first page header for metadata_line first and only extracts the text of
+    page_numbers if it is there, opening the PDF once for all of them. The probe only reads the top of the page, so a
+    PDF it rejects has its first page extracted to confirm the rejection before it is skipped. pdf_data is the raw PDF
+    bytes or an HttpRangeReader (whose blocks are then fetched by the worker). Returns ({page number: text} or None if
+    the first page doesn't have metadata_line, probe seconds, extraction seconds, fetch stats of the reader or None,
+    whether the probe missed a metadata line the first page text has).
+    """
+    pdf_file = io.BytesIO(pdf_data) if isinstance(pdf_data, bytes) else pdf_data
+    fetch_stats = pdf_file.get_fetch_stats if hasattr(pdf_file, 'get_fetch_stats') else lambda: None
+    probe_seconds = 0.0
+    probe_rejected = False
+    if probe:
+        start = time.perf_counter()
+        try:
+            header_text = extract_header_text(pdf_file, HEADER_PROBE_FRACTION)
+        except Exception:
+            header_text = None # unreadable for the probe, leave the decision to the full extraction
+        probe_seconds = time.perf_counter() - start
+        probe_rejected = header_text is not None and not find_line_with_metadata(header_text.split('\n'), metadata_line)
+
+    start = time.perf_counter()
+    pdf_file.seek(0)
+    if not probe_rejected:
+        page_texts = extract_text_from_pages(pdf_file, page_numbers, engine)
+        return page_texts, probe_seconds, time.perf_counter() - start, fetch_stats(), False
+
+    page_texts = extract_text_from_pages(pdf_file, [1], engine)
+    if not find_line_with_metadata(page_texts.get(1, '').split('\n'), metadata_line):
+        return None, probe_seconds, time.perf_counter() - start, fetch_stats(), False
+    other_page_numbers = [page_number for page_number in page_numbers if page_number != 1]
+    if other_page_numbers:
+        pdf_file.seek(0)
+        page_texts.update(extract_text_from_pages(pdf_file, other_page_numbers, engine))
+    return page_texts, probe_seconds, time.perf_counter() - start, fetch_stats(), True
+
+def probe_and_extract_first_page_text(pdf_data, metadata_line, engine=EXTRACTION_ENGINE, probe=HEADER_PROBE_ENABLED):
+    """probe_and_extract_pages of the first page only, returns its text (or None) in place of the pages"""
+    page_texts, probe_seconds, extraction_seconds, fetch_stats, _ = probe_and_extract_pages(pdf_data, metadata_line, [1],
+                                                                                            engine, probe)
+    first_page_text = page_texts[1] if page_texts is not None else None
+    return first_page_text, probe_seconds, extraction_seconds, fetch_stats
+
+def get_extraction_worker_count():
+    """Number of extraction processes to use. 0 means serial extraction in the calling process."""
+    if EXTRACTION_WORKERS is not None and EXTRACTION_WORKERS != '':
+        return max(int(EXTRACTION_WORKERS), 0)
+    if WEBSITE_SKU == 'Dynamic': # Azure Functions consumption plan, a single small instance
+        return 0
+    return os.cpu_count() or 1
+
+class ExtractionExecutor:
+    """Extracts the text of the first page (or of a set of pages) of PDFs, either in a process pool or serially (workers=0) in a single thread,
+    so the event loop is never blocked. Use as a context manager so the pool is shut down at the end of the run.
+    """
+
+    def __init__(self, workers=None, engine=EXTRACTION_ENGINE):
+        self.workers = get_extraction_worker_count() if workers is None else workers
+        self.engine = engine
+        self._pool = None
+
+        self.probe_rejected = 0 # PDFs without the metadata line on their first page
+        self.probe_misses = 0 # PDFs the probe rejected but whose first page text has the metadata line
+        self.probe_seconds = 0.0
+        self.extracted = 0
+        self.pages_extracted = 0
+        self.extraction_seconds = 0.0
+        self.range_reads = 0 # PDFs read through HTTP Range requests, and what they fetched of their size
+        self.bytes_fetched = 0
+        self.pdf_bytes = 0
+
+    def __enter__(self):
+        if self.workers > 0:
+            # spawned, not forked: the run's threads (log shipping, downloads, blob writes) are running by now and a forked
+            # worker could inherit a lock one of them holds
+            self._pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context('spawn'))
+        else:
+            self._pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix='pdf-extract')
+        logging.info(f"Text extraction running with the {self.engine} engine and {self.workers or 'no'} worker processes")
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if self._pool is not None:
+            self._pool.shutdown(cancel_futures=True)
+            self._pool = None
+
+    async def extract_pages_if_accepted(self, pdf_data, metadata_line, page_numbers=EXTRACTION_PAGES):
+        """Returns {page number: text} of the page_numbers the PDF has, or None when its first page doesn't have
+        metadata_line. pdf_data can be bytes, a BytesIO object or an HttpRangeReader.
+        """
+        pdf_data = pdf_data.getvalue() if isinstance(pdf_data, io.BytesIO) else pdf_data
+        if self._pool is None: # used outside its context
+            result = probe_and_extract_pages(pdf_data, metadata_line, page_numbers, self.engine)
+        else:
+            loop = asyncio.get_running_loop()
+            result = await loop.run_in_executor(self._pool, probe_and_extract_pages, pdf_data, metadata_line, page_numbers,
+                                                self.engine)
+        page_texts, probe_seconds, extraction_seconds, fetch_stats, probe_missed = result
+
+        self.probe_seconds += probe_seconds
+        if probe_missed:
+            self.probe_misses += 1
+            logging.warning("Header probe missed the metadata line, it was found in the first page text")
+        if page_texts is None:
+            self.probe_rejected += 1
+        else:
+            self.extracted += 1
+            self.pages_extracted += len(page_texts)
+            self.extraction_seconds += extraction_seconds
+        if fetch_stats is not None:
+            self.range_reads += 1
+            self.bytes_fetched += fetch_stats['bytes_fetched']
+            self.pdf_bytes += fetch_stats['size']
+            run_metrics.count('bytes_downloaded', fetch_stats['bytes_fetched'])
+            logging.info(f"Fetched {fetch_stats['bytes_fetched']} of {fetch_stats['size']} bytes in {fetch_stats['requests']} "
+                         f"requests: {pdf_data.url}")
+        return page_texts
+
+    async def extract_text_if_accepted(self, pdf_data, metadata_line):
+        """Returns the text of the first page, or None when the header probe didn't find metadata_line"""
+        page_texts = await self.extract_pages_if_accepted(pdf_data, metadata_line, [1])
+        return page_texts[1] if page_texts is not None else None
+
+    def get_summary(self):
+        return {
+            'workers': self.workers,
+            'engine': self.engine,
+            'extracted': self.extracted,
+            'pages_extracted': self.pages_extracted,
+            'extraction_seconds': round(self.extraction_seconds, 3),
+            'probe_rejected': self.probe_rejected,
+            'probe_misses': self.probe_misses,
+            'probe_seconds': round(self.probe_seconds, 3),
+            'range_reads': self.range_reads,
+            'bytes_fetched': self.bytes_fetched,
+            'pdf_bytes': self.pdf_bytes,
+        }
+
+    def log_probe_summary(self):
+        logging.info(f"Header probe: {self.probe_rejected} PDFs rejected (confirmed on their first page text), "
+                     f"{self.probe_misses} probe misses, {self.extracted} extracted, {self.probe_seconds:.2f}s spent probing")
+        if self.range_reads:
+            logging.info(f"Range reads: {self.range_reads} PDFs, {self.bytes_fetched} of {self.pdf_bytes} bytes fetched")
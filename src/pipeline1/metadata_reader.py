@@ -1,9 +1,16 @@
 # meta_data_reader.py
 import re
+from functools import lru_cache
+
+@lru_cache(maxsize=None)
+def compile_metadata_matcher(metadata_line):
+    """Compiled once per metadata line and reused across lines and PDFs"""
+    return re.compile(re.escape(metadata_line))
 
 def find_line_with_metadata(lines, metadata_line):
 
+    metadata_matcher = compile_metadata_matcher(metadata_line)
     for line in lines:
-        if re.search(re.escape(metadata_line), line):
+        if metadata_matcher.search(line):
             return True
     return False
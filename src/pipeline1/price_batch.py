@@ -0,0 +1,73 @@
+# Typed columnar form of the rows of one bulletin, built straight from the parsed lines.
+# Replaces the parse_text -> create_dataframe -> transform_dataframe path, which carried every value as a string
+# through several DataFrame copies.
+import numpy as np
+import pandas as pd
+from datetime import datetime
+from dataclasses import dataclass
+from src.pipeline1.text_to_lists import parse_records
+
+DATE_FORMAT = '%Y.%m.%d'
+
+# Column order of the transformed DataFrame, as written to the monthly csv
+COLUMNS = ['Database Write Date', 'Date', 'Category', 'Item', 'Pettah Average', 'Pettah_Min_Value', 'Pettah_Max_Value', 'Page']
+
+@dataclass
+class PriceBatch:
+    """The rows of one bulletin page. The date is a single scalar for the whole batch, category and item are
+    categoricals, and the prices are numpy arrays parsed once from the text.
+    """
+    date: pd.Timestamp
+    categories: pd.Categorical
+    items: pd.Categorical
+    pettah_averages: np.ndarray   # float64
+    pettah_min_values: np.ndarray # int64
+    pettah_max_values: np.ndarray # int64
+    page: int = 1
+
+    def __len__(self):
+        return len(self.items)
+
+    def to_dataframe(self, database_write_date=None):
+        """Builds the transformed DataFrame (the columns of transform_dataframe) in one step, the scalar columns
+        are broadcast instead of being materialised per row first.
+        """
+        if database_write_date is None:
+            database_write_date = datetime.now().strftime('%Y-%m-%d')
+        return pd.DataFrame({
+            'Database Write Date': database_write_date,
+            'Date': self.date,
+            'Category': self.categories,
+            'Item': self.items,
+            'Pettah Average': self.pettah_averages,
+            'Pettah_Min_Value': self.pettah_min_values,
+            'Pettah_Max_Value': self.pettah_max_values,
+            'Page': self.page,
+        }, index=pd.RangeIndex(len(self)), columns=COLUMNS, copy=False)
+
+def parse_price_batch(lines: list[str], page=1) -> PriceBatch:
+    """Parses the lines of a bulletin page into a PriceBatch. The values match transform_dataframe: the date is
+    parsed with DATE_FORMAT (NaT if the page has none) and the min/max prices are truncated to integers.
+    """
+    records = parse_records(lines)
+    date = records[0].date if records else None
+    date = pd.Timestamp(datetime.strptime(date, DATE_FORMAT)) if date is not None else pd.NaT
+
+    categories, items, pettah_averages, pettah_min_values, pettah_max_values = [], [], [], [], []
+    for record in records:
+        categories.append(record.category)
+        items.append(record.item)
+        pettah_averages.append(float(record.pettah_average))
+        pettah_min_value, pettah_max_value = record.pettah_price_range.split(' - ')
+        pettah_min_values.append(float(pettah_min_value))
+        pettah_max_values.append(float(pettah_max_value))
+
+    return PriceBatch(
+        date=date,
+        categories=pd.Categorical(categories),
+        items=pd.Categorical(items),
+        pettah_averages=np.array(pettah_averages, dtype=np.float64),
+        pettah_min_values=np.array(pettah_min_values, dtype=np.float64).astype(np.int64),
+        pettah_max_values=np.array(pettah_max_values, dtype=np.float64).astype(np.int64),
+        page=page,
+    )
@@ -0,0 +1,411 @@
+# Processing of the bulletins as a pipeline of stages connected by bounded asyncio queues:
+#
+#   discover -> download -> extract -> transform -> csv sink -> Cosmos DB sink
+#
+# Each stage runs its own number of workers. Blocking work runs off the event loop: downloads in a thread pool, text
+# extraction in the ExtractionExecutor, parsing in a thread, and all blob state changes (row hash index, csv appends,
+# completion callbacks) in a single blob thread, which also keeps them in order. A full queue pauses the stage feeding
+# it (backpressure), so only a few PDFs per stage are held in memory however many links are pending.
+import io
+import os
+import time
+import asyncio
+import logging
+import pandas as pd
+from concurrent.futures import ThreadPoolExecutor
+from src.connector.blob import upload_to_blob
+from src.connector.pdf_cache import get_pdf_cache
+from src.connector.page_text_store import PageTextStore
+from src.utils.instrumentation import run_metrics
+from src.configuration.configuration import (metadata_line1, DOWNLOAD_CONCURRENCY, PIPELINE_QUEUE_SIZE, TRANSFORM_WORKERS,
+                                             EXTRACTION_PAGES, SINK_FLUSH_ROWS, SINK_FLUSH_SECONDS)
+from src.pipeline1.price_batch import parse_price_batch
+from src.pipeline1.metadata_reader import find_line_with_metadata
+from src.pipeline1.text_extractor_all import open_pdf, get_pdf_version
+from src.pipeline1.data_format_converter import dataframe_to_csv_string, iter_cosmos_documents
+
+_DONE = object() # end of stream marker passed down the queues
+INDEX_APPEND_ATTEMPTS = 3 # attempts of the row hash index append after a csv append
+
+def read_pdf_file(pdf_path):
+    """fetch_pdf for local PDF files (offline backfills)"""
+    with open(pdf_path, 'rb') as f:
+        return io.BytesIO(f.read())
+
+def get_pdf_file_version(pdf_path):
+    """fetch_pdf_version for local PDF files: modification time and size"""
+    stat = os.stat(pdf_path)
+    return {'etag': None, 'last_modified': stat.st_mtime_ns, 'size': stat.st_size}
+
+class StageStats:
+    def __init__(self, name, workers):
+        self.name = name
+        self.workers = workers
+        self.processed = 0
+        self.failed = 0
+        self.busy_seconds = 0.0
+
+class SinkBuffer:
+    """Items held by a sink stage until flush_rows rows are buffered or the oldest item waited flush_seconds"""
+
+    def __init__(self, flush_rows, flush_seconds):
+        self.flush_rows = flush_rows
+        self.flush_seconds = flush_seconds
+        self.items = []
+        self.rows = 0
+        self.oldest = None
+        self.flushes = 0
+
+    def add(self, item, rows):
+        if not self.items:
+            self.oldest = time.monotonic()
+        self.items.append(item)
+        self.rows += rows
+
+    def is_full(self):
+        return self.rows >= self.flush_rows
+
+    def seconds_to_flush(self):
+        """None while empty (nothing to flush, wait for items)"""
+        if not self.items:
+            return None
+        return max(self.oldest + self.flush_seconds - time.monotonic(), 0)
+
+    def take(self):
+        items = self.items
+        self.items, self.rows, self.oldest = [], 0, None
+        self.flushes += 1
+        return items
+
+class PdfPipeline:
+    """Runs pdf links through the stages. For every link exactly one of the callbacks is called, from the blob thread:
+    on_completed(pdf_link) once it is written (or skipped as not a price bulletin), or
+    on_failed(pdf_link, error, stage_name) when a stage raised.
+    The sinks coalesce their writes across bulletins: the csv rows of a month are appended together and the Cosmos DB
+    documents of many bulletins written together, flushed every flush_rows rows, after flush_seconds and at the end.
+    on_flushed(), if given, is called after the bulletins of a flush were completed (eg: to commit the tracker once).
+    Completed and failed PDFs are also reported to the heartbeat (a HeartbeatEmitter), if one is given.
+    The page_numbers of each bulletin are extracted in one go and, with page_text_artifacts, stored as its page text
+    artifact (see PageTextStore) along with the version of its PDF (fetch_pdf_version); with reuse_page_texts too, a
+    bulletin that already has an artifact of the current version of its PDF is read from it instead of the PDF.
+    Artifacts are for reprocessing (backfill.py): a new bulletin never has one, so a regular run uses neither.
+    Only the first page goes down the stages.
+    """
+
+    def __init__(self, extraction_executor, cosmos_writer, blob_store, row_index, on_completed, on_failed, heartbeat=None,
+                 fetch_pdf=open_pdf, fetch_pdf_version=get_pdf_version, download_workers=DOWNLOAD_CONCURRENCY, transform_workers=TRANSFORM_WORKERS,
+                 queue_size=PIPELINE_QUEUE_SIZE, page_numbers=EXTRACTION_PAGES, page_text_artifacts=False,
+                 flush_rows=SINK_FLUSH_ROWS, flush_seconds=SINK_FLUSH_SECONDS, on_flushed=None, reuse_page_texts=False):
+        self.extraction_executor = extraction_executor
+        self.cosmos_writer = cosmos_writer
+        self.blob_store = blob_store
+        self.row_index = row_index
+        self.on_completed = on_completed
+        self.on_failed = on_failed
+        self.on_flushed = on_flushed
+        self.heartbeat = heartbeat
+        self.fetch_pdf = fetch_pdf
+        self.fetch_pdf_version = fetch_pdf_version
+        self.reuse_page_texts = reuse_page_texts
+        self.queue_size = queue_size
+        self.page_numbers = page_numbers
+        self.page_texts = PageTextStore(blob_store, extraction_executor.engine) if page_text_artifacts else None
+        self._csv_buffer = SinkBuffer(flush_rows, flush_seconds)
+        self._cosmos_buffer = SinkBuffer(flush_rows, flush_seconds)
+        self.sink_buffers = {'csv sink': (self._csv_buffer, self._flush_csv), 'cosmos sink': (self._cosmos_buffer, self._flush_cosmos)}
+        self.stages = [
+            ('download', self._download, download_workers),
+            ('extract', self._extract, max(extraction_executor.workers, 1)),
+            ('transform', self._transform, transform_workers),
+            ('csv sink', self._write_csv, 1),
+            ('cosmos sink', self._write_cosmos, 1), # the writes of a flush run concurrently in the CosmosWriter
+        ]
+        self.stats = {name: StageStats(name, workers) for name, _, workers in self.stages}
+        self.max_queue_depth = 0
+
+    async def _in_thread(self, executor, function, *args):
+        return await asyncio.get_running_loop().run_in_executor(executor, function, *args)
+
+    # Stage handlers: take the item of the previous stage, return the item for the next stage or None to end the item
+
+    async def _download(self, pdf_link):
+        pdf_version = None
+        if self.page_texts is not None:
+            # a bulletin extracted before (by an earlier run or another page's ETL) is not downloaded again, unless the
+            # PDF was re-published since
+            pdf_version = await self._in_thread(self._download_executor, self.fetch_pdf_version, pdf_link)
+            if self.reuse_page_texts:
+                page_texts = await self._in_thread(self._download_executor, self.page_texts.get, pdf_link, self.page_numbers,
+                                                   pdf_version)
+                if page_texts is not None:
+                    run_metrics.count('page_text_artifacts_read')
+                    return pdf_link, page_texts, pdf_version
+        pdf_data = await self._in_thread(self._download_executor, self.fetch_pdf, pdf_link)
+        if isinstance(pdf_data, io.BytesIO): # range reads fetch most of their bytes later, the extraction counts them
+            run_metrics.count('bytes_downloaded', pdf_data.getbuffer().nbytes)
+        return pdf_link, pdf_data, pdf_version
+
+    async def _extract(self, item):
+        pdf_link, pdf_data, pdf_version = item
+        logging.info(f"Processing PDF link: {pdf_link}")
+        if isinstance(pdf_data, dict): # page texts of the artifact
+            page_texts = pdf_data
+        else:
+            page_texts = await self.extraction_executor.extract_pages_if_accepted(pdf_data, metadata_line1, self.page_numbers)
+            if page_texts is not None and self.page_texts is not None:
+                await self._in_thread(self._blob_executor, self.page_texts.put, pdf_link, page_texts, self.page_numbers,
+                                      pdf_version)
+        extracted_text = page_texts[1] if page_texts is not None else None
+
+        # Extracted text is split into lines (no text: the header probe didn't find the metadata line)
+        extracted_lines = extracted_text.split('\n') if extracted_text is not None else []
+        if not find_line_with_metadata(extracted_lines, metadata_line1):
+            logging.warning(f"Metadata line not found. Skipping this PDF. {pdf_link}")
+            run_metrics.count('pdfs_not_price_bulletins')
+            await self._in_thread(self._blob_executor, self.on_completed, pdf_link)
+            return None
+        return pdf_link, extracted_lines
+
+    async def _transform(self, item):
+        pdf_link, extracted_lines = item
+
+        def transform():
+            # Parse text into a typed columnar batch and build the transformed DataFrame from it in one step
+            price_batch = parse_price_batch(extracted_lines)
+            return price_batch.to_dataframe(), price_batch.date.strftime('%y-%m-%d')
+
+        transformed_dataframe, actual_date_str = await self._in_thread(self._transform_executor, transform)
+        run_metrics.count('rows_parsed', len(transformed_dataframe))
+        return pdf_link, transformed_dataframe, actual_date_str
+
+    async def _write_csv(self, item):
+        pdf_link, transformed_dataframe, actual_date_str = item
+
+        def select_changed_rows():
+            # Only rows that are new or whose prices changed since they were last written go to the sinks
+            with run_metrics.span('change detection'):
+                csv_dataframe, cosmos_dataframe, claim = self.row_index.select_changed_rows(transformed_dataframe, actual_date_str)
+            logging.info(f">>>> {len(cosmos_dataframe)} of {len(transformed_dataframe)} rows new or changed {pdf_link} <<<<")
+            return csv_dataframe, cosmos_dataframe, claim
+
+        csv_dataframe, cosmos_dataframe, claim = await self._in_thread(self._blob_executor, select_changed_rows)
+        if not len(csv_dataframe):
+            return pdf_link, cosmos_dataframe, claim
+        self._csv_buffer.add((pdf_link, csv_dataframe, cosmos_dataframe, claim, actual_date_str), len(csv_dataframe))
+        return await self._flush_csv() if self._csv_buffer.is_full() else None
+
+    async def _flush_csv(self):
+        """Appends the buffered rows to their monthly csv files, one append per month"""
+        months = {}
+        for buffered in self._csv_buffer.take():
+            months.setdefault(buffered[3].csv_name, []).append(buffered)
+
+        def write_month(month_items):
+            csv_dataframe = pd.concat([csv_dataframe for _, csv_dataframe, _, _, _ in month_items], ignore_index=True)
+            claims = [claim for _, _, _, claim, _ in month_items]
+            try:
+                with run_metrics.span('csv append'):
+                    csv_data, _ = dataframe_to_csv_string(csv_dataframe)
+                    bytes_uploaded = upload_to_blob(csv_data, month_items[0][4], self.blob_store)
+            except Exception:
+                for claim in claims:
+                    self.row_index.release(claim)
+                raise
+            run_metrics.count('csv_rows_appended', len(csv_dataframe))
+            run_metrics.count('csv_bytes_appended', bytes_uploaded)
+            logging.info(f">>>> CSV data of {len(month_items)} PDFs uploaded to blob storage ({bytes_uploaded} bytes) <<<<")
+            # The rows are in the csv now: the claims are kept from here on, as releasing them would make a retry append
+            # the rows again. If the index can't be appended to, the PDFs fail with their rows still claimed.
+            for attempt in range(1, INDEX_APPEND_ATTEMPTS + 1):
+                try:
+                    self.row_index.record_csv(*claims)
+                    return
+                except Exception as e:
+                    if attempt == INDEX_APPEND_ATTEMPTS:
+                        logging.error(f"Rows appended to {claims[0].csv_name} could not be added to its row hash index: {e}")
+                        raise
+                    logging.warning(f"Row hash index append of {claims[0].csv_name} failed, retrying: {e}")
+                    time.sleep(attempt)
+
+        results = []
+        for month_items in months.values():
+            try:
+                await self._in_thread(self._blob_executor, write_month, month_items)
+            except Exception as e:
+                for pdf_link, _, _, _, _ in month_items:
+                    await self._fail(pdf_link, e, 'csv sink')
+                continue
+            results.extend((pdf_link, cosmos_dataframe, claim) for pdf_link, _, cosmos_dataframe, claim, _ in month_items)
+        return results
+
+    async def _write_cosmos(self, item):
+        pdf_link, cosmos_dataframe, claim = item
+        self._cosmos_buffer.add(item, len(cosmos_dataframe))
+        return await self._flush_cosmos() if self._cosmos_buffer.is_full() else None
+
+    async def _flush_cosmos(self):
+        """Writes the Cosmos DB documents of the buffered bulletins in one go (grouped into batches per partition key by
+        the writer), then completes the bulletins
+        """
+        buffered = self._cosmos_buffer.take()
+        document_count = sum(len(cosmos_dataframe) for _, cosmos_dataframe, _ in buffered)
+        try:
+            if document_count:
+                # Stream the Cosmos DB documents of the DataFrames into the writer (ids are deterministic, re-runs upsert)
+                with run_metrics.span('cosmos write'):
+                    await self.cosmos_writer.write(document for _, cosmos_dataframe, _ in buffered
+                                                   for document in iter_cosmos_documents(cosmos_dataframe))
+                run_metrics.count('cosmos_documents_written', document_count)
+                logging.info(f">>>> Completion of data ingestion to CosmosDB of {len(buffered)} PDFs <<<<")
+        except Exception as e:
+            for pdf_link, _, claim in buffered:
+                await self._in_thread(self._blob_executor, self.row_index.release, claim)
+                await self._fail(pdf_link, e, 'cosmos sink')
+            return []
+
+        def complete():
+            months = {}
+            for _, _, claim in buffered:
+                months.setdefault(claim.csv_name, []).append(claim)
+            for claims in months.values():
+                self.row_index.record(*claims)
+            for pdf_link, _, _ in buffered:
+                self.on_completed(pdf_link)
+                run_metrics.count('pdfs_completed')
+            if self.on_flushed is not None:
+                self.on_flushed()
+
+        try:
+            await self._in_thread(self._blob_executor, complete)
+        except Exception as e:
+            for pdf_link, _, _ in buffered:
+                await self._fail(pdf_link, e, 'cosmos sink')
+            return []
+        if self.heartbeat is not None:
+            for _ in buffered:
+                self.heartbeat.record_success()
+        return []
+
+    async def _fail(self, pdf_link, error, stage_name):
+        logging.error(f"Error processing PDF {pdf_link} in the {stage_name} stage: {error}")
+        self.stats[stage_name].failed += 1
+        run_metrics.count('pdfs_failed')
+        await self._in_thread(self._blob_executor, self.on_failed, pdf_link, error, stage_name)
+        if self.heartbeat is not None:
+            self.heartbeat.record_error("An error occurred: " + str(error))
+
+    async def _run_stage(self, stage_name, handler, workers, in_queue, out_queue, sink_buffer=None, flush=None):
+        """Runs workers of handler over in_queue. A handler returns the item for out_queue, a list of items or None.
+        A sink stage (one worker) buffers items in sink_buffer and returns the items of a flush; flush() also runs when
+        the oldest buffered item waited long enough and at the end of the stream.
+        """
+        stats = self.stats[stage_name]
+
+        async def forward(results):
+            for result in results if isinstance(results, list) else [results]:
+                if result is not None:
+                    await out_queue.put(result)
+                    self.max_queue_depth = max(self.max_queue_depth, out_queue.qsize())
+
+        async def run_flush():
+            start = time.perf_counter()
+            results = await flush()
+            busy_seconds = time.perf_counter() - start
+            stats.busy_seconds += busy_seconds
+            run_metrics.add_span(f'stage {stage_name}', busy_seconds)
+            await forward(results)
+
+        async def worker():
+            pending_get = None # kept across flush timeouts, so no item is lost
+            try:
+                while True:
+                    if sink_buffer is None:
+                        item = await in_queue.get()
+                    else:
+                        pending_get = pending_get or asyncio.ensure_future(in_queue.get())
+                        done, _ = await asyncio.wait({pending_get}, timeout=sink_buffer.seconds_to_flush())
+                        if not done:
+                            await run_flush() # the oldest buffered item waited long enough
+                            continue
+                        item, pending_get = pending_get.result(), None
+                    if item is _DONE:
+                        await in_queue.put(_DONE) # let the other workers of the stage see it too
+                        if sink_buffer is not None and sink_buffer.items:
+                            await run_flush()
+                        return
+                    pdf_link = item if isinstance(item, str) else item[0]
+                    start = time.perf_counter()
+                    try:
+                        result = await handler(item)
+                    except Exception as e:
+                        await self._fail(pdf_link, e, stage_name)
+                        continue
+                    finally:
+                        busy_seconds = time.perf_counter() - start
+                        stats.busy_seconds += busy_seconds
+                        run_metrics.add_span(f'stage {stage_name}', busy_seconds)
+                    stats.processed += 1
+                    await forward(result)
+            finally:
+                if pending_get is not None:
+                    pending_get.cancel()
+
+        await asyncio.gather(*(worker() for _ in range(workers)))
+        await out_queue.put(_DONE)
+
+    async def run(self, pdf_links):
+        """Runs all pdf_links (an iterable) through the pipeline and returns when every link has been completed or failed"""
+        queues = [asyncio.Queue(maxsize=self.queue_size) for _ in range(len(self.stages) + 1)]
+        download_workers = self.stats['download'].workers
+        start = time.perf_counter()
+
+        async def discover():
+            for pdf_link in pdf_links:
+                await queues[0].put(pdf_link)
+            await queues[0].put(_DONE)
+
+        async def drain():
+            while await queues[-1].get() is not _DONE:
+                pass
+
+        with ThreadPoolExecutor(max_workers=download_workers, thread_name_prefix='pdf-download') as self._download_executor, \
+             ThreadPoolExecutor(max_workers=self.stats['transform'].workers, thread_name_prefix='pdf-transform') as self._transform_executor, \
+             ThreadPoolExecutor(max_workers=1, thread_name_prefix='blob') as self._blob_executor:
+            tasks = [asyncio.ensure_future(discover()), asyncio.ensure_future(drain())]
+            for i, (stage_name, handler, workers) in enumerate(self.stages):
+                sink_buffer, flush = self.sink_buffers.get(stage_name, (None, None))
+                tasks.append(asyncio.ensure_future(self._run_stage(stage_name, handler, workers, queues[i], queues[i + 1],
+                                                                   sink_buffer, flush)))
+            try:
+                await asyncio.gather(*tasks)
+            except BaseException:
+                for task in tasks:
+                    task.cancel()
+                raise
+
+        pdf_cache = get_pdf_cache()
+        if pdf_cache is not None:
+            pdf_cache.flush()
+            pdf_cache.log_stats()
+            pdf_cache.reset_stats() # the cache outlives the run in a warm Functions host
+        self.elapsed_seconds = time.perf_counter() - start
+
+    def get_summary(self):
+        return {
+            'elapsed_seconds': round(self.elapsed_seconds, 3),
+            'queue_size': self.queue_size,
+            'max_queue_depth': self.max_queue_depth,
+            'stages': {stats.name: {'workers': stats.workers, 'processed': stats.processed, 'failed': stats.failed,
+                                    'busy_seconds': round(stats.busy_seconds, 3)} for stats in self.stats.values()},
+            'page_text_artifacts': self.page_texts.get_summary() if self.page_texts is not None else None,
+            'sink_flushes': {stage_name: sink_buffer.flushes for stage_name, (sink_buffer, _) in self.sink_buffers.items()},
+        }
+
+    def log_summary(self):
+        for stats in self.stats.values():
+            logging.info(f"Stage {stats.name}: {stats.processed} done, {stats.failed} failed by {stats.workers} workers, "
+                         f"{stats.busy_seconds:.2f}s busy")
+        logging.info(f"Pipeline: {self.elapsed_seconds:.2f}s, largest queue depth {self.max_queue_depth} of {self.queue_size}, "
+                     f"{self._csv_buffer.flushes} csv and {self._cosmos_buffer.flushes} Cosmos DB sink flushes")
+        if self.page_texts is not None:
+            self.page_texts.log_summary()
@@ -1,30 +1,133 @@
 # Text Extractor all is for batch processing PDFs only
 import io
-import requests
-import pdfplumber
-from bs4 import BeautifulSoup
+import re
+import html
+import logging
 from urllib.parse import urljoin
+from src.connector.url_connector import get_http_session
+from src.connector.pdf_cache import get_pdf_cache
+from src.connector.range_reader import HttpRangeReader
+from src.configuration.configuration import (DOWNLOAD_TIMEOUT, PDF_CACHE_REVALIDATE, PDF_RANGE_READS, LISTING_STOP_AFTER_KNOWN,
+                                             EXTRACTION_ENGINE, EXTRACTION_PAGES)
 
-def get_all_pdf_links(pdf_source):
-    response = requests.get(pdf_source)
-    soup = BeautifulSoup(response.content, 'html.parser')
-    pdf_links = soup.find_all('a', href=True)
-    
-    all_pdf_links: list[str] = []
-    for link in pdf_links:
-        if '.pdf' in link['href']:
-            full_link = urljoin(pdf_source, link['href'])
-            all_pdf_links.append(full_link)
-    
-    return all_pdf_links
-            
-
-def download_pdf_as_bytes(pdf_url):
-    response = requests.get(pdf_url)
+ANCHOR_HREF_PATTERN = re.compile(rb'''<a\s[^>]*?(?<![\w-])href\s*=\s*(["'])(.*?)\1''', re.IGNORECASE | re.DOTALL)
+
+def iter_pdf_links(html_chunks, pdf_source):
+    """Streaming href scanner: yields the full link of every <a href> containing '.pdf' as soon as the chunk holding it
+    arrives, so the caller can stop reading the page early, without building a DOM.
+    """
+    buffer = b''
+    for chunk in html_chunks:
+        buffer += chunk
+        scanned_up_to = 0
+        for match in ANCHOR_HREF_PATTERN.finditer(buffer):
+            href = html.unescape(match.group(2).decode('utf-8', errors='replace'))
+            if '.pdf' in href:
+                yield urljoin(pdf_source, href)
+            scanned_up_to = match.end()
+        # keep the unscanned tail from its last '<', it may hold an anchor tag that continues in the next chunk
+        tag_start = buffer.rfind(b'<', scanned_up_to)
+        buffer = buffer[tag_start:] if tag_start != -1 else b''
+
+def fetch_pdf_listing(pdf_source, listing_state):
+    """Conditionally fetches the listing page using the validators in listing_state (see download_listing_state).
+    Returns None when the server reports the page unchanged (304), otherwise (pdf link iterator, new listing state).
+    The page is streamed, so the body is only read as far as the link iterator is consumed.
+    """
+    headers = {}
+    if listing_state.get('etag'):
+        headers['If-None-Match'] = listing_state['etag']
+    if listing_state.get('last_modified'):
+        headers['If-Modified-Since'] = listing_state['last_modified']
+
+    response = get_http_session().get(pdf_source, headers=headers, timeout=DOWNLOAD_TIMEOUT, stream=True)
+    if response.status_code == 304:
+        response.close()
+        return None
+    response.raise_for_status()
+
+    new_listing_state = {'etag': response.headers.get('ETag'), 'last_modified': response.headers.get('Last-Modified')}
+
+    def pdf_links():
+        with response:
+            yield from iter_pdf_links(response.iter_content(chunk_size=16 * 1024), pdf_source)
+
+    return pdf_links(), new_listing_state
+
+def take_new_pdf_links(pdf_links, processed_pdfs, stop_after_known=LISTING_STOP_AFTER_KNOWN):
+    """Returns the new pdf links of a newest first pdf link iterator. Stops consuming the iterator after
+    stop_after_known already processed links in a row (0 scans the whole listing).
+    """
+    new_pdf_links = []
+    known_in_a_row = 0
+    for pdf_link in pdf_links:
+        if pdf_link in processed_pdfs:
+            known_in_a_row += 1
+            if stop_after_known and known_in_a_row >= stop_after_known:
+                break
+        else:
+            known_in_a_row = 0
+            if pdf_link not in new_pdf_links:
+                logging.info(f"New PDF link: {pdf_link}")
+                new_pdf_links.append(pdf_link)
+    return new_pdf_links
+
+
+def download_pdf_as_bytes(pdf_url, timeout=DOWNLOAD_TIMEOUT):
+    """Returns the PDF as a BytesIO object, from the local PDF cache when it holds the url"""
+    pdf_cache = get_pdf_cache()
+    headers = {}
+    if pdf_cache is not None:
+        if PDF_CACHE_REVALIDATE:
+            headers = pdf_cache.get_validators(pdf_url)
+        else:
+            cached_pdf = pdf_cache.get(pdf_url)
+            if cached_pdf is not None:
+                return io.BytesIO(cached_pdf)
+
+    response = get_http_session().get(pdf_url, headers=headers, timeout=timeout)
+    if response.status_code == 304:
+        cached_pdf = pdf_cache.get(pdf_url)
+        if cached_pdf is not None:
+            return io.BytesIO(cached_pdf)
+        response = get_http_session().get(pdf_url, timeout=timeout) # cached copy vanished, fetch unconditionally
+    response.raise_for_status()
+
+    if pdf_cache is not None:
+        pdf_cache.put(pdf_url, response.content, response.headers.get('ETag'), response.headers.get('Last-Modified'))
     pdf_bytes = io.BytesIO(response.content)
     return pdf_bytes
 
-def extract_text_from_first_page(pdf_data):
-    with pdfplumber.open(pdf_data) as pdf:
-        first_page_text = pdf.pages[0].extract_text()
-    return first_page_text
+def get_pdf_version(pdf_url, timeout=DOWNLOAD_TIMEOUT):
+    """Version of the PDF at pdf_url from a HEAD request: {'etag', 'last_modified', 'size'}, or None when the server
+    gives none of them. A bulletin re-published at the same url has another version.
+    """
+    response = get_http_session().head(pdf_url, timeout=timeout, allow_redirects=True)
+    if not response.ok:
+        return None
+    size = response.headers.get('Content-Length')
+    pdf_version = {'etag': response.headers.get('ETag'), 'last_modified': response.headers.get('Last-Modified'),
+                   'size': int(size) if size else None}
+    return pdf_version if any(value is not None for value in pdf_version.values()) else None
+
+def open_pdf(pdf_url, timeout=DOWNLOAD_TIMEOUT):
+    """fetch_pdf of the pipeline. With PDF_RANGE_READS a HttpRangeReader over the url (the cached PDF when the local
+    PDF cache holds it), otherwise the whole PDF downloaded as a BytesIO object.
+    """
+    if not PDF_RANGE_READS:
+        return download_pdf_as_bytes(pdf_url, timeout)
+    pdf_cache = get_pdf_cache()
+    cached_pdf = pdf_cache.get(pdf_url) if pdf_cache is not None else None
+    if cached_pdf is not None:
+        return io.BytesIO(cached_pdf)
+    return HttpRangeReader(pdf_url, timeout=timeout)
+
+# The PDF libraries are imported on the first extraction, the listing functions above don't need them
+def extract_text_from_first_page(pdf_data, engine=EXTRACTION_ENGINE):
+    from src.pipeline1.extraction_engines import get_extraction_engine
+    return get_extraction_engine(engine)(pdf_data)
+
+def extract_text_from_pages(pdf_data, page_numbers=EXTRACTION_PAGES, engine=EXTRACTION_ENGINE):
+    """Opens the PDF once and returns {page number: text} of the page_numbers (1 based) it has"""
+    from src.pipeline1.extraction_engines import get_page_extraction_engine
+    return get_page_extraction_engine(engine)(pdf_data, page_numbers)
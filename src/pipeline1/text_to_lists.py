@@ -1,44 +1,53 @@
 # text_to_dataframe.py
 import re
+from typing import NamedTuple
+
+# Category header lines. The rice header comes in three variants across the bulletins (Rs/kg, Rs/50kg, Rs/50 kg).
+CATEGORY_ALTERNATIVES = (
+    r'Rice \(Rs/(?:kg|50kg|50 kg)\)',
+    r'Imported Rice',
+    r'Dried Chillies \(Rs/Kg\)',
+    r'Onion \(Rs/Kg\)',
+    r'Big Onion',
+    r'Potatoes \(Rs/Kg\)',
+    r'Pulses \(Rs/Kg\)',
+    r'Consumption Item\(Rs/Kg\)',
+    r'Eggs \(Rs/Egg\)',
+)
+ITEM_EXPRESSION = r'(?P<item>[a-zA-Z\s\(\)]*\d*)\s(?P<price_range>\d+\.\d{2}\s-\s\d+\.\d{2})\s(?P<average>\d+\.\d{2})'
+
+# One grammar for a whole line, compiled once at import: a category header (tried first, as before) or an item row
+LINE_PATTERN = re.compile(r'(?P<category>' + '|'.join(CATEGORY_ALTERNATIVES) + r')|' + ITEM_EXPRESSION)
+CATEGORY_PATTERN = re.compile(r'^(?:' + '|'.join(CATEGORY_ALTERNATIVES) + r')')
+ITEM_PATTERN = re.compile(r'^' + ITEM_EXPRESSION)
+
+# 2024.02.24, 2024-02-24, 2024/02/24, 24.02.2024, 24-02-2024, 24/02/2024 (same separator throughout)
+DATE_PATTERN = re.compile(r'\d{4}([.\-/])\d{2}\1\d{2}|\d{2}([.\-/])\d{2}\2\d{4}')
+DATE_SEARCH_LINES = 7 # date line is usually found at index 4, but there can be some variance
+
+class PriceRecord(NamedTuple):
+    date: str
+    category: str
+    item: str
+    pettah_price_range: str
+    pettah_average: str
 
 def get_patterns():
-    possible_category_patterns = {
-        re.compile(r'^Rice \(Rs/kg\)|Imported Rice|Dried Chillies \(Rs/Kg\)|Onion \(Rs/Kg\)|Big Onion|Potatoes \(Rs/Kg\)|Pulses \(Rs/Kg\)|Consumption Item\(Rs/Kg\)|Eggs \(Rs/Egg\)'),
-        re.compile(r'^Rice \(Rs/50kg\)|Imported Rice|Dried Chillies \(Rs/Kg\)|Onion \(Rs/Kg\)|Big Onion|Potatoes \(Rs/Kg\)|Pulses \(Rs/Kg\)|Consumption Item\(Rs/Kg\)|Eggs \(Rs/Egg\)'),
-        re.compile(r'^Rice \(Rs/50 kg\)|Imported Rice|Dried Chillies \(Rs/Kg\)|Onion \(Rs/Kg\)|Big Onion|Potatoes \(Rs/Kg\)|Pulses \(Rs/Kg\)|Consumption Item\(Rs/Kg\)|Eggs \(Rs/Egg\)')
-    }
-    item_pattern = re.compile(r'^([a-zA-Z\s\(\)]*\d*)\s(\d+\.\d{2}\s-\s\d+\.\d{2})\s(\d+\.\d{2})')
-    return possible_category_patterns, item_pattern
+    """Returns the precompiled (category patterns, item pattern). Kept for callers of the earlier parse_text signature."""
+    return {CATEGORY_PATTERN}, ITEM_PATTERN
 
 
 def extract_date(lines):
-    possible_date_patterns = {
-        r'\d{4}\.\d{2}\.\d{2}', # 2024.02.24
-        r'\d{2}\.\d{2}\.\d{4}', # 24.02.2024
-        r'\d{4}\-\d{2}\-\d{2}', # 2024-02-24
-        r'\d{2}\-\d{2}\-\d{4}', # 24-02-2024
-        r'\d{4}\/\d{2}\/\d{2}', # 2024/02/24
-        r'\d{2}\/\d{2}\/\d{4}'  # 24/02/2024
-    }
-
-    for i in range(0,7): # date line is usually found at index 4, but there can be some variance
-        date_line = lines[i]
-        for possible_date_pattern in possible_date_patterns:
-            date_match = re.search(possible_date_pattern, date_line)
-            if date_match: return date_match.group(0)
+    for date_line in lines[:DATE_SEARCH_LINES]:
+        date_match = DATE_PATTERN.search(date_line)
+        if date_match: return date_match.group(0)
     return None
 
-def parse_text(lines: list[str], possible_category_patterns: set[re.Pattern[str]], item_pattern: re.Pattern[str]):
-    """Returns tuple of 5 lists corresponding to dates, categories, items, price range and price average.
-    Dates contains the same date.
-
+def parse_records(lines: list[str]) -> list[PriceRecord]:
+    """Classifies each line with a single match of LINE_PATTERN and returns one PriceRecord per item row,
+    carrying the bulletin date and the category of the latest category header line.
     """
-    dates = []
-    categories = []
-    items = []
-    pettah_price_ranges = []
-    pettah_averages = []
-
+    records = []
     current_category = None
     date = extract_date(lines)
 
@@ -46,25 +55,26 @@ def parse_text(lines: list[str], possible_category_patterns: set[re.Pattern[str]
         line = line.strip()
         if not line:
             continue
-        
-        for possible_category_pattern in possible_category_patterns:
-            category_match = possible_category_pattern.match(line)
-            if category_match:
-                current_category = category_match.group(0)
-                continue
-        if category_match: continue
-        
-        item_match = item_pattern.match(line)
-        if item_match:
-            item = item_match.group(1).strip()
-            pettah_price_range = item_match.group(2)
-            pettah_average = item_match.group(3)
-            
-            dates.append(date)
-            categories.append(current_category)
-            items.append(item)
-            pettah_price_ranges.append(pettah_price_range)
-            pettah_averages.append(pettah_average)
-    
-    return dates, categories, items, pettah_price_ranges, pettah_averages
 
+        line_match = LINE_PATTERN.match(line)
+        if line_match is None:
+            continue
+        if line_match.group('category') is not None:
+            current_category = line_match.group('category')
+            continue
+
+        records.append(PriceRecord(date, current_category, line_match.group('item').strip(),
+                                   line_match.group('price_range'), line_match.group('average')))
+
+    return records
+
+def parse_text(lines: list[str], possible_category_patterns=None, item_pattern=None):
+    """Returns tuple of 5 lists corresponding to dates, categories, items, price range and price average.
+    Dates contains the same date.
+    The pattern arguments are accepted for backwards compatibility; parsing always uses the compiled LINE_PATTERN.
+    """
+    records = parse_records(lines)
+    if not records:
+        return [], [], [], [], []
+    dates, categories, items, pettah_price_ranges, pettah_averages = (list(column) for column in zip(*records))
+    return dates, categories, items, pettah_price_ranges, pettah_averages
@@ -0,0 +1,100 @@
+# utils/heartbeat.py
+# Asynchronous client for the function monitoring heartbeat service (see send_log in log_utils.py).
+# Events are queued and sent by a background task with a timeout and a few retries per request, so a slow or dead
+# heartbeat endpoint never holds up the pipeline stages. Successful PDFs are not sent one by one: they are counted and
+# reported once at the end of the run.
+import asyncio
+import logging
+import aiohttp
+from src.utils import log_utils
+from src.configuration.configuration import (HEARTBEAT_TIMEOUT_SECONDS, HEARTBEAT_MAX_RETRIES, HEARTBEAT_QUEUE_SIZE,
+                                             HEARTBEAT_FLUSH_SECONDS)
+
+class HeartbeatEmitter:
+    """Use as an async context manager around a run. record_success() and record_error() only queue an event and
+    return immediately; leaving the context reports the successes and sends what is queued (within flush_seconds).
+    An empty url (eg: after disable_heartbeat()) turns the emitter into a no-op.
+    """
+
+    def __init__(self, url=None, timeout=HEARTBEAT_TIMEOUT_SECONDS, max_retries=HEARTBEAT_MAX_RETRIES,
+                 queue_size=HEARTBEAT_QUEUE_SIZE, flush_seconds=HEARTBEAT_FLUSH_SECONDS):
+        self.url = log_utils.heartbeat_url if url is None else url
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.flush_seconds = flush_seconds
+        self._queue = asyncio.Queue(maxsize=queue_size)
+        self._session = None
+        self._sender = None
+
+        self.successes = 0
+        self.sent = 0
+        self.failed = 0
+        self.dropped = 0
+
+    async def __aenter__(self):
+        if self.url:
+            self._session = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=self.timeout))
+            self._sender = asyncio.ensure_future(self._send_events())
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        if self._sender is None:
+            return
+
+        async def flush():
+            if self.successes:
+                await self._queue.put((f"Successfully completed data ingestion to Cosmos DB for {self.successes} PDFs.", 0))
+            await self._queue.put((None, None)) # end of the events
+            await self._sender
+
+        try:
+            await asyncio.wait_for(flush(), self.flush_seconds)
+        except asyncio.TimeoutError:
+            self._sender.cancel()
+            logging.warning(f"Heartbeat: gave up on the events still queued after {self.flush_seconds}s")
+        finally:
+            self._sender = None
+            await self._session.close()
+            self._session = None
+        self.log_summary()
+
+    def _put(self, log_print, error_id):
+        try:
+            self._queue.put_nowait((log_print, error_id))
+        except asyncio.QueueFull:
+            self.dropped += 1
+
+    def record_success(self):
+        self.successes += 1
+
+    def record_error(self, log_print):
+        if self._sender is not None:
+            self._put(log_print, 1)
+
+    async def _send_events(self):
+        while True:
+            log_print, error_id = await self._queue.get()
+            if log_print is None:
+                return
+            await self._send(log_utils.get_pdf_log_payload(log_print, error_id))
+
+    async def _send(self, payload):
+        for attempt in range(self.max_retries + 1):
+            try:
+                async with self._session.post(self.url, json=payload) as response:
+                    response.raise_for_status()
+                self.sent += 1
+                return
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                error = e
+            if attempt < self.max_retries:
+                await asyncio.sleep(0.5 * 2 ** attempt)
+        self.failed += 1
+        logging.warning(f"Could not send log to function monitoring service: {error!r}")
+
+    def get_summary(self):
+        return {'successes': self.successes, 'sent': self.sent, 'failed': self.failed, 'dropped': self.dropped}
+
+    def log_summary(self):
+        logging.info(f"Heartbeat: {self.sent} events sent ({self.successes} PDFs reported in one event), "
+                     f"{self.failed} failed, {self.dropped} dropped")
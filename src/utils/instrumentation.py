@@ -0,0 +1,66 @@
+# utils/instrumentation.py
+# Lightweight run instrumentation: timed spans and counters (bytes, rows, documents, retries) collected during a run
+# into a machine readable summary, which update_logs uploads as JSON next to the log file of the run.
+# Spans and counters can be recorded from any thread of the run (download, blob and transform threads).
+import json
+import time
+import threading
+import contextlib
+from datetime import datetime, timezone
+
+class RunMetrics:
+    """Spans ({name: count, seconds, max_seconds}), counters ({name: value}) and summary sections of one run"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """Starts a new run (the module level instance outlives a run in a warm Functions host)"""
+        with self._lock:
+            self.started_at = datetime.now(timezone.utc)
+            self._start = time.perf_counter()
+            self.spans = {}
+            self.counters = {}
+            self.sections = {}
+
+    def add_span(self, name, seconds):
+        with self._lock:
+            span = self.spans.setdefault(name, {'count': 0, 'seconds': 0.0, 'max_seconds': 0.0})
+            span['count'] += 1
+            span['seconds'] += seconds
+            span['max_seconds'] = max(span['max_seconds'], seconds)
+
+    @contextlib.contextmanager
+    def span(self, name):
+        """Times the block as one occurrence of the span name (also when it raises)"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_span(name, time.perf_counter() - start)
+
+    def count(self, name, value=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def add_section(self, name, summary: dict):
+        """Adds the summary of a component (eg: CosmosWriter.get_summary()) to the run summary"""
+        with self._lock:
+            self.sections[name] = summary
+
+    def get_summary(self):
+        with self._lock:
+            return {
+                'started_at': self.started_at.isoformat(),
+                'duration_seconds': round(time.perf_counter() - self._start, 3),
+                'spans': {name: {'count': span['count'], 'seconds': round(span['seconds'], 3),
+                                 'max_seconds': round(span['max_seconds'], 3)} for name, span in self.spans.items()},
+                'counters': dict(self.counters),
+                **self.sections,
+            }
+
+    def to_json(self):
+        return json.dumps(self.get_summary(), indent=1, sort_keys=True)
+
+run_metrics = RunMetrics() # the metrics of the current run, reset by run_main()
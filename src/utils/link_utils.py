@@ -0,0 +1,21 @@
+import re
+from datetime import date
+from urllib.parse import urlsplit, unquote
+
+# bulletin file names end with the bulletin date, eg: daily_21-08-2024.pdf, daily_25-08-16.pdf, daily_029-07-16.pdf,
+# daily_05-02-2020_2.pdf, wholesale_prices_of_rice_14-06-2021.pdf
+BULLETIN_DATE_PATTERN = re.compile(r'(\d{1,3})-(\d{1,2})-(\d{4}|\d{2})(?:_\w+)?\.pdf$', re.IGNORECASE)
+
+def get_bulletin_date(pdf_link):
+    """Returns the bulletin date encoded in the pdf file name as a datetime.date, or None if there is none"""
+    file_name = unquote(urlsplit(pdf_link).path).rsplit('/', 1)[-1].strip() # some links end in %20 padding
+    date_match = BULLETIN_DATE_PATTERN.search(file_name)
+    if date_match is None:
+        return None
+    day, month, year = (int(part) for part in date_match.groups())
+    if year < 100:
+        year += 2000
+    try:
+        return date(year, month, day)
+    except ValueError:
+        return None
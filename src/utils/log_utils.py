@@ -1,11 +1,16 @@
 import requests
+from src.configuration.configuration import HEARTBEAT_URL, HEARTBEAT_TIMEOUT_SECONDS
 
-def send_log(service_type, application_name, project_name, project_sub_name, azure_hosting_name, 
-             developmental_language, description, created_by,log_print, running_within_minutes, error_id):
-    
-    url = "https://dataserviceheartbeat.azurewebsites.net/api/Is-Run-Log"
+heartbeat_url = HEARTBEAT_URL
 
-    data = {
+def disable_heartbeat():
+    """Turns send_log into a no-op for the rest of the process (offline runs)"""
+    global heartbeat_url
+    heartbeat_url = ''
+
+def get_log_payload(service_type, application_name, project_name, project_sub_name, azure_hosting_name,
+                    developmental_language, description, created_by, log_print, running_within_minutes, error_id):
+    return {
         "ServiceType": service_type,
         "ApplicationName": application_name,
         "projectName": project_name,
@@ -18,5 +23,31 @@ def send_log(service_type, application_name, project_name, project_sub_name, azu
         "RunningWithinMinutes": running_within_minutes,
         "ErrorId": error_id,
     }
-    response = requests.post(url, json=data)
+
+def send_log(service_type, application_name, project_name, project_sub_name, azure_hosting_name, 
+             developmental_language, description, created_by,log_print, running_within_minutes, error_id):
+    
+    url = heartbeat_url
+    if not url:
+        return None # heartbeat disabled
+
+    data = get_log_payload(service_type, application_name, project_name, project_sub_name, azure_hosting_name,
+                           developmental_language, description, created_by, log_print, running_within_minutes, error_id)
+    response = requests.post(url, json=data, timeout=HEARTBEAT_TIMEOUT_SECONDS)
     return response.json()
+
+def get_pdf_log_payload(log_print, error_id):
+    """Heartbeat payload with the fields of this function app (error_id 0 for success, 1 for an error)"""
+    return get_log_payload(
+        service_type="Azure Functions",
+        application_name="Harti Food Price Collector Page 1",
+        project_name="Harti Food Price Prediction",
+        project_sub_name="Food Price History",
+        azure_hosting_name="AI Services",
+        developmental_language="Python",
+        description="Sri Lanka Food Prices - Azure Functions",
+        created_by="BrownsAIsevice",
+        log_print=log_print,
+        running_within_minutes=1440,
+        error_id=error_id,
+        )
@@ -0,0 +1,74 @@
+# Compares the earlier iterrows based Cosmos DB document builder with iter_cosmos_documents on a DataFrame of
+# transformed rows built from the sample PDFs in data/ (a different bulletin date per copy).
+# Run from the repository root: python -m tests.cosmos_format_benchmark [rows]
+import os
+import sys
+import glob
+import time
+import uuid
+import pandas as pd
+from src.pipeline1.extraction_engines import extract_with_pdfplumber
+from src.pipeline1.price_batch import parse_price_batch
+from src.pipeline1.data_format_converter import convert_dataframe_to_cosmos_format, iter_cosmos_documents, COSMOS_ID_NAMESPACE
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data')
+
+def legacy_convert_dataframe_to_cosmos_format(df):
+    """convert_dataframe_to_cosmos_format as it was before the column wise builder"""
+    cosmos_db_hartidata = []
+    for _, row in df.iterrows():
+        date_str = row['Date'].isoformat()
+        rate_document = {
+            "id": str(uuid.uuid4()),
+            "date": date_str,
+            "category": row['Category'],
+            "item": row['Item'],
+            "page": row['Page'],
+            "pettah_average": float(row['Pettah Average']) if pd.notna(row['Pettah Average']) else None,
+            "pettah_min_value": float(row['Pettah_Min_Value']) if pd.notna(row['Pettah_Min_Value']) else None,
+            "pettah_max_value": float(row['Pettah_Max_Value']) if pd.notna(row['Pettah_Max_Value']) else None,
+        }
+        cosmos_db_hartidata.append(rate_document)
+    return cosmos_db_hartidata
+
+def build_dataframe(rows):
+    sample_dataframes = []
+    for pdf_path in sorted(glob.glob(os.path.join(DATA_DIR, '*.pdf'))):
+        with open(pdf_path, 'rb') as f:
+            sample_dataframes.append(parse_price_batch(extract_with_pdfplumber(f.read()).split('\n')).to_dataframe())
+    dataframes, row_count, day = [], 0, 0
+    while row_count < rows:
+        df = sample_dataframes[day % len(sample_dataframes)].copy()
+        df['Date'] = pd.Timestamp('2010-01-01') + pd.Timedelta(days=day)
+        dataframes.append(df)
+        row_count += len(df)
+        day += 1
+    return pd.concat(dataframes, ignore_index=True).head(rows)
+
+def without_ids(documents):
+    return [{key: value for key, value in document.items() if key != 'id'} for document in documents]
+
+if __name__ == "__main__":
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    df = build_dataframe(rows)
+
+    start = time.perf_counter()
+    legacy_documents = legacy_convert_dataframe_to_cosmos_format(df)
+    legacy_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    documents = convert_dataframe_to_cosmos_format(df)
+    seconds = time.perf_counter() - start
+
+    # the earlier builder had no partition key field
+    assert without_ids(convert_dataframe_to_cosmos_format(df, 'none')) == without_ids(legacy_documents), \
+        'documents differ from the earlier builder'
+    assert all(document['pk'] == f"{document['category'] or ''}|{document['item']}" for document in documents[:1000])
+    assert [document['id'] for document in iter_cosmos_documents(df)] == [document['id'] for document in documents], 'ids not deterministic'
+    assert all(document['id'] == str(uuid.uuid5(COSMOS_ID_NAMESPACE, f"{document['date']}|{document['category'] or ''}|{document['item']}|{document['page']}"))
+               for document in documents[:1000]), 'ids are not uuid5'
+    assert len({document['id'] for document in documents}) == len(documents), 'duplicate ids'
+
+    print(f"{len(df)} rows, identical documents, deterministic unique ids")
+    print(f"iterrows builder:    {legacy_seconds:6.2f}s ({len(df) / legacy_seconds:9.0f} docs/s)")
+    print(f"column wise builder: {seconds:6.2f}s ({len(df) / seconds:9.0f} docs/s, x{legacy_seconds / seconds:.1f})")
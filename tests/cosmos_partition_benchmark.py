@@ -0,0 +1,170 @@
+# Compares the Cosmos DB partition schemes for a year of bulletins: write requests and RUs per document, and requests,
+# RUs and latency of "price of an item over a date range" queries (query_item_prices).
+# Runs against PartitionedFakeContainer, whose charges are modeled (see below, no real RU numbers), and, when
+# COSMOS_EMULATOR_ENDPOINT and COSMOS_EMULATOR_KEY are set, against the Cosmos DB emulator with the charges it reports.
+# Run from the repository root: python -m tests.cosmos_partition_benchmark [days]
+import os
+import sys
+import time
+import asyncio
+import statistics
+from src.connector.cosmos_db import CosmosWriter, INDEXING_POLICY, query_item_prices
+from src.pipeline1.data_format_converter import convert_dataframe_to_cosmos_format
+from tests.fake_cosmos import FakeContainer
+from tests.cosmos_format_benchmark import build_dataframe
+
+# Charge model of the fake: a document write costs WRITE_RU plus INDEX_TERM_RU per indexed path of the document (every
+# path under the default policy), a query request QUERY_RU plus RESULT_RU per document returned
+WRITE_RU = 5.0
+INDEX_TERM_RU = 0.5
+QUERY_RU = 2.5
+RESULT_RU = 0.05
+QUERY_RANGE_DAYS = 90
+
+def count_index_terms(document, indexing_policy):
+    if indexing_policy is None:
+        return len(document)
+    included = {path['path'].split('/')[1] for path in indexing_policy['includedPaths']}
+    return sum(1 for field in document if field in included) + len(indexing_policy.get('compositeIndexes', []))
+
+class PartitionedFakeContainer(FakeContainer):
+    """FakeContainer with a partition key path, which rejects batches whose documents are not all in the batch's
+    partition (like Cosmos DB does) and answers the query_item_prices query (filtering in Python). Every query request
+    (one per partition, in parallel for a cross partition query) takes latency seconds.
+    """
+
+    def __init__(self, partition_key_path='/pk', indexing_policy=None, **kwargs):
+        super().__init__(**kwargs)
+        self.partition_key_field = partition_key_path.lstrip('/')
+        self.indexing_policy = indexing_policy
+        self.write_charge = 0.0
+        self.query_requests = 0
+        self.query_charge = 0.0
+
+    async def _request(self, documents, response_hook):
+        documents = documents if isinstance(documents, list) else [documents]
+        charge = sum(WRITE_RU + INDEX_TERM_RU * count_index_terms(document, self.indexing_policy) for document in documents)
+        self.write_charge += charge
+        self.requests += 1
+        await asyncio.sleep(self.latency)
+        if response_hook:
+            response_hook({'x-ms-request-charge': str(charge)}, None)
+
+    async def upsert_item(self, body, response_hook=None, **kwargs):
+        await self._request(body, response_hook)
+        self.items[body['id']] = body
+        return body
+
+    async def execute_item_batch(self, batch_operations, partition_key, response_hook=None, **kwargs):
+        documents = [body for _, (body,) in batch_operations]
+        assert all(document.get(self.partition_key_field) == partition_key for document in documents), 'cross partition batch'
+        await self._request(documents, response_hook)
+        for document in documents:
+            self.items[document['id']] = document
+        return [{'statusCode': 200, 'resourceBody': document} for document in documents]
+
+    def query_items(self, query, parameters, partition_key=None, **kwargs):
+        values = {parameter['name']: parameter['value'] for parameter in parameters}
+        partitions = {}
+        for document in self.items.values():
+            partitions.setdefault(document.get(self.partition_key_field), []).append(document)
+        scanned = [partitions.get(partition_key, [])] if partition_key is not None else list(partitions.values())
+
+        async def query_partition(documents):
+            await asyncio.sleep(self.latency)
+            rows = [{key: document[key] for key in ('date', 'pettah_average', 'pettah_min_value', 'pettah_max_value')}
+                    for document in documents if document['category'] == values['@category'] and document['item'] == values['@item']
+                    and values['@start_date'] <= document['date'] <= values['@end_date']]
+            self.query_requests += 1
+            self.query_charge += QUERY_RU + RESULT_RU * len(rows)
+            return rows
+
+        async def results():
+            for rows in await asyncio.gather(*(query_partition(documents) for documents in scanned)):
+                for row in sorted(rows, key=lambda row: row['date']):
+                    yield row
+        return results()
+
+def get_query_ranges(documents, count=20):
+    """(category, item, start date, end date) of count item queries over QUERY_RANGE_DAYS spread over the data"""
+    items = sorted({(document['category'], document['item']) for document in documents})
+    dates = sorted({document['date'][:10] for document in documents})
+    ranges = []
+    for i in range(count):
+        start = dates[(i * 7) % max(len(dates) - QUERY_RANGE_DAYS, 1)]
+        end = dates[min(dates.index(start) + QUERY_RANGE_DAYS, len(dates) - 1)]
+        ranges.append((*items[i % len(items)], start, end))
+    return ranges
+
+async def write_by_month(cosmos_writer, documents):
+    """Writes the documents a month at a time, like the coalesced Cosmos DB sink"""
+    months = {}
+    for document in documents:
+        months.setdefault(document['date'][:7], []).append(document)
+    for month_documents in months.values():
+        await cosmos_writer.write(month_documents)
+
+async def run_queries(container, query_ranges, partition_scheme):
+    latencies, rows = [], 0
+    for category, item, start_date, end_date in query_ranges:
+        start = time.perf_counter()
+        rows += len(await query_item_prices(container, category, item, start_date, end_date, partition_scheme))
+        latencies.append(time.perf_counter() - start)
+    return latencies, rows
+
+async def benchmark_fake(dataframe, partition_scheme, indexing_policy):
+    documents = convert_dataframe_to_cosmos_format(dataframe, partition_scheme)
+    container = PartitionedFakeContainer('/pk' if partition_scheme != 'none' else '/currency', indexing_policy, latency=0.002)
+    async with CosmosWriter(container=container, partition_key_path='/pk' if partition_scheme != 'none' else '/currency') as cosmos_writer:
+        await write_by_month(cosmos_writer, documents)
+    query_ranges = get_query_ranges(documents)
+    latencies, rows = await run_queries(container, query_ranges, partition_scheme)
+    return {
+        'write_requests': container.requests,
+        'write_ru_per_document': round(container.write_charge / len(documents), 2),
+        'query_requests': round(container.query_requests / len(query_ranges), 1),
+        'query_ru': round(container.query_charge / len(query_ranges), 2),
+        'query_ms_median': round(statistics.median(latencies) * 1000, 1),
+        'rows_per_query': round(rows / len(query_ranges), 1),
+    }
+
+async def benchmark_emulator(dataframe, endpoint, key):
+    """Same writes and queries against the Cosmos DB emulator, in a database of its own that is deleted afterwards"""
+    from azure.cosmos.aio import CosmosClient
+    from src.connector.cosmos_db import get_or_create_container
+    results = {}
+    async with CosmosClient(endpoint, credential=key, connection_verify=False) as client:
+        database = await client.create_database_if_not_exists(f'partition-benchmark-{os.getpid()}')
+        try:
+            for partition_scheme, indexing_policy in (('none', None), ('item', INDEXING_POLICY), ('month', INDEXING_POLICY)):
+                documents = convert_dataframe_to_cosmos_format(dataframe, partition_scheme)
+                partition_key_path = '/pk' if partition_scheme != 'none' else '/currency'
+                container, _ = await get_or_create_container(database, f'prices-{partition_scheme}', partition_key_path,
+                                                             indexing_policy or {'indexingMode': 'consistent', 'automatic': True})
+                async with CosmosWriter(container=container, partition_key_path=partition_key_path) as cosmos_writer:
+                    await write_by_month(cosmos_writer, documents)
+                latencies, rows = await run_queries(container, get_query_ranges(documents), partition_scheme)
+                results[partition_scheme] = {
+                    'write_ru_per_document': round(cosmos_writer.request_charge / len(documents), 2),
+                    'write_seconds': round(cosmos_writer.write_seconds, 2),
+                    'query_ms_median': round(statistics.median(latencies) * 1000, 1),
+                    'rows_per_query': round(rows / len(latencies), 1),
+                }
+        finally:
+            await client.delete_database(database)
+    return results
+
+if __name__ == "__main__":
+    days = int(sys.argv[1]) if len(sys.argv) > 1 else 365
+    dataframe = build_dataframe(days * 21)
+    print(f"{len(dataframe)} documents over about {days} days, {QUERY_RANGE_DAYS} day item queries")
+    print("fake container (modeled charges):")
+    for partition_scheme, indexing_policy in (('none', None), ('item', INDEXING_POLICY), ('month', INDEXING_POLICY)):
+        summary = asyncio.run(benchmark_fake(dataframe, partition_scheme, indexing_policy))
+        print(f"  {partition_scheme:5} partitions, {'custom' if indexing_policy else 'default'} indexing: {summary}")
+
+    endpoint, key = os.getenv('COSMOS_EMULATOR_ENDPOINT'), os.getenv('COSMOS_EMULATOR_KEY')
+    if endpoint and key:
+        print("emulator:")
+        for partition_scheme, summary in asyncio.run(benchmark_emulator(dataframe, endpoint, key)).items():
+            print(f"  {partition_scheme:5} partitions: {summary}")
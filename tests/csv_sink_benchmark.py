@@ -0,0 +1,42 @@
+# Compares bytes transferred per PDF by the old read-modify-write monthly csv upload and the append based sink,
+# using the local blob store backend. Run from the repository root: python -m tests.csv_sink_benchmark [days]
+import io
+import os
+import sys
+import tempfile
+from src.connector.blob import upload_to_blob, get_monthly_csv_name
+from src.connector.blob_store import LocalBlobStore
+from src.pipeline1.text_extractor_all import extract_text_from_first_page
+from src.pipeline1.text_to_lists import parse_text, get_patterns
+from src.pipeline1.lists_to_dataframe import create_dataframe
+from src.pipeline1.data_transformer import transform_dataframe
+from src.pipeline1.data_format_converter import dataframe_to_csv_string
+
+SAMPLE_PDF = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data', 'daily_16-07-2024.pdf')
+
+def legacy_upload_to_blob(csv_data, actual_date_str, blob_store):
+    """The earlier upload_to_blob: download the whole month, prepend the new rows, upload the whole month"""
+    file_name = get_monthly_csv_name(actual_date_str)
+    existing_csv_data = (blob_store.read(file_name) or b'').decode('utf-8')
+    if existing_csv_data != '':
+        existing_csv_data = existing_csv_data.split('\n', maxsplit=1)[1]
+    blob_store.write(file_name, (csv_data + existing_csv_data).encode('utf-8'))
+
+def run(upload, csv_data, days):
+    with tempfile.TemporaryDirectory() as directory:
+        blob_store = LocalBlobStore(directory)
+        for day in range(1, days + 1):
+            upload(csv_data, f'24-07-{day:02d}', blob_store)
+        return blob_store.bytes_uploaded + blob_store.bytes_downloaded
+
+if __name__ == "__main__":
+    days = int(sys.argv[1]) if len(sys.argv) > 1 else 30
+    with open(SAMPLE_PDF, 'rb') as f:
+        lines = extract_text_from_first_page(io.BytesIO(f.read())).split('\n')
+    csv_data, _ = dataframe_to_csv_string(transform_dataframe(create_dataframe(*parse_text(lines, *get_patterns()))))
+
+    legacy_bytes = run(legacy_upload_to_blob, csv_data, days)
+    append_bytes = run(upload_to_blob, csv_data, days)
+    print(f"{days} bulletins into one monthly csv ({len(csv_data)} bytes of csv per bulletin)")
+    print(f"read-modify-write: {legacy_bytes} bytes transferred, {legacy_bytes / days:.0f} bytes per PDF")
+    print(f"append:            {append_bytes} bytes transferred, {append_bytes / days:.0f} bytes per PDF")
@@ -0,0 +1,21 @@
+# Runs every first page extraction engine over the sample PDFs in data/, checks that parse_text yields rows identical
+# to pdfplumber's and reports the fastest engine that does. Run from the repository root: python -m tests.engine_benchmark
+import os
+import glob
+from src.pipeline1.extraction_engines import benchmark_engines, select_fastest_engine
+from src.pipeline1.text_to_lists import parse_text, get_patterns
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data')
+
+def parse_rows(extracted_text):
+    return list(zip(*parse_text(extracted_text.split('\n'), *get_patterns())))
+
+if __name__ == "__main__":
+    sample_pdfs = []
+    for pdf_path in sorted(glob.glob(os.path.join(DATA_DIR, '*.pdf'))):
+        with open(pdf_path, 'rb') as f: sample_pdfs.append(f.read())
+
+    results = benchmark_engines(sample_pdfs, parse_rows)
+    for name, (seconds, identical) in sorted(results.items(), key=lambda result: result[1][0]):
+        print(f"{name:>10}: {seconds / len(sample_pdfs) * 1000:8.1f} ms per PDF, rows {'identical' if identical else 'DIFFERENT'}")
+    print(f"fastest engine with identical rows: {select_fastest_engine(results)} (set EXTRACTION_ENGINE to use it)")
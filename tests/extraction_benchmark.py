@@ -0,0 +1,42 @@
+# Measures text extraction throughput over the sample PDFs in data/ for different worker counts, through the executor
+# call the pipeline's extract stage makes (header probe, then the EXTRACTION_PAGES of each accepted PDF).
+# Run from the repository root: python -m tests.extraction_benchmark [copies]
+import os
+import sys
+import glob
+import time
+import asyncio
+from src.configuration.configuration import metadata_line1, EXTRACTION_PAGES
+from src.pipeline1.extraction_executor import ExtractionExecutor
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data')
+
+def load_sample_pdfs(copies):
+    sample_pdfs = []
+    for pdf_path in sorted(glob.glob(os.path.join(DATA_DIR, '*.pdf'))):
+        with open(pdf_path, 'rb') as f: sample_pdfs.append(f.read())
+    return sample_pdfs * copies
+
+async def extract_all(extraction_executor, pdfs):
+    return await asyncio.gather(*(extraction_executor.extract_pages_if_accepted(pdf_bytes, metadata_line1, EXTRACTION_PAGES)
+                                   for pdf_bytes in pdfs))
+
+def run_benchmark(workers, pdfs):
+    with ExtractionExecutor(workers=workers) as extraction_executor:
+        start = time.perf_counter()
+        texts = asyncio.run(extract_all(extraction_executor, pdfs))
+        elapsed = time.perf_counter() - start
+    return elapsed, texts
+
+if __name__ == "__main__":
+    copies = int(sys.argv[1]) if len(sys.argv) > 1 else 4
+    pdfs = load_sample_pdfs(copies)
+    worker_counts = sorted({0, 1, 2, 4, os.cpu_count() or 1})
+
+    serial_elapsed, serial_texts = run_benchmark(0, pdfs)
+    print(f"{len(pdfs)} PDFs, {os.cpu_count()} CPU cores")
+    print(f"workers=serial: {serial_elapsed:.2f}s ({len(pdfs) / serial_elapsed:.2f} PDFs/s) speedup x1.00")
+    for workers in worker_counts[1:]:
+        elapsed, texts = run_benchmark(workers, pdfs)
+        assert texts == serial_texts, 'parallel extraction returned different text'
+        print(f"workers={workers}: {elapsed:.2f}s ({len(pdfs) / elapsed:.2f} PDFs/s) speedup x{serial_elapsed / elapsed:.2f}")
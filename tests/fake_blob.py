@@ -0,0 +1,209 @@
+# In-memory stand-in for an azure.storage.blob ContainerClient, for exercising AzureBlobStore and the connector
+# functions locally. Run from the repository root to check AzureBlobStore against the fake and LocalBlobStore:
+#   python -m tests.fake_blob
+# With AZURITE_CONNECTION_STRING set (the development storage connection string: DefaultEndpointsProtocol=http;
+# AccountName=devstoreaccount1;AccountKey=...;BlobEndpoint=http://127.0.0.1:10000/devstoreaccount1;) the same checks
+# also run against Azurite.
+import os
+import tempfile
+import itertools
+from types import SimpleNamespace
+from azure.core import MatchConditions
+from azure.core.exceptions import HttpResponseError, ResourceNotFoundError, ResourceExistsError, ResourceModifiedError
+
+_etags = itertools.count(1)
+
+def lease_conflict(error_code, message):
+    error = HttpResponseError(message)
+    error.error_code = error_code
+    return error
+
+class FakeBlob:
+    def __init__(self, blob_type, data=b'', metadata=None):
+        self.blob_type = blob_type
+        self.data = data
+        self.metadata = metadata or {}
+        self.lease_id = None # leases don't expire in the fake
+        self.etag = f'"{next(_etags)}"'
+
+    def modified(self):
+        self.etag = f'"{next(_etags)}"'
+
+class FakeLease:
+    def __init__(self, blob_client, lease_id):
+        self.blob_client = blob_client
+        self.id = lease_id
+
+    def release(self, **kwargs):
+        blob = self.blob_client._blob()
+        if blob.lease_id == self.id:
+            blob.lease_id = None
+
+class FakeBlobClient:
+
+    def __init__(self, container, name):
+        self.container = container
+        self.blob_name = name
+
+    def _check_conditions(self, etag=None, match_condition=None, lease=None, **kwargs):
+        blob = self.container.blobs.get(self.blob_name)
+        if blob is not None and blob.lease_id is not None and (lease is None or lease.id != blob.lease_id):
+            raise lease_conflict('LeaseIdMissing', 'There is currently a lease on the blob and no lease ID was specified.')
+        if match_condition == MatchConditions.IfMissing and blob is not None:
+            raise ResourceExistsError('The specified blob already exists.')
+        if match_condition == MatchConditions.IfNotModified and (blob is None or blob.etag != etag):
+            raise ResourceModifiedError('The condition specified using HTTP conditional header(s) is not met.')
+
+    def _blob(self):
+        blob = self.container.blobs.get(self.blob_name)
+        if blob is None:
+            raise ResourceNotFoundError('The specified blob does not exist.')
+        return blob
+
+    def get_blob_properties(self, **kwargs):
+        blob = self._blob()
+        return SimpleNamespace(blob_type=blob.blob_type, size=len(blob.data), etag=blob.etag, metadata=dict(blob.metadata))
+
+    def exists(self, **kwargs):
+        return self.blob_name in self.container.blobs
+
+    def create_append_blob(self, metadata=None, **kwargs):
+        self._check_conditions(**kwargs)
+        self.container.requests += 1
+        previous = self.container.blobs.get(self.blob_name)
+        self.container.blobs[self.blob_name] = FakeBlob('AppendBlob', metadata=metadata)
+        if previous is not None:
+            self.container.blobs[self.blob_name].lease_id = previous.lease_id # a lease outlives the overwrite
+
+    def set_blob_metadata(self, metadata=None, **kwargs):
+        self._check_conditions(**kwargs)
+        self.container.requests += 1
+        blob = self._blob()
+        blob.metadata = dict(metadata or {})
+        blob.modified()
+
+    def acquire_lease(self, lease_duration=-1, **kwargs):
+        blob = self._blob()
+        if blob.lease_id is not None:
+            raise lease_conflict('LeaseAlreadyPresent', 'There is already a lease present.')
+        self._check_conditions(**kwargs)
+        self.container.requests += 1
+        blob.lease_id = f'lease-{next(_etags)}'
+        return FakeLease(self, blob.lease_id)
+
+    def append_block(self, data, **kwargs):
+        self._check_conditions(**kwargs)
+        self.container.requests += 1
+        blob = self._blob()
+        assert blob.blob_type == 'AppendBlob', 'append_block on a block blob'
+        blob.data += data
+        blob.modified()
+
+    def upload_blob(self, data, overwrite=False, **kwargs):
+        if not overwrite and self.blob_name in self.container.blobs:
+            raise ResourceExistsError('The specified blob already exists.')
+        self._check_conditions(**kwargs)
+        self.container.requests += 1
+        blob = FakeBlob('BlockBlob', data.encode('utf-8') if isinstance(data, str) else bytes(data))
+        self.container.blobs[self.blob_name] = blob
+        return {'etag': blob.etag}
+
+    def download_blob(self, encoding=None, etag=None, match_condition=None, **kwargs):
+        blob = self._blob()
+        if match_condition == MatchConditions.IfNotModified and blob.etag != etag:
+            raise ResourceModifiedError('The condition specified using HTTP conditional header(s) is not met.')
+        self.container.requests += 1
+        data = blob.data.decode(encoding) if encoding else blob.data
+        return SimpleNamespace(readall=lambda: data, properties=SimpleNamespace(etag=blob.etag))
+
+    def delete_blob(self, **kwargs):
+        self._check_conditions(**kwargs)
+        self._blob()
+        self.container.requests += 1
+        del self.container.blobs[self.blob_name]
+
+class FakeContainerClient:
+    """Blobs in a dict keyed by name: {name: FakeBlob}. requests counts the calls that would be HTTP requests."""
+
+    def __init__(self):
+        self.blobs = {}
+        self.requests = 0
+
+    def get_blob_client(self, blob):
+        return FakeBlobClient(self, blob)
+
+    def download_blob(self, blob, **kwargs):
+        return self.get_blob_client(blob).download_blob(**kwargs)
+
+    def upload_blob(self, name, data, **kwargs):
+        return self.get_blob_client(name).upload_blob(data, **kwargs)
+
+    def delete_blob(self, blob, **kwargs):
+        self.get_blob_client(blob).delete_blob(**kwargs)
+
+    def list_blobs(self, name_starts_with=None, **kwargs):
+        self.requests += 1
+        return [SimpleNamespace(name=name) for name in sorted(self.blobs) if name.startswith(name_starts_with or '')]
+
+def check_blob_store(blob_store):
+    """Exercises the blob store interface; returns the state it ends with for comparison between backends"""
+    from src.connector.blob_store import ConditionalWriteError
+    assert blob_store.read('missing.txt') is None
+    etag = blob_store.write('state.json', b'{"a": 1}', if_missing=True)
+    try:
+        blob_store.write('state.json', b'{}', if_missing=True)
+        raise AssertionError('if_missing write of an existing blob succeeded')
+    except ConditionalWriteError:
+        pass
+    blob_store.write('state.json', b'{"a": 2}', etag=etag)
+    blob_store.append('2024-8.csv', b'row 1\n', header=b'header\n')
+    blob_store.append('2024-8.csv', b'row 2\n', header=b'header\n')
+    blob_store.append('2024-8.hashes', b'')
+    blob_store.write('log1.txt', b'old log')
+    blob_store.delete('log1.txt')
+    return {name: blob_store.read(name) for name in blob_store.list_names()}
+
+def check_append_blob_conversion():
+    """Appends to a block blob (converted to an append blob on the way), and to a blob whose conversion was
+    interrupted after it was recreated as an empty append blob: both end with the old content followed by the rows.
+    """
+    from src.connector.blob_store import AzureBlobStore, CONVERSION_BACKUP_SUFFIX, CONVERSION_METADATA_KEY
+    from src.connector.blob_connector import BlobConnector
+    container_client = FakeContainerClient()
+    blob_store = AzureBlobStore(blob_connector=BlobConnector(container_client=container_client))
+    container_client.upload_blob('2024-7.csv', b'header\nrow 1\n')
+    blob_store.append('2024-7.csv', b'row 2\n', header=b'header\n')
+
+    backup_name = '2024-8.csv' + CONVERSION_BACKUP_SUFFIX
+    container_client.upload_blob(backup_name, b'header\nrow 1\n')
+    container_client.blobs['2024-8.csv'] = FakeBlob('AppendBlob', metadata={CONVERSION_METADATA_KEY: backup_name})
+    blob_store.append('2024-8.csv', b'row 2\n', header=b'header\n')
+    for name in ('2024-7.csv', '2024-8.csv'):
+        blob = container_client.blobs[name]
+        assert (blob.blob_type, blob.data, blob.metadata, blob.lease_id) == ('AppendBlob', b'header\nrow 1\nrow 2\n', {}, None), name
+    assert sorted(container_client.blobs) == ['2024-7.csv', '2024-8.csv'], 'backup left behind'
+
+if __name__ == "__main__":
+    from src.connector.blob_store import AzureBlobStore, LocalBlobStore
+    from src.connector.blob_connector import BlobConnector
+
+    container_client = FakeContainerClient()
+    with BlobConnector(container_client=container_client) as blob_connector:
+        fake_state = check_blob_store(AzureBlobStore(blob_connector=blob_connector))
+    local_state = check_blob_store(LocalBlobStore(tempfile.mkdtemp()))
+    assert fake_state == local_state, (fake_state, local_state)
+    print(f"in-memory container: {container_client.requests} requests, state matches LocalBlobStore: {sorted(fake_state)}")
+    check_append_blob_conversion()
+    print("in-memory container: block blob and interrupted conversions to append blobs keep their content")
+
+    azurite_connection_string = os.getenv('AZURITE_CONNECTION_STRING')
+    if azurite_connection_string:
+        container_name = f'fake-blob-check-{os.getpid()}'
+        with BlobConnector(connection_string=azurite_connection_string, container_name=container_name) as blob_connector:
+            blob_connector.container_client.create_container()
+            try:
+                azurite_state = check_blob_store(AzureBlobStore(blob_connector=blob_connector))
+            finally:
+                blob_connector.container_client.delete_container()
+        assert azurite_state == local_state, (azurite_state, local_state)
+        print("Azurite: state matches LocalBlobStore")
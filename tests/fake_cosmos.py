@@ -0,0 +1,55 @@
+# In-memory stand-in for an azure.cosmos.aio ContainerProxy, for exercising the Cosmos DB writer locally.
+# Run from the repository root to compare writer throughput: python -m tests.fake_cosmos
+import asyncio
+from azure.cosmos import exceptions
+
+class FakeContainer:
+    """Stores upserted documents in a dict keyed by id. Each request takes latency seconds and charges
+    request_charge RUs per document; every throttle_every-th request is rejected with a 429 first.
+    """
+
+    def __init__(self, latency=0.01, request_charge=10.0, throttle_every=0, retry_after_ms=5):
+        self.items = {}
+        self.latency = latency
+        self.request_charge = request_charge
+        self.throttle_every = throttle_every
+        self.retry_after_ms = retry_after_ms
+        self.requests = 0
+        self.throttled = 0
+
+    async def _request(self, document_count, response_hook):
+        self.requests += 1
+        await asyncio.sleep(self.latency)
+        if self.throttle_every and self.requests % self.throttle_every == 0:
+            self.throttled += 1
+            error = exceptions.CosmosHttpResponseError(status_code=429, message='Request rate is large')
+            error.headers = {'x-ms-retry-after-ms': str(self.retry_after_ms)}
+            raise error
+        if response_hook:
+            response_hook({'x-ms-request-charge': str(self.request_charge * document_count)}, None)
+
+    async def upsert_item(self, body, response_hook=None, **kwargs):
+        await self._request(1, response_hook)
+        self.items[body['id']] = body
+        return body
+
+    async def execute_item_batch(self, batch_operations, partition_key, response_hook=None, **kwargs):
+        await self._request(len(batch_operations), response_hook)
+        for operation, (body,) in batch_operations:
+            self.items[body['id']] = body
+        return [{'statusCode': 200, 'resourceBody': body} for operation, (body,) in batch_operations]
+
+async def write_documents(documents, max_concurrency, throttle_every):
+    from src.connector.cosmos_db import CosmosWriter
+    container = FakeContainer(throttle_every=throttle_every)
+    async with CosmosWriter(container=container, max_concurrency=max_concurrency) as writer:
+        await writer.write(documents)
+    assert len(container.items) == len(documents)
+    return writer.get_summary()
+
+if __name__ == "__main__":
+    documents = [{'id': str(i), 'item': f'item {i % 25}'} for i in range(500)]
+    batched_documents = [dict(document, pk='LKR') for document in documents]
+    for max_concurrency in (1, 4, 16):
+        print(f"individual upserts, concurrency={max_concurrency}: {asyncio.run(write_documents(documents, max_concurrency, 7))}")
+    print(f"transactional batches, concurrency=16: {asyncio.run(write_documents(batched_documents, 16, 7))}")
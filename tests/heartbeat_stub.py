@@ -0,0 +1,79 @@
+# Runs the HeartbeatEmitter against a local stub of the heartbeat service: a healthy, a flaky and a hanging endpoint.
+# Run from the repository root: python -m tests.heartbeat_stub
+import json
+import time
+import asyncio
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from src.utils.heartbeat import HeartbeatEmitter
+
+class StubHandler(BaseHTTPRequestHandler):
+    """Records the posted payloads. The first `failures` requests get a 500, every request waits `delay` seconds."""
+    delay = 0.0
+    failures = 0
+    received = None
+
+    def do_POST(self):
+        payload = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        time.sleep(self.delay)
+        if type(self).failures > 0:
+            type(self).failures -= 1
+            self.send_response(500)
+            self.end_headers()
+            return
+        self.received.append(payload)
+        body = b'{"status": "ok"}'
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+def start_stub(delay=0.0, failures=0):
+    """Starts the stub on a free local port. Returns (server, url, list of received payloads)"""
+    received = []
+    handler = type('Handler', (StubHandler,), {'delay': delay, 'failures': failures, 'received': received})
+    server = ThreadingHTTPServer(('127.0.0.1', 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f'http://127.0.0.1:{server.server_address[1]}/api/Is-Run-Log', received
+
+async def simulate_run(url, pdfs=20, errors=2, **emitter_options):
+    """Reports pdfs successes and errors like the pipeline does. Returns (emitter, seconds the stages spent reporting, total seconds)"""
+    start = time.perf_counter()
+    reporting_seconds = 0.0
+    async with HeartbeatEmitter(url=url, **emitter_options) as heartbeat:
+        for i in range(pdfs):
+            await asyncio.sleep(0.01) # a pipeline stage doing work
+            reporting_start = time.perf_counter()
+            if i < errors:
+                heartbeat.record_error(f"An error occurred: simulated failure {i}")
+            else:
+                heartbeat.record_success()
+            reporting_seconds += time.perf_counter() - reporting_start
+    return heartbeat, reporting_seconds, time.perf_counter() - start
+
+def run_scenario(name, delay=0.0, failures=0, disabled=False, **emitter_options):
+    server, url, received = start_stub(delay=delay, failures=failures)
+    heartbeat, reporting_seconds, total_seconds = asyncio.run(simulate_run('' if disabled else url, **emitter_options))
+    server.shutdown()
+    print(f"{name}: {len(received)} payloads received, summary {heartbeat.get_summary()}, "
+          f"{reporting_seconds * 1000:.2f}ms spent reporting, run {total_seconds:.2f}s")
+    return heartbeat, received
+
+if __name__ == "__main__":
+    heartbeat, received = run_scenario('healthy')
+    assert [payload['ErrorId'] for payload in received] == [1, 1, 0], received
+    assert '18 PDFs' in received[-1]['LogPrint']
+
+    heartbeat, received = run_scenario('flaky (first 2 requests fail)', failures=2)
+    assert len(received) == 3 and heartbeat.failed == 0
+
+    heartbeat, received = run_scenario('hanging (5s per request)', delay=5.0, timeout=0.2, max_retries=1, flush_seconds=1.0)
+    assert heartbeat.sent == 0
+
+    heartbeat, received = run_scenario('disabled', disabled=True)
+    assert heartbeat.sent == 0 and not received
+    print("OK")
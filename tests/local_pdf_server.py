@@ -0,0 +1,113 @@
+# Serves the sample bulletins in data/ over a local HTTP server and downloads them through the download stage of the
+# stage pipeline, for several download worker counts. The first page texts of the samples stand in for the extraction
+# (as a page text artifact would), so the run time is the one of the downloads. The PDF cache is off.
+# Run from the repository root: python -m tests.local_pdf_server
+import os
+import time
+import asyncio
+import threading
+from functools import partial
+from http.server import ThreadingHTTPServer, SimpleHTTPRequestHandler
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data')
+
+class SlowHandler(SimpleHTTPRequestHandler):
+    """Adds a fixed delay to each response to imitate the round trip to harti.gov.lk"""
+    delay = 0.0
+
+    def do_GET(self):
+        time.sleep(self.delay)
+        super().do_GET()
+
+    def log_message(self, format, *args):
+        pass
+
+class RangeHandler(SlowHandler):
+    """Also answers single range requests (Range: bytes=start-end, bytes=start- and bytes=-suffix) with 206 Partial Content,
+    like harti.gov.lk's web server. Counts the bytes served in RangeHandler.bytes_sent.
+    """
+    bytes_sent = 0
+
+    def do_GET(self):
+        time.sleep(self.delay)
+        range_header = self.headers.get('Range')
+        path = self.translate_path(self.path)
+        if not range_header or not range_header.startswith('bytes=') or ',' in range_header or not os.path.isfile(path):
+            return super(SlowHandler, self).do_GET()
+        with open(path, 'rb') as f:
+            content = f.read()
+        first, last = range_header[len('bytes='):].split('-')
+        if first == '':
+            start, end = max(len(content) - int(last), 0), len(content) - 1
+        else:
+            start, end = int(first), min(int(last) if last else len(content) - 1, len(content) - 1)
+        if start > end:
+            self.send_error(416, 'Requested Range Not Satisfiable')
+            return
+        body = content[start:end + 1]
+        self.send_response(206)
+        self.send_header('Content-Type', 'application/pdf')
+        self.send_header('Content-Range', f'bytes {start}-{end}/{len(content)}')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+        RangeHandler.bytes_sent += len(body)
+
+def start_server(directory=DATA_DIR, delay=0.0, handler_class=SlowHandler):
+    """Starts a threaded HTTP server on a free local port serving directory. Returns (server, base_url)"""
+    handler = type('Handler', (handler_class,), {'delay': delay})
+    server = ThreadingHTTPServer(('127.0.0.1', 0), partial(handler, directory=directory))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f'http://127.0.0.1:{server.server_address[1]}/'
+
+def sample_pdf_links(base_url, copies=1):
+    """Returns links to every PDF in data/, repeated copies times (with a query string so each link is distinct)"""
+    pdf_names = sorted(name for name in os.listdir(DATA_DIR) if name.endswith('.pdf'))
+    return [f'{base_url}{name}?copy={k}' for k in range(copies) for name in pdf_names]
+
+async def download_all(pdf_links, download_workers):
+    """Runs pdf_links through the stage pipeline against the in-memory blob container and Cosmos DB container.
+    Returns the number of links downloaded and completed.
+    """
+    from src.connector.blob_store import AzureBlobStore
+    from src.connector.blob_connector import BlobConnector
+    from src.connector.cosmos_db import CosmosWriter
+    from src.pipeline1.change_detection import RowHashIndex
+    from src.pipeline1.extraction_executor import ExtractionExecutor
+    from src.pipeline1.stages import PdfPipeline
+    from src.pipeline1.text_extractor_all import open_pdf, extract_text_from_first_page
+    from tests.fake_blob import FakeContainerClient
+    from tests.fake_cosmos import FakeContainer
+
+    first_page_texts = {}
+    for name in os.listdir(DATA_DIR):
+        if name.endswith('.pdf'):
+            with open(os.path.join(DATA_DIR, name), 'rb') as f:
+                first_page_texts[name] = extract_text_from_first_page(f)
+
+    def fetch_pdf(pdf_link):
+        name = pdf_link.rsplit('/', 1)[1].split('?')[0]
+        pdf_data = open_pdf(pdf_link)
+        assert len(pdf_data.getvalue()) == os.path.getsize(os.path.join(DATA_DIR, name)), f'{pdf_link}: incomplete download'
+        return {1: first_page_texts[name]}
+
+    blob_store = AzureBlobStore(blob_connector=BlobConnector(container_client=FakeContainerClient()))
+    completed = []
+    with ExtractionExecutor(workers=0) as extraction_executor:
+        async with CosmosWriter(container=FakeContainer()) as cosmos_writer:
+            pipeline = PdfPipeline(extraction_executor, cosmos_writer, blob_store, RowHashIndex(blob_store),
+                                   on_completed=completed.append, on_failed=print, fetch_pdf=fetch_pdf,
+                                   download_workers=download_workers)
+            await pipeline.run(pdf_links)
+    return len(completed)
+
+if __name__ == "__main__":
+    os.environ['PDF_CACHE_DIR'] = '' # every round downloads the PDFs again
+    server, base_url = start_server(delay=0.2)
+    pdf_links = sample_pdf_links(base_url, copies=10)
+    for download_workers in (1, 4, 8):
+        start = time.perf_counter()
+        downloaded = asyncio.run(download_all(pdf_links, download_workers))
+        elapsed = time.perf_counter() - start
+        print(f"download workers={download_workers}: downloaded {downloaded}/{len(pdf_links)} PDFs in {elapsed:.2f}s")
+    server.shutdown()
@@ -0,0 +1,48 @@
+# Compares extracting a set of pages from each sample bulletin in data/ with one open of the PDF against one open per
+# page (what separate page ETLs each reading the PDF cost), checks the text is the same and round trips it through a
+# page text artifact.
+# Run from the repository root: python -m tests.page_text_benchmark [pages, eg: 1,2,3] [engine]
+import os
+import sys
+import glob
+import time
+import tempfile
+from src.configuration.configuration import EXTRACTION_ENGINE
+from src.connector.blob_store import LocalBlobStore
+from src.connector.page_text_store import PageTextStore
+from src.pipeline1.stages import get_pdf_file_version
+from src.pipeline1.text_extractor_all import extract_text_from_pages
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data')
+
+if __name__ == "__main__":
+    page_numbers = [int(page) for page in sys.argv[1].split(',')] if len(sys.argv) > 1 else [1, 2, 3]
+    engine = sys.argv[2] if len(sys.argv) > 2 else EXTRACTION_ENGINE
+    page_text_store = PageTextStore(LocalBlobStore(tempfile.mkdtemp()), engine)
+    single_open_seconds = per_page_seconds = 0.0
+    for pdf_path in sorted(glob.glob(os.path.join(DATA_DIR, '*.pdf'))):
+        with open(pdf_path, 'rb') as f:
+            pdf_bytes = f.read()
+        start = time.perf_counter()
+        page_texts = extract_text_from_pages(pdf_bytes, page_numbers, engine)
+        single_open_seconds += time.perf_counter() - start
+
+        start = time.perf_counter()
+        per_page_texts = {}
+        for page_number in page_numbers:
+            per_page_texts.update(extract_text_from_pages(pdf_bytes, [page_number], engine))
+        per_page_seconds += time.perf_counter() - start
+        assert page_texts == per_page_texts, f'{pdf_path}: different text with one open'
+
+        pdf_link = 'https://www.harti.gov.lk/images/download/market_information/2024/' + os.path.basename(pdf_path)
+        pdf_version = get_pdf_file_version(pdf_path)
+        page_text_store.put(pdf_link, page_texts, page_numbers, pdf_version)
+        assert page_text_store.get(pdf_link, page_numbers, pdf_version) == page_texts
+        assert page_text_store.get(pdf_link, page_numbers + [max(page_numbers) + 1], pdf_version) is None # not extracted
+        assert page_text_store.get(pdf_link, page_numbers, dict(pdf_version, size=0)) is None # PDF re-published
+        assert page_text_store.get(pdf_link.replace('/2024/', '/2023/'), page_numbers, pdf_version) is None # other path
+        print(f"{os.path.basename(pdf_path)}: pages {sorted(page_texts)} of {page_numbers}, "
+              f"{sum(len(text) for text in page_texts.values())} characters")
+    print(f"{engine}, pages {page_numbers}: one open per bulletin {single_open_seconds:.2f}s, "
+          f"one open per page {per_page_seconds:.2f}s")
+    print("OK")
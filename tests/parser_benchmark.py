@@ -0,0 +1,97 @@
+# Golden output check and micro benchmark of parse_text against the earlier per-line multi-regex parser, over the
+# first page text of the sample PDFs in data/. Run from the repository root: python -m tests.parser_benchmark [repeats]
+import os
+import re
+import sys
+import glob
+import time
+from src.pipeline1.extraction_engines import extract_with_pdfplumber
+from src.pipeline1.text_to_lists import parse_text, get_patterns
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data')
+
+# lines covering the category variants and the date formats, for the golden check beyond the sample bulletins
+SYNTHETIC_LINES = [
+    'Hector Kobbekaduwa Agrarian Research and Training Institute', 'Data Management Division',
+    '(Wholesale Prices of Rice & Subsidiary Food Crops)', '', '24/02/2024', 'Item Pettah Marandagahamula', '',
+    'Rice (Rs/50kg)', 'Samba 1 235.00 - 240.00 237.00 - 240.00 - 245.00 242.00 -',
+    'Rice (Rs/50 kg)', 'Nadu 2 200.00 - 210.00 205.00 1.00',
+    'Imported Rice', 'Nadu (Imported) 180.00 - 190.00 185.00 -',
+    'Dried Chillies (Rs/Kg)', 'Dried Chillies (Imported) 1,100.00 - 1,200.00 1150.00',
+    'Onion (Rs/Kg)', 'Big Onion (Local) 120.00 - 130.00 125.00', 'Red Onion (Imported) 300.00 - 320.00 310.00',
+    'Potatoes (Rs/Kg)', 'Potatoes (N Eliya) 250.00 - 260.00 255.00',
+    'Pulses (Rs/Kg)', 'Dhal 300.00 - 310.00 305.00', 'Consumption Item(Rs/Kg)', 'Sugar 250.00 - 255.00 252.50',
+    'Eggs (Rs/Egg)', 'Egg (White) 40.00 - 42.00 41.00', '* Change compared to previous day',
+]
+
+def legacy_get_patterns():
+    possible_category_patterns = {
+        re.compile(r'^Rice \(Rs/kg\)|Imported Rice|Dried Chillies \(Rs/Kg\)|Onion \(Rs/Kg\)|Big Onion|Potatoes \(Rs/Kg\)|Pulses \(Rs/Kg\)|Consumption Item\(Rs/Kg\)|Eggs \(Rs/Egg\)'),
+        re.compile(r'^Rice \(Rs/50kg\)|Imported Rice|Dried Chillies \(Rs/Kg\)|Onion \(Rs/Kg\)|Big Onion|Potatoes \(Rs/Kg\)|Pulses \(Rs/Kg\)|Consumption Item\(Rs/Kg\)|Eggs \(Rs/Egg\)'),
+        re.compile(r'^Rice \(Rs/50 kg\)|Imported Rice|Dried Chillies \(Rs/Kg\)|Onion \(Rs/Kg\)|Big Onion|Potatoes \(Rs/Kg\)|Pulses \(Rs/Kg\)|Consumption Item\(Rs/Kg\)|Eggs \(Rs/Egg\)')
+    }
+    item_pattern = re.compile(r'^([a-zA-Z\s\(\)]*\d*)\s(\d+\.\d{2}\s-\s\d+\.\d{2})\s(\d+\.\d{2})')
+    return possible_category_patterns, item_pattern
+
+def legacy_extract_date(lines):
+    possible_date_patterns = {
+        r'\d{4}\.\d{2}\.\d{2}', r'\d{2}\.\d{2}\.\d{4}', r'\d{4}\-\d{2}\-\d{2}',
+        r'\d{2}\-\d{2}\-\d{4}', r'\d{4}\/\d{2}\/\d{2}', r'\d{2}\/\d{2}\/\d{4}'
+    }
+    for i in range(0,7):
+        date_line = lines[i]
+        for possible_date_pattern in possible_date_patterns:
+            date_match = re.search(possible_date_pattern, date_line)
+            if date_match: return date_match.group(0)
+    return None
+
+def legacy_parse_text(lines, possible_category_patterns, item_pattern):
+    """parse_text as it was before the single pass parser, the reference for the golden check"""
+    dates, categories, items, pettah_price_ranges, pettah_averages = [], [], [], [], []
+    current_category = None
+    date = legacy_extract_date(lines)
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+        for possible_category_pattern in possible_category_patterns:
+            category_match = possible_category_pattern.match(line)
+            if category_match:
+                current_category = category_match.group(0)
+                continue
+        if category_match: continue
+        item_match = item_pattern.match(line)
+        if item_match:
+            dates.append(date)
+            categories.append(current_category)
+            items.append(item_match.group(1).strip())
+            pettah_price_ranges.append(item_match.group(2))
+            pettah_averages.append(item_match.group(3))
+    return dates, categories, items, pettah_price_ranges, pettah_averages
+
+def time_parser(parser, patterns, sample_lines, repeats):
+    start = time.perf_counter()
+    for _ in range(repeats):
+        for lines in sample_lines:
+            parser(lines, *patterns)
+    return time.perf_counter() - start
+
+if __name__ == "__main__":
+    repeats = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    sample_lines = []
+    for pdf_path in sorted(glob.glob(os.path.join(DATA_DIR, '*.pdf'))):
+        with open(pdf_path, 'rb') as f:
+            sample_lines.append(extract_with_pdfplumber(f.read()).split('\n'))
+    sample_lines.append(SYNTHETIC_LINES)
+
+    for lines in sample_lines:
+        expected = legacy_parse_text(lines, *legacy_get_patterns())
+        assert parse_text(lines, *get_patterns()) == expected, f'rows differ from the earlier parser:\n{lines[:8]}'
+        assert len(expected[0]) > 0
+    print(f"golden check passed: identical rows for {len(sample_lines)} bulletin texts")
+
+    legacy_seconds = time_parser(legacy_parse_text, legacy_get_patterns(), sample_lines, repeats)
+    seconds = time_parser(parse_text, get_patterns(), sample_lines, repeats)
+    texts_parsed = repeats * len(sample_lines)
+    print(f"earlier parser:     {legacy_seconds / texts_parsed * 1e6:8.1f} us per bulletin")
+    print(f"single pass parser: {seconds / texts_parsed * 1e6:8.1f} us per bulletin (x{legacy_seconds / seconds:.2f})")
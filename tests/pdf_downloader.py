@@ -1,7 +1,8 @@
 import requests
 from bs4 import BeautifulSoup
 import os
-from configuration.configuration import pdf_output_directory, pdf_source_url
+from src.configuration.configuration import pdf_output_directory, pdf_source_url
+from src.pipeline1.text_extractor_all import download_pdf_as_bytes # goes through the local PDF cache
 
 def get_latest_pdf_link(pdf_source): 
     response = requests.get(pdf_source)
@@ -25,9 +26,9 @@ def download_pdf(pdf_url, output_dir, pdf_filename):
     output_path = os.path.join(output_dir, pdf_filename)
     
     # Download and save the PDF
-    response = requests.get(pdf_url)
+    pdf_bytes = download_pdf_as_bytes(pdf_url)
     with open(output_path, 'wb') as f:
-        f.write(response.content)
+        f.write(pdf_bytes.getvalue())
 
     print(f"PDF downloaded and saved to {output_path}")
 
@@ -0,0 +1,55 @@
+# Reads the sample bulletins in data/ through HTTP Range requests from a local range capable server and reports the
+# bytes fetched vs the file size per bulletin, checking the extracted text against the whole file.
+# Run from the repository root: python -m tests.range_reads [block size in bytes]
+import os
+import sys
+import asyncio
+from src.configuration.configuration import metadata_line1, RANGE_READ_BLOCK_SIZE
+from src.connector.range_reader import HttpRangeReader
+from src.pipeline1.extraction_executor import ExtractionExecutor, probe_and_extract_first_page_text
+from tests.local_pdf_server import DATA_DIR, RangeHandler, SlowHandler, start_server
+
+def read_bulletins(base_url, pdf_names, block_size):
+    """Returns {name: fetch stats}; asserts each range read extracts the same text as the whole file"""
+    fetch_stats = {}
+    for name in pdf_names:
+        with open(os.path.join(DATA_DIR, name), 'rb') as f:
+            expected_text = probe_and_extract_first_page_text(f.read(), metadata_line1)[0]
+        first_page_text, _, _, fetch_stats[name] = probe_and_extract_first_page_text(
+            HttpRangeReader(base_url + name, block_size=block_size), metadata_line1)
+        assert first_page_text == expected_text, f'{name}: range read extracted different text'
+    return fetch_stats
+
+async def read_in_pool(base_url, pdf_names):
+    # readers are pickled to the worker processes, which fetch the blocks they read themselves
+    with ExtractionExecutor(workers=1) as extraction_executor:
+        texts = await asyncio.gather(*(extraction_executor.extract_text_if_accepted(HttpRangeReader(base_url + name), metadata_line1)
+                                       for name in pdf_names))
+    return texts, extraction_executor.get_summary()
+
+if __name__ == "__main__":
+    block_size = int(sys.argv[1]) if len(sys.argv) > 1 else RANGE_READ_BLOCK_SIZE
+    pdf_names = sorted(name for name in os.listdir(DATA_DIR) if name.endswith('.pdf'))
+    server, base_url = start_server(handler_class=RangeHandler)
+
+    fetch_stats = read_bulletins(base_url, pdf_names, block_size)
+    for name, stats in fetch_stats.items():
+        print(f"{name}: fetched {stats['bytes_fetched']} of {stats['size']} bytes "
+              f"({stats['bytes_fetched'] / stats['size']:.0%}) in {stats['requests']} requests")
+    bytes_fetched = sum(stats['bytes_fetched'] for stats in fetch_stats.values())
+    total_size = sum(stats['size'] for stats in fetch_stats.values())
+    print(f"{len(pdf_names)} bulletins, block size {block_size}: fetched {bytes_fetched} of {total_size} bytes "
+          f"({bytes_fetched / total_size:.0%}), server sent {RangeHandler.bytes_sent}")
+
+    texts, summary = asyncio.run(read_in_pool(base_url, pdf_names))
+    assert all(text is not None for text in texts) and summary['bytes_fetched'] == bytes_fetched, summary
+    print(f"process pool: {summary['range_reads']} range reads, {summary['bytes_fetched']} bytes fetched")
+    server.shutdown()
+
+    # a server without Range support: one full download per bulletin
+    server, base_url = start_server(handler_class=SlowHandler)
+    fallback_stats = read_bulletins(base_url, pdf_names[:1], block_size)[pdf_names[0]]
+    assert not fallback_stats['ranges_supported'] and fallback_stats['bytes_fetched'] == fallback_stats['size']
+    print(f"no Range support: {fallback_stats}")
+    server.shutdown()
+    print("OK")
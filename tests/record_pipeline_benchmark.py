@@ -0,0 +1,58 @@
+# Compares the earlier parse_text -> create_dataframe -> transform_dataframe path with the typed PriceBatch path:
+# checks that both give the same csv and Cosmos DB documents, then reports time and peak traced memory per 1,000
+# bulletins over the sample PDFs in data/. Run from the repository root: python -m tests.record_pipeline_benchmark [bulletins]
+import os
+import sys
+import glob
+import time
+import tracemalloc
+from src.pipeline1.extraction_engines import extract_with_pdfplumber
+from src.pipeline1.text_to_lists import parse_text, get_patterns
+from src.pipeline1.lists_to_dataframe import create_dataframe
+from src.pipeline1.data_transformer import transform_dataframe
+from src.pipeline1.price_batch import parse_price_batch
+from src.pipeline1.data_format_converter import dataframe_to_csv_string, convert_dataframe_to_cosmos_format
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data')
+
+def list_path(lines):
+    return transform_dataframe(create_dataframe(*parse_text(lines, *get_patterns())))
+
+def batch_path(lines):
+    return parse_price_batch(lines).to_dataframe()
+
+def without_ids(documents):
+    return [{key: value for key, value in document.items() if key != 'id'} for document in documents]
+
+def measure(path, sample_lines, bulletins):
+    """Returns (seconds, peak traced bytes) for path over the given number of bulletins, keeping every result alive
+    like a run that holds all its DataFrames until they are written
+    """
+    tracemalloc.start()
+    start = time.perf_counter()
+    dataframes = [path(sample_lines[i % len(sample_lines)]) for i in range(bulletins)]
+    seconds = time.perf_counter() - start
+    _, peak_bytes = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del dataframes
+    return seconds, peak_bytes
+
+if __name__ == "__main__":
+    bulletins = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    sample_lines = []
+    for pdf_path in sorted(glob.glob(os.path.join(DATA_DIR, '*.pdf'))):
+        with open(pdf_path, 'rb') as f:
+            sample_lines.append(extract_with_pdfplumber(f.read()).split('\n'))
+
+    for lines in sample_lines:
+        expected, actual = list_path(lines), batch_path(lines)
+        assert dataframe_to_csv_string(actual) == dataframe_to_csv_string(expected), 'csv output differs'
+        assert without_ids(convert_dataframe_to_cosmos_format(actual)) == without_ids(convert_dataframe_to_cosmos_format(expected)), \
+            'Cosmos DB documents differ'
+    print(f"identical csv and Cosmos DB documents for {len(sample_lines)} sample bulletins")
+
+    scale = 1000 / bulletins
+    paths = (('lists + DataFrame copies', list_path), ('typed PriceBatch', batch_path), ('PriceBatch, no DataFrame', parse_price_batch))
+    for name, path in paths:
+        seconds, peak_bytes = measure(path, sample_lines, bulletins)
+        print(f"{name:25} {seconds * scale:7.2f}s and {peak_bytes * scale / 2**20:7.1f} MiB peak per 1,000 bulletins")
@@ -0,0 +1,56 @@
+# Runs a month of bulletins through the stage pipeline with per bulletin sink writes (flush_rows=1) and with coalesced
+# writes, against the in-memory blob container and Cosmos DB container, and compares the requests each needed.
+# The bulletins are the first page of data/daily_16-07-2024.pdf with the bulletin date changed.
+# Run from the repository root: python -m tests.sink_flush_benchmark [bulletins]
+import io
+import os
+import sys
+import time
+import asyncio
+from src.configuration.configuration import SINK_FLUSH_ROWS
+from src.connector.blob_store import AzureBlobStore
+from src.connector.blob_connector import BlobConnector
+from src.connector.cosmos_db import CosmosWriter
+from src.pipeline1.change_detection import RowHashIndex
+from src.pipeline1.extraction_executor import ExtractionExecutor
+from src.pipeline1.stages import PdfPipeline
+from src.pipeline1.text_extractor_all import extract_text_from_first_page
+from tests.fake_blob import FakeContainerClient
+from tests.fake_cosmos import FakeContainer
+
+SAMPLE_PDF = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data', 'daily_16-07-2024.pdf')
+
+async def run(first_page_text, bulletins, flush_rows):
+    container_client = FakeContainerClient()
+    cosmos_container = FakeContainer(latency=0.001)
+    blob_store = AzureBlobStore(blob_connector=BlobConnector(container_client=container_client))
+    completed = []
+
+    def fetch_pdf(pdf_link):
+        # page texts, as read from a page text artifact
+        return {1: first_page_text.replace('2024.07.16', f'2024.07.{int(pdf_link.rsplit("_", 1)[1]):02d}')}
+
+    with ExtractionExecutor(workers=0) as extraction_executor:
+        async with CosmosWriter(container=cosmos_container) as cosmos_writer:
+            pipeline = PdfPipeline(extraction_executor, cosmos_writer, blob_store, RowHashIndex(blob_store),
+                                   on_completed=completed.append, on_failed=print, fetch_pdf=fetch_pdf,
+                                   page_text_artifacts=False, flush_rows=flush_rows)
+            start = time.perf_counter()
+            await pipeline.run(f'bulletin_{day}' for day in range(1, bulletins + 1))
+            elapsed = time.perf_counter() - start
+    assert len(completed) == bulletins, completed
+    return container_client, cosmos_container, elapsed
+
+if __name__ == "__main__":
+    bulletins = int(sys.argv[1]) if len(sys.argv) > 1 else 30
+    with open(SAMPLE_PDF, 'rb') as f:
+        first_page_text = extract_text_from_first_page(io.BytesIO(f.read()))
+
+    results = {}
+    for flush_rows in (1, SINK_FLUSH_ROWS):
+        container_client, cosmos_container, elapsed = asyncio.run(run(first_page_text, bulletins, flush_rows))
+        results[flush_rows] = container_client.blobs['2024-7.csv'].data
+        print(f"flush_rows={flush_rows}: {container_client.requests} blob requests, {cosmos_container.requests} Cosmos DB "
+              f"requests, {len(cosmos_container.items)} documents, {elapsed:.2f}s")
+    assert sorted(results[1].splitlines()) == sorted(results[SINK_FLUSH_ROWS].splitlines()), 'different csv rows'
+    print("OK")
@@ -0,0 +1,143 @@
+# Measures the cold start of the function app: the import time of function_app (what the Functions host pays before the
+# timer callback runs) broken down per package with python -X importtime, and the import time of the pipeline modules
+# main imports once a run has work. Then runs main.run_main() in fresh interpreters against a local listing page for the
+# three kinds of no-op runs and checks that none of them loads pandas, the PDF libraries or the Cosmos DB SDK.
+# Fails when a heavy module is loaded by a no-op run, or when function_app takes longer than [max import ms] to import.
+# Run from the repository root: python -m tests.startup_benchmark [max import ms]
+import os
+import sys
+import json
+import tempfile
+import threading
+import subprocess
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# modules a run only needs once it has bulletins to process
+HEAVY_MODULES = ('pandas', 'numpy', 'pdfplumber', 'pdfminer', 'pypdfium2', 'PyPDF2', 'bs4', 'azure.cosmos', 'aiohttp')
+IMPORT_RUNS = 3
+LISTING_ETAG = '"listing-1"'
+LISTING_LINKS = ['/images/download/market_information/2024/daily_21-08-2024.pdf',
+                 '/images/download/market_information/2024/daily_20-08-2024.pdf']
+RESULT_MARKER = 'NO-OP RESULT '
+NO_OP_RUN = f'''
+import sys, json, time
+start = time.perf_counter()
+import main
+main.WEB_SOURCE = sys.argv[1]
+main.run_main()
+print({RESULT_MARKER!r} + json.dumps({{'seconds': time.perf_counter() - start,
+                                       'modules': [name for name in {HEAVY_MODULES!r} if name in sys.modules]}}))
+'''
+
+class ListingHandler(BaseHTTPRequestHandler):
+    """Serves a listing page with LISTING_LINKS, answering 304 to a matching If-None-Match when validators is set"""
+    validators = True
+
+    def do_GET(self):
+        if self.validators and self.headers.get('If-None-Match') == LISTING_ETAG:
+            self.send_response(304)
+            self.end_headers()
+            return
+        body = ''.join(f'<a href="{link}">bulletin</a>' for link in LISTING_LINKS).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/html')
+        self.send_header('Content-Length', str(len(body)))
+        if self.validators:
+            self.send_header('ETag', LISTING_ETAG)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+def get_package(module_name):
+    """Package an import is attributed to: the top level package, or the first two levels for namespaces (azure, src)"""
+    parts = module_name.split('.')
+    return '.'.join(parts[:2]) if parts[0] in ('azure', 'src') else parts[0]
+
+def import_time_breakdown(module_name):
+    """Returns (total seconds, {package: seconds}) of importing module_name in a fresh interpreter, from -X importtime.
+    Only the imports made by module_name count, not the ones of the interpreter startup.
+    """
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module_name}'], cwd=REPO_DIR,
+                            capture_output=True, text=True, check=True)
+    imports = []
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        imports.append((int(self_us), int(cumulative_us), name.rstrip()))
+    # -X importtime lists a module after the modules it imported: the imports of module_name are the lines after the
+    # previous top level import
+    end = max(i for i, (_, _, name) in enumerate(imports) if name.strip() == module_name and not name.startswith('  '))
+    start = max([i for i, (_, _, name) in enumerate(imports[:end]) if not name[1:].startswith(' ')], default=-1) + 1
+    packages = {}
+    for self_us, _, name in imports[start:end + 1]:
+        packages[get_package(name.strip())] = packages.get(get_package(name.strip()), 0) + self_us / 1e6
+    return imports[end][1] / 1e6, packages
+
+def median_import_time(module_name, runs=IMPORT_RUNS):
+    """import_time_breakdown of the run with the median total"""
+    breakdowns = sorted((import_time_breakdown(module_name) for _ in range(runs)), key=lambda breakdown: breakdown[0])
+    return breakdowns[len(breakdowns) // 2]
+
+def prepare_store(directory, scenario, base_url):
+    """Blob store state after an earlier run, for which the next run against the listing page is a no-op"""
+    from src.connector.blob_store import LocalBlobStore
+    from src.connector.blob import upload_listing_state
+    from src.connector.pdf_tracker import ProcessedPdfTracker
+    blob_store = LocalBlobStore(directory)
+    if scenario == 'listing not modified':
+        upload_listing_state(blob_store, {'etag': LISTING_ETAG, 'last_modified': None,
+                                          'newest_pdf_link': base_url + LISTING_LINKS[0].lstrip('/')})
+    elif scenario == 'newest link unchanged':
+        upload_listing_state(blob_store, {'newest_pdf_link': base_url + LISTING_LINKS[0].lstrip('/')})
+    else: # 'no new links': the listing changed, but every link on it is in the tracker already
+        processed_pdfs = ProcessedPdfTracker(blob_store)
+        for link in LISTING_LINKS:
+            processed_pdfs.add(base_url + link.lstrip('/'))
+        processed_pdfs.commit()
+
+def run_no_op(scenario):
+    """Runs main.run_main() in a fresh interpreter, returns (seconds from import main to the end, heavy modules loaded)"""
+    handler = type('Handler', (ListingHandler,), {'validators': scenario != 'newest link unchanged'})
+    server = ThreadingHTTPServer(('127.0.0.1', 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f'http://127.0.0.1:{server.server_address[1]}/'
+    try:
+        with tempfile.TemporaryDirectory() as directory:
+            prepare_store(directory, scenario, base_url)
+            env = dict(os.environ, BLOB_STORE_BACKEND='local', LOCAL_BLOB_STORE_DIR=directory, HEARTBEAT_URL='',
+                       PDF_CACHE_DIR='')
+            result = subprocess.run([sys.executable, '-c', NO_OP_RUN, base_url], cwd=REPO_DIR, env=env,
+                                    capture_output=True, text=True, check=True)
+            assert not any(name.startswith('log') for name in os.listdir(directory)), f'{scenario}: the run was not a no-op'
+    finally:
+        server.shutdown()
+    output = next(line for line in result.stdout.splitlines() if line.startswith(RESULT_MARKER))
+    no_op = json.loads(output[len(RESULT_MARKER):])
+    return no_op['seconds'], no_op['modules']
+
+if __name__ == "__main__":
+    max_import_ms = float(sys.argv[1]) if len(sys.argv) > 1 else None
+    total, packages = median_import_time('function_app')
+    print(f"import function_app: {total * 1000:.0f} ms (median of {IMPORT_RUNS})")
+    for package, seconds in sorted(packages.items(), key=lambda item: -item[1])[:12]:
+        print(f"  {package:32} {seconds * 1000:7.1f} ms")
+
+    pipeline_total, pipeline_packages = median_import_time('src.pipeline1.stages')
+    print(f"import src.pipeline1.stages (deferred until a run has work): {pipeline_total * 1000:.0f} ms")
+    for package, seconds in sorted(pipeline_packages.items(), key=lambda item: -item[1])[:8]:
+        print(f"  {package:32} {seconds * 1000:7.1f} ms")
+
+    failed = False
+    for scenario in ('listing not modified', 'newest link unchanged', 'no new links'):
+        seconds, modules = run_no_op(scenario)
+        print(f"no-op run, {scenario}: {seconds * 1000:.0f} ms, heavy modules loaded: {modules or 'none'}")
+        failed = failed or bool(modules)
+    if max_import_ms is not None and total * 1000 > max_import_ms:
+        print(f"import function_app took {total * 1000:.0f} ms, more than {max_import_ms:.0f} ms")
+        failed = True
+    print("FAILED" if failed else "OK")
+    sys.exit(1 if failed else 0)
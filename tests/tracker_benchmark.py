@@ -0,0 +1,33 @@
+# Compares bytes read at startup by the single file processed pdf tracker and the month sharded tracker,
+# using the sample tracker in research/ and the local blob store backend.
+# Run from the repository root: python -m tests.tracker_benchmark
+import os
+import time
+import tempfile
+from src.configuration.configuration import STATUS_FILE
+from src.connector.blob_store import LocalBlobStore
+from src.connector.pdf_tracker import ProcessedPdfTracker, parse_links
+
+SAMPLE_TRACKER = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'research', 'processed_pdfs.txt')
+
+if __name__ == "__main__":
+    with open(SAMPLE_TRACKER, 'rb') as f:
+        legacy_tracker = f.read()
+    listing_page_links = sorted(parse_links(legacy_tracker.decode('utf-8')), reverse=True)[:60]
+
+    with tempfile.TemporaryDirectory() as directory:
+        blob_store = LocalBlobStore(directory)
+        blob_store.write(STATUS_FILE, legacy_tracker)
+        ProcessedPdfTracker(blob_store).load([]) # one time migration into shards
+
+        blob_store.bytes_downloaded = 0
+        start = time.perf_counter()
+        legacy_links = parse_links(blob_store.read(STATUS_FILE).decode('utf-8'))
+        print(f"single file: {len(legacy_links)} links, {blob_store.bytes_downloaded} bytes read in {(time.perf_counter() - start) * 1000:.2f}ms")
+
+        blob_store.bytes_downloaded = 0
+        start = time.perf_counter()
+        tracker = ProcessedPdfTracker(blob_store)
+        tracker.load(listing_page_links)
+        assert all(pdf_link in tracker for pdf_link in listing_page_links)
+        print(f"sharded: {len(listing_page_links)} listing links, {blob_store.bytes_downloaded} bytes read in {(time.perf_counter() - start) * 1000:.2f}ms")